@@ -0,0 +1,218 @@
+"""
+adapters.py
+
+Parameter-efficient retraining helpers for retrain_model.py.
+
+Modes:
+- head: freeze embeddings and the lower transformer layers; train the top
+  --top-layers layers plus pre_classifier / classifier
+- lora: freeze every base weight; train low-rank adapters on the attention
+  q_lin / v_lin projections plus pre_classifier / classifier
+
+Only the trained tensors are saved (delta.pt + delta_config.json + the new
+config.json), so a delta is a few MB instead of a full model. merge_delta()
+folds a delta back into its base model and writes a regular HF model
+directory usable as MODEL_ID.
+
+Usage:
+    python adapters.py --base ./model --delta ./model/retrained-delta --output ./model/retrained
+"""
+
+import os
+import json
+import math
+import hashlib
+import argparse
+import torch
+from torch import nn
+
+DELTA_WEIGHTS_NAME = "delta.pt"
+DELTA_CONFIG_NAME = "delta_config.json"
+
+PEFT_MODES = ("head", "lora")
+HEAD_MODULES = ("pre_classifier", "classifier")
+
+# Defaults for the two modes
+TOP_LAYERS = 2
+LORA_RANK = 8
+LORA_ALPHA = 16
+LORA_DROPOUT = 0.1
+LORA_TARGETS = ("q_lin", "v_lin")
+
+
+class LoRALinear(nn.Module):
+    """Frozen nn.Linear plus a trainable low-rank update B @ A"""
+
+    def __init__(self, base, rank=LORA_RANK, alpha=LORA_ALPHA, dropout=LORA_DROPOUT):
+        super().__init__()
+        self.base = base
+        self.scaling = alpha / rank
+        self.dropout = nn.Dropout(dropout)
+        self.lora_A = nn.Parameter(torch.empty(rank, base.in_features))
+        self.lora_B = nn.Parameter(torch.zeros(base.out_features, rank))
+        nn.init.kaiming_uniform_(self.lora_A, a=math.sqrt(5))
+
+    def forward(self, x):
+        update = self.dropout(x) @ self.lora_A.t() @ self.lora_B.t()
+        return self.base(x) + update * self.scaling
+
+    def merged(self):
+        """Plain nn.Linear with the low-rank update folded into the weight"""
+        linear = nn.Linear(self.base.in_features, self.base.out_features, bias=self.base.bias is not None)
+        with torch.no_grad():
+            linear.weight.copy_(self.base.weight + (self.lora_B @ self.lora_A) * self.scaling)
+            if self.base.bias is not None:
+                linear.bias.copy_(self.base.bias)
+        return linear
+
+
+def add_lora(model, targets=LORA_TARGETS, rank=LORA_RANK, alpha=LORA_ALPHA, dropout=LORA_DROPOUT):
+    """Wrap the target attention projections of every layer in LoRALinear"""
+    for layer in model.distilbert.transformer.layer:
+        for name in targets:
+            setattr(layer.attention, name, LoRALinear(getattr(layer.attention, name), rank, alpha, dropout))
+    return model
+
+
+def merge_lora(model):
+    """Replace every LoRALinear in `model` with its merged nn.Linear"""
+    for layer in model.distilbert.transformer.layer:
+        for name, module in list(layer.attention.named_children()):
+            if isinstance(module, LoRALinear):
+                setattr(layer.attention, name, module.merged())
+    return model
+
+
+def prepare_model(model, mode, top_layers=TOP_LAYERS, **lora_kwargs):
+    """
+    Freeze `model` for a parameter-efficient mode
+
+    Returns:
+        (trainable, total) parameter counts
+    """
+    if mode not in PEFT_MODES:
+        raise ValueError(f"Unknown retraining mode '{mode}', expected one of {PEFT_MODES}")
+
+    if mode == "lora":
+        add_lora(model, **lora_kwargs)
+
+    for param in model.parameters():
+        param.requires_grad = False
+
+    trainable = [getattr(model, name) for name in HEAD_MODULES]
+    if mode == "head":
+        trainable.extend(model.distilbert.transformer.layer[-top_layers:] if top_layers else [])
+    for module in trainable:
+        for param in module.parameters():
+            param.requires_grad = True
+
+    if mode == "lora":
+        for name, param in model.named_parameters():
+            if "lora_" in name:
+                param.requires_grad = True
+
+    total = sum(p.numel() for p in model.parameters())
+    return sum(p.numel() for p in model.parameters() if p.requires_grad), total
+
+
+def base_fingerprint(model_dir):
+    """Hash of the base model's weight files, checked before merging"""
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(model_dir)):
+        # Weights only: training_args.bin and the like sit next to them
+        if name.startswith(("model", "pytorch_model")) and name.endswith((".safetensors", ".bin")):
+            with open(os.path.join(model_dir, name), "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def save_delta(model, output_dir, base_dir, mode, **details):
+    """Write the trainable tensors, config and delta metadata to `output_dir`"""
+    os.makedirs(output_dir, exist_ok=True)
+    delta = {
+        name: param.detach().cpu().clone()
+        for name, param in model.named_parameters()
+        if param.requires_grad
+    }
+    torch.save(delta, os.path.join(output_dir, DELTA_WEIGHTS_NAME))
+    model.config.save_pretrained(output_dir)
+
+    with open(os.path.join(output_dir, DELTA_CONFIG_NAME), "w") as f:
+        json.dump({
+            "mode": mode,
+            "base_model": base_dir,
+            "base_fingerprint": base_fingerprint(base_dir),
+            "tensors": len(delta),
+            "parameters": sum(t.numel() for t in delta.values()),
+            **details
+        }, f, indent=2)
+
+    return os.path.getsize(os.path.join(output_dir, DELTA_WEIGHTS_NAME))
+
+
+def merge_delta(base_dir, delta_dir, output_dir=None, strict_base=True):
+    """
+    Fold a delta into its base model
+
+    Args:
+        base_dir: Model directory the delta was trained from
+        delta_dir: Directory written by save_delta()
+        output_dir: Where to save the merged model (skipped when None)
+        strict_base: Refuse a base whose weights differ from the recorded one
+
+    Returns:
+        merged DistilBertForSequenceClassification
+    """
+    from transformers import DistilBertConfig, DistilBertForSequenceClassification, DistilBertTokenizerFast
+
+    with open(os.path.join(delta_dir, DELTA_CONFIG_NAME), "r") as f:
+        delta_config = json.load(f)
+    if strict_base and base_fingerprint(base_dir) != delta_config["base_fingerprint"]:
+        raise ValueError(f"{base_dir} is not the base model this delta was trained from")
+
+    config = DistilBertConfig.from_pretrained(delta_dir)
+    model = DistilBertForSequenceClassification.from_pretrained(
+        base_dir, config=config, ignore_mismatched_sizes=True
+    )
+    if delta_config["mode"] == "lora":
+        add_lora(
+            model,
+            targets=tuple(delta_config["lora_targets"]),
+            rank=delta_config["lora_rank"],
+            alpha=delta_config["lora_alpha"]
+        )
+
+    delta = torch.load(os.path.join(delta_dir, DELTA_WEIGHTS_NAME), map_location="cpu")
+    missing = set(delta) - set(dict(model.named_parameters()))
+    if missing:
+        raise ValueError(f"Delta tensors not found in the base model: {sorted(missing)[:5]}")
+    model.load_state_dict(delta, strict=False)
+
+    if delta_config["mode"] == "lora":
+        merge_lora(model)
+    model.eval()
+
+    if output_dir:
+        model.save_pretrained(output_dir)
+        DistilBertTokenizerFast.from_pretrained(base_dir).save_pretrained(output_dir)
+
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--base', type=str, default="./model", help='Base model directory')
+    parser.add_argument('--delta', type=str, default="./model/retrained-delta", help='Delta directory')
+    parser.add_argument('--output', type=str, default="./model/retrained", help='Merged model directory')
+    parser.add_argument('--ignore-base-mismatch', action='store_true',
+                        help='Merge even if the base weights changed since training')
+    args = parser.parse_args()
+
+    print(f"🔗 Merging {args.delta} into {args.base}...")
+    merge_delta(args.base, args.delta, args.output, strict_base=not args.ignore_base_mismatch)
+    print(f"✅ Merged model saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
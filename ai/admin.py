@@ -0,0 +1,360 @@
+# ai/admin.py
+"""
+Admin routes shared by api.py and app.py: hot model reload, rollback and
+shadow scoring of a candidate model.
+
+A reload loads and warms the new model on a background thread while the
+current one keeps serving, then swaps it in between batches (see
+predict.activate). Set MODEL_POINTER_FILE to a file holding a model
+directory path and every server process, including each serve.py worker,
+reloads whenever the path or its contents change (SIGHUP checks at once).
+A model still held for rollback is swapped back in instead of reloaded.
+
+Under serve.py a request reaches a single worker, so reload and rollback
+write the pointer file and have the parent send SIGHUP to every worker;
+they answer 202 before the workers have switched. A rollback is written as
+a "rollback:<version>" entry, so each worker swaps back its own kept copy
+of that version (a worker started since reloads the recorded path). Shadow scoring cannot be
+started, stopped or promoted at runtime there (use SHADOW_MODEL_ID), and
+GET routes describe only the worker that answered.
+
+POST /admin/profile captures a sampling or torch.profiler profile of the
+running server (see profiling.py); SIGUSR1 does the same without a request.
+
+All routes require the X-Admin-Token header to match ADMIN_TOKEN; without
+ADMIN_TOKEN they are disabled.
+"""
+import os
+import time
+import signal
+import threading
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from fastapi.responses import FileResponse
+from pydantic import BaseModel
+import predict
+import profiling
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+MODEL_POINTER_FILE = os.getenv("MODEL_POINTER_FILE")
+MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", "5"))
+
+# Candidate shadow scored from startup, e.g. a freshly retrained model
+SHADOW_MODEL_ID = os.getenv("SHADOW_MODEL_ID")
+
+# Set by serve.py before forking: swaps must then reach every worker
+SERVE_PARENT_PID = None
+
+# Pointer entry "rollback:<version>\n<model dir>" asks for a kept version
+ROLLBACK_POINTER = "rollback:"
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_TOKEN is not set)")
+    if x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+
+# -----------------------------------------
+# Background reload
+# -----------------------------------------
+_reload_lock = threading.Lock()
+reload_status = {"state": "idle"}
+
+
+def _rollback_to(entry):
+    """Swap in the version a rollback pointer entry names"""
+    version, _, model_id = entry[len(ROLLBACK_POINTER):].partition("\n")
+    if predict.active.revision == version:
+        return predict.active
+    try:
+        return predict.rollback(version)
+    except ValueError:
+        # Workers started after the swap have no history; load the files
+        loaded = predict.reload_model(model_id)
+        if loaded.revision != version:
+            print(f"⚠️ Version {version} is no longer on disk at {model_id}, serving {loaded.revision}")
+        return loaded
+
+
+def _reload(model_id, backend, shadow=False, sample_rate=None):
+    try:
+        if model_id and model_id.startswith(ROLLBACK_POINTER):
+            loaded = _rollback_to(model_id)
+            reload_status.update(state="idle", version=loaded.revision, finished_at=time.time(), error=None)
+            print(f"⏪ Now serving model {loaded.revision} from {loaded.model_id}")
+            return
+        if shadow:
+            scorer = predict.start_shadow(model_id, backend, sample_rate)
+            reload_status.update(state="idle", shadow=scorer.candidate.revision, finished_at=time.time(), error=None)
+            print(f"👥 Shadow scoring model {scorer.candidate.revision} from {model_id}")
+            return
+        kept = predict.find_kept(model_id) if model_id and backend is None else None
+        if kept is not None:
+            loaded = predict.rollback(kept.revision)
+        else:
+            loaded = predict.reload_model(model_id, backend)
+        reload_status.update(state="idle", version=loaded.revision, finished_at=time.time(), error=None)
+        print(f"🔄 Now serving model {loaded.revision} from {loaded.model_id}")
+    except Exception as e:
+        reload_status.update(state="failed", finished_at=time.time(), error=str(e))
+        print(f"❌ Model reload failed, still serving {predict.active.revision}: {e}")
+    finally:
+        _reload_lock.release()
+
+
+def start_reload(model_id=None, backend=None, shadow=False, sample_rate=None):
+    """
+    Start loading a model in the background; False if one is already loading
+
+    With shadow=True the model becomes the shadow candidate instead of
+    replacing the active model.
+    """
+    if not _reload_lock.acquire(blocking=False):
+        return False
+    reload_status.clear()
+    reload_status.update(
+        state="loading", model_id=model_id, backend=backend, shadow=shadow, started_at=time.time()
+    )
+    threading.Thread(
+        target=_reload, args=(model_id, backend, shadow, sample_rate), name="model-reload", daemon=True
+    ).start()
+    return True
+
+
+def read_pointer():
+    """(path or rollback entry, fingerprint) the pointer file names, or None"""
+    try:
+        with open(MODEL_POINTER_FILE, "r") as f:
+            path = f.read().strip()
+    except OSError:
+        return None
+    if not path:
+        return None
+    if not path.startswith(ROLLBACK_POINTER) and os.path.isdir(path):
+        stamp = tuple(sorted((e.name, e.stat().st_mtime_ns, e.stat().st_size) for e in os.scandir(path) if e.is_file()))
+    else:
+        stamp = None
+    return path, stamp
+
+
+def write_pointer(model_id):
+    """Atomically point MODEL_POINTER_FILE at `model_id`"""
+    staging = f"{MODEL_POINTER_FILE}.{os.getpid()}.tmp"
+    with open(staging, "w") as f:
+        f.write(str(model_id) + "\n")
+    os.replace(staging, MODEL_POINTER_FILE)
+
+
+def broadcast(model_id):
+    """Make every serve.py worker switch to `model_id` (or a rollback entry) via the pointer file"""
+    write_pointer(model_id)
+    os.kill(SERVE_PARENT_PID, signal.SIGHUP)
+
+
+def rollback_pointer(loaded):
+    return f"{ROLLBACK_POINTER}{loaded.revision}\n{loaded.model_id}"
+
+
+def _serving(pointed):
+    """True if the active model is what the pointer entry names"""
+    target = pointed[0]
+    if target.startswith(ROLLBACK_POINTER):
+        return target[len(ROLLBACK_POINTER):].partition("\n")[0] == predict.active.revision
+    return os.path.abspath(target) == os.path.abspath(str(predict.active.model_id))
+
+
+def watch_pointer(stop, last):
+    while True:
+        _watch_wake.wait(MODEL_WATCH_INTERVAL)
+        _watch_wake.clear()
+        if stop.is_set():
+            return
+        current = read_pointer()
+        if current is None or current == last:
+            continue
+        if start_reload(current[0]):
+            last = current
+
+
+_watch_stop = threading.Event()
+_watch_wake = threading.Event()
+
+
+def startup():
+    """
+    Start background model management; call once per serving process
+
+    Follows MODEL_POINTER_FILE and starts shadow scoring SHADOW_MODEL_ID,
+    when those are set, and lets SIGUSR1 start a sampling profile and
+    SIGHUP re-read the pointer file.
+    """
+    profiling.install_signal_handler()
+    if SHADOW_MODEL_ID:
+        start_reload(SHADOW_MODEL_ID, shadow=True)
+    if not MODEL_POINTER_FILE:
+        return
+    if threading.current_thread() is threading.main_thread() and hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, lambda signum, frame: _watch_wake.set())
+    pointed = read_pointer()
+    if pointed is not None and not _serving(pointed):
+        # Leave it to the watcher to retry if another load is already running
+        if not start_reload(pointed[0]):
+            pointed = None
+    _watch_stop.clear()
+    threading.Thread(target=watch_pointer, args=(_watch_stop, pointed), name="model-watcher", daemon=True).start()
+
+
+def shutdown():
+    _watch_stop.set()
+    _watch_wake.set()
+    predict.stop_shadow()
+
+
+def refuse_under_serve():
+    if SERVE_PARENT_PID is not None:
+        raise HTTPException(
+            status_code=409,
+            detail="Shadow scoring cannot be changed at runtime under serve.py; set SHADOW_MODEL_ID and restart"
+        )
+
+
+# -----------------------------------------
+# Routes
+# -----------------------------------------
+class ReloadRequest(BaseModel):
+    model_id: Optional[str] = None
+    backend: Optional[str] = None
+
+
+class RollbackRequest(BaseModel):
+    version: Optional[str] = None
+
+
+class ShadowRequest(BaseModel):
+    model_id: str
+    backend: Optional[str] = None
+    sample_rate: Optional[float] = None
+
+
+class ProfileRequest(BaseModel):
+    mode: str = "sampling"
+    seconds: Optional[float] = None
+    requests: Optional[int] = None
+
+
+@router.get("/models")
+def models():
+    return {**predict.model_versions(), "reload": dict(reload_status)}
+
+
+@router.post("/reload", status_code=202)
+def reload(req: ReloadRequest):
+    """Load `model_id` (default: the configured model) and swap it in when warm"""
+    if SERVE_PARENT_PID is not None:
+        if req.backend is not None:
+            raise HTTPException(status_code=409, detail="Switching backends is not supported under serve.py")
+        model_id = req.model_id or predict.MODEL_ID
+        broadcast(model_id)
+        return {"broadcast": {"model_id": model_id, "pointer": MODEL_POINTER_FILE}}
+    if not start_reload(req.model_id, req.backend):
+        raise HTTPException(status_code=409, detail="A model reload is already in progress")
+    return {"reload": dict(reload_status)}
+
+
+@router.post("/rollback")
+def rollback(req: RollbackRequest, response: Response):
+    """Swap back to a model still held in memory"""
+    if SERVE_PARENT_PID is not None:
+        try:
+            kept = predict.kept_model(req.version)
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        # Every worker swaps back its own kept copy of this version; the
+        # path alone would not change the pointer when it was retrained in place
+        broadcast(rollback_pointer(kept))
+        response.status_code = 202
+        return {"broadcast": {"model_id": str(kept.model_id), "version": kept.revision, "pointer": MODEL_POINTER_FILE}}
+    try:
+        restored = predict.rollback(req.version)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"active": restored.describe()}
+
+
+@router.get("/shadow")
+def shadow_stats():
+    """Agreement, confidence shift, per-class disagreement and latency of the candidate"""
+    scorer = predict.shadow
+    if scorer is None:
+        raise HTTPException(status_code=404, detail="No shadow candidate loaded")
+    return {"active": predict.active.describe(), "shadow": scorer.stats()}
+
+
+@router.post("/shadow", status_code=202)
+def shadow_start(req: ShadowRequest):
+    """Load `model_id` in the background and shadow score it on live traffic"""
+    refuse_under_serve()
+    if req.sample_rate is not None and not 0.0 <= req.sample_rate <= 1.0:
+        raise HTTPException(status_code=422, detail="sample_rate must be between 0 and 1")
+    if not start_reload(req.model_id, req.backend, shadow=True, sample_rate=req.sample_rate):
+        raise HTTPException(status_code=409, detail="A model reload is already in progress")
+    return {"reload": dict(reload_status)}
+
+
+@router.delete("/shadow")
+def shadow_stop():
+    refuse_under_serve()
+    final = predict.stop_shadow()
+    if final is None:
+        raise HTTPException(status_code=404, detail="No shadow candidate loaded")
+    return {"shadow": final}
+
+
+@router.post("/shadow/promote")
+def shadow_promote():
+    """Swap the already warm candidate in as the active model"""
+    refuse_under_serve()
+    try:
+        promoted = predict.promote_shadow()
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"active": promoted.describe()}
+
+
+@router.post("/profile", status_code=202)
+def profile_start(req: ProfileRequest):
+    """Profile the next `seconds` seconds or `requests` requests, whichever ends first"""
+    if req.seconds is not None and req.seconds <= 0:
+        raise HTTPException(status_code=422, detail="seconds must be positive")
+    if req.requests is not None and req.requests <= 0:
+        raise HTTPException(status_code=422, detail="requests must be positive")
+    try:
+        capture = profiling.start(req.mode, req.seconds, req.requests)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"profile": capture.describe()}
+
+
+@router.get("/profile")
+def profile_status():
+    capture = profiling.current
+    return {
+        "current": capture.describe() if capture is not None else None,
+        "recent": list(profiling.recent)
+    }
+
+
+@router.get("/profile/{name}")
+def profile_download(name: str):
+    """Download a finished capture by file name"""
+    path = os.path.join(profiling.PROFILE_DIR, os.path.basename(name))
+    if not name.startswith("profile-") or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail=f"No profile named {name}")
+    return FileResponse(path, filename=os.path.basename(path))
@@ -1,52 +1,130 @@
 # ai/api.py
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from transformers import DistilBertForSequenceClassification, DistilBertTokenizerFast
-from huggingface_hub import login
+from typing import Optional
 import os
+import math
+import time
 import uvicorn
 from dotenv import load_dotenv
-import torch
-import torch.nn.functional as F
+import asyncio
+from collections import Counter
+from batcher import MicroBatcher, QueueFull, DeadlineExceeded
+from admin import router as admin_router, startup as admin_startup, shutdown as admin_shutdown
+import metrics
+from profiling import ProfilingMiddleware
+from predict import predict_batch, fast_prediction, cache_stats as prediction_cache_stats, label2id
 
 load_dotenv()
 
-# HuggingFace login
-login(os.getenv("HF_TOKEN"))
-MODEL_ID = os.getenv("MODEL_ID")
+# Micro-batching: concurrent /predict calls share one padded forward pass
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "32"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))
 
-tokenizer = DistilBertTokenizerFast.from_pretrained(
-    MODEL_ID,
-    token=os.getenv("HF_TOKEN")
+# Admission control: remarks allowed to wait for the batcher before /predict
+# answers 429, and the deadline applied when a request sends no
+# X-Request-Timeout-Ms header (0 = none)
+BATCH_MAX_QUEUE = int(os.getenv("BATCH_MAX_QUEUE", "256"))
+REQUEST_TIMEOUT_MS = float(os.getenv("REQUEST_TIMEOUT_MS", "0"))
+
+
+def to_response(result):
+    label = label2id[result["category"]]
+    return {
+        "prediction": label,
+        "label": label,
+        "confidence": result["confidence"],
+        "model_version": result["model_version"],
+        "exit_layer": result["exit_layer"]
+    }
+
+
+def classify_batch(texts):
+    return [to_response(result) for result in predict_batch(texts)]
+
+
+batcher = MicroBatcher(
+    classify_batch,
+    max_batch_size=BATCH_MAX_SIZE,
+    max_wait_ms=BATCH_MAX_WAIT_MS,
+    max_queue=BATCH_MAX_QUEUE
 )
 
-model = DistilBertForSequenceClassification.from_pretrained(
-    MODEL_ID,
-    token=os.getenv("HF_TOKEN")
+# Requests answered without inference because of load, by reason
+shed = Counter()
+
+metrics.Callback(
+    "finpal_batcher_queue_depth",
+    "Remarks waiting for the micro-batcher",
+    batcher.depth
 )
+metrics.Callback(
+    "finpal_requests_shed_total",
+    "Requests refused or dropped under load (queue_full, deadline_unreachable, deadline_expired)",
+    lambda: {(reason,): count for reason, count in shed.items()},
+    kind="counter", labelnames=("reason",)
+)
+
+
+def shed_response(status_code, reason, detail, retry_after=None):
+    shed[reason] += 1
+    headers = {"Retry-After": str(max(1, math.ceil(retry_after)))} if retry_after is not None else None
+    return JSONResponse(status_code=status_code, content={"detail": detail}, headers=headers)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    batcher.start()
+    admin_startup()
+    yield
+    admin_shutdown()
+    batcher.stop()
 
-model.eval()
 
 # FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, default_response_class=metrics.TimedJSONResponse)
+app.include_router(admin_router)
+metrics.install(app)
+app.add_middleware(ProfilingMiddleware)
 
 class TextRequest(BaseModel):
     text: str
 
 @app.post("/predict")
-def predict(req: TextRequest):
-    inputs = tokenizer(req.text, return_tensors="pt", truncation=True, padding=True)
-    with torch.no_grad():
-        outputs = model(**inputs)
-        probs = F.softmax(outputs.logits, dim=-1)
+async def predict(req: TextRequest, x_request_timeout_ms: Optional[float] = Header(None)):
+    # An explicit budget of 0 or less has already run out
+    if x_request_timeout_ms is not None and x_request_timeout_ms <= 0:
+        return shed_response(504, "deadline_expired", "Request deadline passed before inference")
 
-    label = int(probs.argmax(dim=-1))
-    confidence = float(probs.max())
+    # Keyword-index and cached remarks skip the batching window entirely
+    fast = fast_prediction(req.text)
+    if fast is not None:
+        return to_response(fast)
+
+    timeout = (x_request_timeout_ms if x_request_timeout_ms is not None else REQUEST_TIMEOUT_MS) / 1000
+    deadline = time.monotonic() + timeout if timeout > 0 else None
+    if deadline is not None:
+        # Refuse up front what the current backlog cannot finish in time
+        wait = batcher.estimated_wait()
+        if wait > timeout:
+            return shed_response(503, "deadline_unreachable", "Server cannot answer within the request deadline", wait)
+
+    try:
+        future = batcher.submit(req.text, deadline)
+    except QueueFull as e:
+        return shed_response(429, "queue_full", "Inference queue is full", e.retry_after)
+
+    try:
+        return await asyncio.wrap_future(future)
+    except DeadlineExceeded:
+        return shed_response(504, "deadline_expired", "Request deadline passed before inference")
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    return prediction_cache_stats()
 
-    return {
-    "prediction": label,
-    "label": label,
-    "confidence": confidence
-}
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -1,10 +1,32 @@
 #ai/app.py
-from fastapi import FastAPI
+import os
+import json
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List
-from predict import predict, predict_batch
+from predict import predict, predict_batch, cache_stats as prediction_cache_stats
+from admin import router as admin_router, startup as admin_startup, shutdown as admin_shutdown
+import metrics
+from profiling import ProfilingMiddleware
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app):
+    admin_startup()
+    yield
+    admin_shutdown()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=metrics.TimedJSONResponse)
+app.include_router(admin_router)
+metrics.install(app)
+app.add_middleware(ProfilingMiddleware)
+
+# Records classified per forward pass on the streaming endpoint
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "64"))
 
 class PredictRequest(BaseModel):
     text: str
@@ -17,7 +39,9 @@ def single(req: PredictRequest):
     result = predict(req.text)
     return {
         "prediction": result["category"],
-        "confidence": result["confidence"]
+        "confidence": result["confidence"],
+        "model_version": result["model_version"],
+        "exit_layer": result["exit_layer"]
     }
 
 @app.post("/batch-predict")
@@ -28,7 +52,95 @@ def batch(req: BatchRequest):
     return [
         {
             "prediction": r["category"],
-            "confidence": r["confidence"]
+            "confidence": r["confidence"],
+            "model_version": r["model_version"],
+            "exit_layer": r["exit_layer"]
         }
         for r in results
     ]
+
+@app.get("/cache/stats")
+def cache_stats():
+    return prediction_cache_stats()
+
+
+class NDJSONStreamingResponse(StreamingResponse):
+    """
+    Streaming response that does not listen for client disconnects
+
+    The default StreamingResponse consumes `receive()` to detect disconnects,
+    which would swallow the request body chunks the endpoint is still
+    reading while results are already being sent.
+    """
+    media_type = "application/x-ndjson"
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+
+async def read_lines(request):
+    """Yield non-empty lines of the request body as they arrive"""
+    pending = b""
+    async for chunk in request.stream():
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if pending.strip():
+        yield pending
+
+
+def classify_records(lines):
+    """Classify a batch of `{id, text}` lines and render NDJSON result lines"""
+    parsed = []
+    for line in lines:
+        record_id = None
+        try:
+            record = json.loads(line)
+            # Read the id first so an error can still be matched to its record
+            record_id = record.get("id")
+            parsed.append((record_id, str(record["text"]), None))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            parsed.append((record_id, None, f"invalid record: {e}"))
+
+    results = iter(predict_batch([text for _, text, error in parsed if error is None]))
+
+    output = []
+    for record_id, _, error in parsed:
+        if error is not None:
+            output.append({"id": record_id, "error": error})
+            continue
+        r = next(results)
+        output.append({
+            "id": record_id,
+            "prediction": r["category"],
+            "confidence": r["confidence"],
+            "model_version": r["model_version"],
+            "exit_layer": r["exit_layer"]
+        })
+
+    with metrics.STAGE_SECONDS.time("serialize"):
+        return "".join(json.dumps(item) + "\n" for item in output)
+
+
+async def stream_predictions(request):
+    batch = []
+    async for line in read_lines(request):
+        batch.append(line)
+        if len(batch) >= STREAM_BATCH_SIZE:
+            yield await run_in_threadpool(classify_records, batch)
+            batch = []
+    if batch:
+        yield await run_in_threadpool(classify_records, batch)
+
+
+@app.post("/batch-predict/stream")
+async def batch_stream(request: Request):
+    """
+    Classify newline-delimited `{"id": ..., "text": ...}` records
+
+    Results are streamed back as NDJSON, one batch at a time, while the
+    rest of the request body is still being read.
+    """
+    return NDJSONStreamingResponse(stream_predictions(request))
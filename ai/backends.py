@@ -0,0 +1,88 @@
+# ai/backends.py
+"""
+Inference backends for the transaction classifier.
+
+Every backend takes padded `input_ids` / `attention_mask` tensors produced by
+the DistilBERT tokenizer and returns a CPU tensor of logits, so the rest of
+the prediction pipeline (softmax, ranking, caching) is backend agnostic.
+"""
+import os
+import torch
+from transformers import DistilBertConfig, DistilBertForSequenceClassification
+
+BACKENDS = ("torch", "onnx")
+ONNX_FILE_NAME = "model.onnx"
+QUANTIZED_WEIGHTS_NAME = "pytorch_model_int8.pt"
+
+
+def is_quantized_model_dir(model_dir):
+    return os.path.isfile(os.path.join(model_dir, QUANTIZED_WEIGHTS_NAME))
+
+
+def quantize_dynamic_int8(model):
+    """Dynamic int8 quantization of every Linear layer (CPU only)"""
+    return torch.ao.quantization.quantize_dynamic(
+        model, {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
+def load_quantized_model(model_dir):
+    """Rebuild a dynamically quantized classifier saved by quantize.py"""
+    config = DistilBertConfig.from_pretrained(model_dir)
+    model = DistilBertForSequenceClassification(config)
+    model.eval()
+
+    model = quantize_dynamic_int8(model)
+    state_dict = torch.load(os.path.join(model_dir, QUANTIZED_WEIGHTS_NAME))
+    model.load_state_dict(state_dict)
+    return model
+
+
+class TorchBackend:
+    """Eager PyTorch model"""
+
+    name = "torch"
+
+    def __init__(self, model, device):
+        self.model = model
+        self.device = device
+        self.config = model.config
+
+    def logits(self, input_ids, attention_mask):
+        with torch.no_grad():
+            outputs = self.model(
+                input_ids=input_ids.to(self.device),
+                attention_mask=attention_mask.to(self.device)
+            )
+        return outputs.logits.cpu()
+
+
+class OnnxBackend:
+    """ONNX Runtime session over a model exported by export_onnx.py"""
+
+    name = "onnx"
+
+    def __init__(self, model_dir, file_name=ONNX_FILE_NAME, num_threads=0):
+        # Imported lazily so the torch backend does not need onnxruntime
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = num_threads
+
+        self.path = os.path.join(model_dir, file_name)
+        self.session = ort.InferenceSession(
+            self.path,
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def logits(self, input_ids, attention_mask):
+        feeds = {
+            "input_ids": input_ids.numpy(),
+            "attention_mask": attention_mask.numpy()
+        }
+        feeds = {name: value for name, value in feeds.items() if name in self.input_names}
+        (logits,) = self.session.run(["logits"], feeds)
+        return torch.from_numpy(logits)
@@ -0,0 +1,161 @@
+# ai/batcher.py
+"""
+Server-side micro-batching for single-remark inference requests.
+
+Requests submitted concurrently are gathered for up to `max_wait_ms`, or
+until `max_batch_size` of them are queued, and classified with one padded
+forward pass. Each caller receives its own result through a
+`concurrent.futures.Future`, so the batcher can be awaited from async
+handlers (`asyncio.wrap_future`) or blocked on from plain threads.
+
+With `max_queue`, submit() refuses new texts once that many are waiting
+instead of letting the backlog grow without bound. A text submitted with a
+deadline is dropped, not computed, if the deadline passes while it waits.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+_STOP = object()
+
+# Weight of the latest batch in the moving average of batch run time
+_EWMA_ALPHA = 0.2
+
+
+class QueueFull(Exception):
+    """Raised by submit() when `max_queue` texts are already waiting"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Inference queue is full, retry in {retry_after:.2f}s")
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """Set on a future whose deadline passed before its batch ran"""
+
+
+class MicroBatcher:
+    """Collects single texts into batches and runs them on one worker thread"""
+
+    def __init__(self, run_batch, max_batch_size=32, max_wait_ms=5.0, max_queue=0):
+        """
+        Args:
+            run_batch: Callable taking a list of texts and returning a list
+                of results in the same order
+            max_batch_size: Largest number of texts run in one forward pass
+            max_wait_ms: How long the first queued text may wait for others
+            max_queue: Most texts waiting at once; 0 for no limit
+        """
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_queue = max(0, int(max_queue))
+        self._queue = queue.Queue()
+        self._admit_lock = threading.Lock()
+        self._thread = None
+        self.batch_seconds = None
+        self.rejected = 0
+        self.expired = 0
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(
+            target=self._loop, name="micro-batcher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def depth(self):
+        """Texts waiting to be collected into a batch"""
+        return self._queue.qsize()
+
+    def estimated_wait(self, extra=1):
+        """Seconds until `extra` more texts would be answered, from recent batch times"""
+        if self.batch_seconds is None:
+            return 0.0
+        batches = -(-(self.depth() + extra) // self.max_batch_size)
+        return batches * (self.batch_seconds + self.max_wait)
+
+    def submit(self, text, deadline=None):
+        """
+        Queue one text and return a Future resolving to its result
+
+        Args:
+            text: Text to classify
+            deadline: time.monotonic() after which the text is not worth
+                computing; its future then fails with DeadlineExceeded
+
+        Raises:
+            QueueFull: `max_queue` texts are already waiting
+        """
+        future = Future()
+        with self._admit_lock:
+            if self.max_queue and self._queue.qsize() >= self.max_queue:
+                self.rejected += 1
+                raise QueueFull(self.estimated_wait())
+            self._queue.put((text, future, deadline))
+        return future
+
+    def _collect(self):
+        """Block for the first item, then gather more until full or timed out"""
+        first = self._queue.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                # Drain whatever is already queued without waiting
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+
+            now = time.monotonic()
+            live = []
+            for text, fut, deadline in batch:
+                if not fut.set_running_or_notify_cancel():
+                    continue
+                if deadline is not None and now >= deadline:
+                    self.expired += 1
+                    fut.set_exception(DeadlineExceeded())
+                    continue
+                live.append((text, fut))
+            if not live:
+                continue
+
+            start = time.perf_counter()
+            try:
+                results = self.run_batch([text for text, _ in live])
+            except Exception as e:
+                for _, fut in live:
+                    fut.set_exception(e)
+                continue
+            elapsed = time.perf_counter() - start
+            self.batch_seconds = elapsed if self.batch_seconds is None else (
+                _EWMA_ALPHA * elapsed + (1 - _EWMA_ALPHA) * self.batch_seconds
+            )
+
+            for (_, fut), result in zip(live, results):
+                fut.set_result(result)
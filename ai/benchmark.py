@@ -0,0 +1,543 @@
+"""
+benchmark.py
+
+Reproducible inference benchmark for the serving stack.
+This script:
+1. Builds a fixed corpus of remarks from data/train.csv, plus synthetic
+   variants of it with other lengths (in words) and duplicate rates
+2. Runs it through one or more targets, all in process:
+   - predict: predict() per remark, or predict_batch() per --batch-sizes chunk
+   - api: POST /predict of ai/api.py (one remark per request, micro-batched)
+   - batch: POST /batch-predict of ai/app.py (--batch-sizes remarks per request)
+3. Sweeps batch size, max sequence length, torch threads, concurrency and,
+   for a model with early-exit heads, the exit confidence threshold
+4. Reports p50/p95/p99 latency, throughput and peak RSS per run as JSON,
+   with accuracy against the CSV labels for native-length corpora and the
+   layers run / compute saved by early exit
+5. Optionally compares against a saved baseline and exits with status 1
+   if any run regressed by more than the tolerance
+
+The prediction cache is cleared before every run and the on-disk prediction
+store is not used, so runs do not depend on earlier ones. Duplicates inside
+a corpus still hit the in-batch dedup and the cache, as in production.
+
+Usage:
+    python benchmark.py --output bench.json
+    python benchmark.py --targets predict,batch --batch-sizes 1,32 --threads 1,4 \\
+        --lengths native,48 --duplicate-rates 0,0.5 --baseline bench.json --tolerance 0.1
+    python benchmark.py --targets predict --model-only --exit-thresholds 0.7,0.9,0.99,1
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import torch
+from dotenv import load_dotenv
+import predict
+from progress import peak_rss_mb
+
+load_dotenv()
+
+DATA_PATH = "data/train.csv"
+CORPUS_SIZE = 256
+CORPUS_SEED = 42
+WARMUP_REMARKS = 16
+
+# Default sweep; every combination is one run
+TARGETS = ("predict", "api", "batch")
+BATCH_SIZES = (1, 32)
+MAX_LENGTHS = (predict.MAX_LENGTH,)
+THREADS = (torch.get_num_threads(),)
+CONCURRENCY = (1, 4)
+LENGTHS = ("native",)
+DUPLICATE_RATES = (0.0,)
+EXIT_THRESHOLDS = (None,)  # None keeps the model's own threshold
+
+# Allowed relative change before a run counts as a regression
+TOLERANCE = 0.10
+RSS_TOLERANCE = 0.10
+
+RUN_KEYS = ("target", "length", "duplicate_rate", "batch_size", "max_length", "threads", "concurrency", "exit_threshold")
+
+
+# -----------------------------------------
+# Corpus
+# -----------------------------------------
+def load_remarks(path=DATA_PATH):
+    remarks = pd.read_csv(path)["text"].dropna().astype(str)
+    return [text for text in remarks.map(predict.preprocess_text) if text]
+
+
+def load_labels(path=DATA_PATH):
+    """Category of each preprocessed remark in the CSV, if it has a label column"""
+    df = pd.read_csv(path)
+    if "label" not in df.columns:
+        return {}
+    df = df.dropna(subset=["text", "label"])
+    return dict(zip(
+        df["text"].astype(str).map(predict.preprocess_text),
+        df["label"].astype(str).str.strip().str.lower()
+    ))
+
+
+def make_corpus(remarks, size=CORPUS_SIZE, length="native", duplicate_rate=0.0, seed=CORPUS_SEED):
+    """
+    Deterministic corpus of `size` remarks
+
+    Args:
+        remarks: Source remarks (data/train.csv)
+        size: Number of remarks in the corpus
+        length: "native", or a word count every remark is cut or extended to
+            (longer remarks are built by joining further source remarks)
+        duplicate_rate: Share of remarks that repeat an earlier one
+        seed: Random seed; the same arguments always give the same corpus
+    """
+    rng = random.Random(f"{seed}-{length}-{duplicate_rate}")
+    corpus = []
+    for _ in range(size):
+        if corpus and rng.random() < duplicate_rate:
+            corpus.append(rng.choice(corpus))
+            continue
+        text = rng.choice(remarks)
+        if length != "native":
+            words = text.split()
+            while len(words) < int(length):
+                words += rng.choice(remarks).split()
+            text = " ".join(words[:int(length)])
+        corpus.append(text)
+    return corpus
+
+
+# -----------------------------------------
+# Measurement
+# -----------------------------------------
+def current_rss_mb():
+    """Resident set size right now in MB (Linux), else None"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+
+
+class RSSSampler:
+    """Samples RSS on a background thread to get the peak of one run"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = current_rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="rss-sampler", daemon=True)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss_mb())
+
+    def __enter__(self):
+        if self.peak is not None:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        # Without /proc only the process-wide peak is available
+        self.peak = round(max(self.peak, current_rss_mb()), 1) if self.peak is not None else peak_rss_mb()
+
+
+def percentiles(latencies):
+    values = np.asarray(latencies) * 1000
+    return {
+        "mean": round(float(values.mean()), 3),
+        "p50": round(float(np.percentile(values, 50)), 3),
+        "p95": round(float(np.percentile(values, 95)), 3),
+        "p99": round(float(np.percentile(values, 99)), 3)
+    }
+
+
+# -----------------------------------------
+# Targets
+# -----------------------------------------
+def chunked(corpus, size):
+    return [corpus[i:i + size] for i in range(0, len(corpus), size)]
+
+
+class PredictTarget:
+    """predict() for single remarks, predict_batch() for larger batches"""
+    batched = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def calls(self, corpus, batch_size):
+        return chunked(corpus, batch_size)
+
+    def __call__(self, texts):
+        """Predicted categories for `texts`, or None on failure"""
+        if len(texts) == 1:
+            result = predict.predict(texts[0])
+            return None if "error" in result else [result["category"]]
+        return [result["category"] for result in predict.predict_batch(texts)]
+
+
+class HTTPTarget:
+    """An ai/*.py FastAPI app served in process through its TestClient"""
+
+    def __init__(self, module, path, batched):
+        self.module = module
+        self.path = path
+        self.batched = batched
+        self.client = None
+
+    def __enter__(self):
+        from fastapi.testclient import TestClient
+        app = __import__(self.module).app
+        # Entering the client runs the app's lifespan (e.g. the micro-batcher)
+        self.client = TestClient(app).__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self.client.__exit__(*exc)
+        self.client = None
+
+    def calls(self, corpus, batch_size):
+        return chunked(corpus, batch_size) if self.batched else [[text] for text in corpus]
+
+    def __call__(self, texts):
+        """Predicted categories for `texts`, or None on failure"""
+        if self.batched:
+            body = {"transactions": [{"text": text} for text in texts]}
+        else:
+            body = {"text": texts[0]}
+        response = self.client.post(self.path, json=body)
+        if response.status_code != 200:
+            return None
+        results = response.json() if self.batched else [response.json()]
+        # api.py answers label ids, app.py category names
+        return [
+            predict.id2label[r["prediction"]] if isinstance(r["prediction"], int) else r["prediction"]
+            for r in results
+        ]
+
+
+def make_target(name):
+    if name == "predict":
+        return PredictTarget()
+    if name == "api":
+        return HTTPTarget("api", "/predict", batched=False)
+    if name == "batch":
+        return HTTPTarget("app", "/batch-predict", batched=True)
+    raise ValueError(f"Unknown target '{name}', expected one of {TARGETS}")
+
+
+def early_exit_stats(exits):
+    """
+    Mean layers run and share of layer compute saved, from exit layer counts
+
+    Counted per remark: a batch keeps running until its last remark exits,
+    so wall time improves less than this with large batches.
+    """
+    counted = {layer: count for layer, count in exits.items() if layer is not None and count}
+    n_layers = getattr(getattr(predict.active.model, "config", None), "n_layers", None)
+    if not counted or not n_layers:
+        return None
+    mean_layers = sum(layer * count for layer, count in counted.items()) / sum(counted.values())
+    return {
+        "mean_layers": round(mean_layers, 3),
+        "compute_saved": round(1.0 - mean_layers / n_layers, 4),
+        "layers": {str(layer): count for layer, count in sorted(counted.items())}
+    }
+
+
+def run_once(target, corpus, batch_size, concurrency, labels=None):
+    """Send the corpus through `target` and measure it"""
+    calls = target.calls(corpus, batch_size)
+    latencies = [None] * len(calls)
+    answers = [None] * len(calls)
+    errors = 0
+
+    def timed(index):
+        start = time.perf_counter()
+        try:
+            answers[index] = target(calls[index])
+        except Exception:
+            answers[index] = None
+        latencies[index] = time.perf_counter() - start
+        return answers[index] is not None
+
+    paths_before = dict(predict.path_counts)
+    exits_before = dict(predict.exit_counts)
+    predict.cache.clear()
+    with RSSSampler() as rss, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        for ok in pool.map(timed, range(len(calls))):
+            errors += not ok
+        wall = time.perf_counter() - start
+
+    # Only remarks taken verbatim from the CSV have a known category
+    graded = [
+        category == labels[text]
+        for texts, categories in zip(calls, answers) if categories is not None
+        for text, category in zip(texts, categories) if text in (labels or {})
+    ]
+
+    return {
+        "requests": len(calls),
+        "remarks": len(corpus),
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "latency_ms": percentiles(latencies),
+        "throughput": {
+            "requests_per_s": round(len(calls) / wall, 2),
+            "remarks_per_s": round(len(corpus) / wall, 2)
+        },
+        "peak_rss_mb": rss.peak,
+        "paths": {
+            path: count - paths_before.get(path, 0)
+            for path, count in predict.path_counts.items()
+            if count - paths_before.get(path, 0)
+        },
+        "accuracy": round(float(np.mean(graded)), 4) if graded else None,
+        "early_exit": early_exit_stats({
+            layer: count - exits_before.get(layer, 0)
+            for layer, count in list(predict.exit_counts.items())
+        })
+    }
+
+
+def run_sweep(args, remarks, labels=None):
+    corpora = {
+        (length, rate): make_corpus(remarks, args.size, length, rate, args.seed)
+        for length, rate in itertools.product(args.lengths, args.duplicate_rates)
+    }
+    warmup = make_corpus(remarks, WARMUP_REMARKS, seed=args.seed + 1)
+    runs = []
+
+    for name in args.targets:
+        with make_target(name) as target:
+            batch_sizes = args.batch_sizes if target.batched else [1]
+            for max_length, threads, exit_threshold, batch_size, concurrency, (length, rate) in itertools.product(
+                args.max_lengths, args.threads, args.exit_thresholds, batch_sizes, args.concurrency, corpora
+            ):
+                predict.MAX_LENGTH = max_length
+                torch.set_num_threads(threads)
+                if exit_threshold is not None:
+                    predict.active.model.threshold = exit_threshold
+                run_once(target, warmup, batch_size, concurrency)
+
+                result = run_once(
+                    target, corpora[(length, rate)], batch_size, concurrency,
+                    labels if length == "native" else None
+                )
+                run = {
+                    "target": name,
+                    "length": length,
+                    "duplicate_rate": rate,
+                    "batch_size": batch_size,
+                    "max_length": max_length,
+                    "threads": threads,
+                    "concurrency": concurrency,
+                    "exit_threshold": getattr(predict.active.model, "threshold", None),
+                    **result
+                }
+                runs.append(run)
+                print(f"   {describe(run)}: p50 {result['latency_ms']['p50']:.1f} ms, "
+                      f"p99 {result['latency_ms']['p99']:.1f} ms, "
+                      f"{result['throughput']['remarks_per_s']:.1f} remarks/s, "
+                      f"{result['peak_rss_mb']} MB"
+                      + (f", accuracy {result['accuracy']:.4f}" if result["accuracy"] is not None else "")
+                      + (f", {result['early_exit']['compute_saved']:.1%} layers skipped"
+                         if result["early_exit"] else "")
+                      + (f", {result['errors']} errors" if result["errors"] else ""),
+                      file=sys.stderr)
+
+    return runs
+
+
+def describe(run):
+    return ", ".join(f"{key}={run[key]}" for key in RUN_KEYS)
+
+
+def environment():
+    current = predict.active
+    return {
+        "model_id": str(current.model_id),
+        "model_revision": current.revision,
+        "backend": current.model.name,
+        "keyword_index": predict.keyword_index is not None,
+        "linear_cascade": predict.linear_cascade is not None,
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count()
+    }
+
+
+# -----------------------------------------
+# Baseline comparison
+# -----------------------------------------
+def compare(runs, baseline, tolerance=TOLERANCE, rss_tolerance=RSS_TOLERANCE):
+    """
+    Compare runs with the baseline run of the same configuration
+
+    Returns:
+        list of per-run comparisons; runs without a baseline are skipped
+    """
+    # Reports written before a key was added match runs with it unset
+    previous = {tuple(run.get(key) for key in RUN_KEYS): run for run in baseline["runs"]}
+    comparisons = []
+
+    for run in runs:
+        base = previous.get(tuple(run[key] for key in RUN_KEYS))
+        if base is None:
+            continue
+
+        # (metric, current, baseline, higher is worse, tolerance)
+        checks = [
+            ("p50_ms", run["latency_ms"]["p50"], base["latency_ms"]["p50"], True, tolerance),
+            ("p95_ms", run["latency_ms"]["p95"], base["latency_ms"]["p95"], True, tolerance),
+            ("p99_ms", run["latency_ms"]["p99"], base["latency_ms"]["p99"], True, tolerance),
+            ("remarks_per_s", run["throughput"]["remarks_per_s"], base["throughput"]["remarks_per_s"], False, tolerance),
+            ("peak_rss_mb", run["peak_rss_mb"], base["peak_rss_mb"], True, rss_tolerance)
+        ]
+        changes = {}
+        regressions = []
+        for metric, value, reference, higher_is_worse, allowed in checks:
+            if value is None or not reference:
+                continue
+            change = (value - reference) / reference
+            changes[metric] = round(change, 4)
+            if (change if higher_is_worse else -change) > allowed:
+                regressions.append(metric)
+        if run["errors"] > base["errors"]:
+            regressions.append("errors")
+
+        comparisons.append({
+            **{key: run[key] for key in RUN_KEYS},
+            "change": changes,
+            "regressions": regressions
+        })
+
+    return comparisons
+
+
+def parse_list(cast):
+    return lambda value: [cast(item) for item in value.split(",") if item.strip()]
+
+
+def length_arg(value):
+    return value if value == "native" else int(value)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', type=str, default=DATA_PATH, help='CSV with a text column to draw remarks from')
+    parser.add_argument('--size', type=int, default=CORPUS_SIZE, help='Remarks per corpus')
+    parser.add_argument('--seed', type=int, default=CORPUS_SEED, help='Corpus seed')
+    parser.add_argument('--targets', type=parse_list(str), default=list(TARGETS), help='predict,api,batch')
+    parser.add_argument('--lengths', type=parse_list(length_arg), default=list(LENGTHS),
+                        help='Corpus remark lengths in words, or "native"')
+    parser.add_argument('--duplicate-rates', type=parse_list(float), default=list(DUPLICATE_RATES),
+                        help='Share of repeated remarks per corpus')
+    parser.add_argument('--batch-sizes', type=parse_list(int), default=list(BATCH_SIZES),
+                        help='Remarks per call (predict and batch targets)')
+    parser.add_argument('--max-lengths', type=parse_list(int), default=list(MAX_LENGTHS),
+                        help='Tokenizer truncation lengths')
+    parser.add_argument('--threads', type=parse_list(int), default=list(THREADS), help='torch intra-op threads')
+    parser.add_argument('--concurrency', type=parse_list(int), default=list(CONCURRENCY),
+                        help='Concurrent callers')
+    parser.add_argument('--exit-thresholds', type=parse_list(float), default=list(EXIT_THRESHOLDS),
+                        help='Early-exit confidence thresholds (model with early-exit heads only)')
+    parser.add_argument('--model-only', action='store_true',
+                        help='Disable the keyword index and linear cascade so every remark hits the model')
+    parser.add_argument('--output', type=str, help='Write the JSON report here (default: stdout)')
+    parser.add_argument('--baseline', type=str, help='Earlier JSON report to compare against')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='Allowed relative latency / throughput regression')
+    parser.add_argument('--rss-tolerance', type=float, default=RSS_TOLERANCE,
+                        help='Allowed relative peak RSS regression')
+    args = parser.parse_args()
+
+    unknown = set(args.targets) - set(TARGETS)
+    if unknown:
+        parser.error(f"unknown targets: {', '.join(sorted(unknown))}")
+
+    if args.exit_thresholds != list(EXIT_THRESHOLDS) and not isinstance(predict.active.model, predict.EarlyExitBackend):
+        parser.error("--exit-thresholds needs a model with early-exit heads (see early_exit.py)")
+
+    # The on-disk store would carry results over between runs
+    predict.store = None
+    if args.model_only:
+        predict.keyword_index = None
+        predict.linear_cascade = None
+
+    remarks = load_remarks(args.data)
+    print(f"🏁 Benchmarking {', '.join(args.targets)} on {args.size} remarks "
+          f"drawn from {len(remarks)} in {args.data}", file=sys.stderr)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment(),
+        "config": {
+            "data": args.data,
+            "size": args.size,
+            "seed": args.seed,
+            "warmup_remarks": WARMUP_REMARKS,
+            "model_only": args.model_only
+        },
+        "runs": run_sweep(args, remarks, load_labels(args.data))
+    }
+
+    regressed = []
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        for key in ("model_revision", "backend", "cpu_count"):
+            if baseline["environment"].get(key) != report["environment"][key]:
+                print(f"⚠️ Baseline {key} differs: {baseline['environment'].get(key)} "
+                      f"vs {report['environment'][key]}", file=sys.stderr)
+
+        report["comparison"] = {
+            "baseline": args.baseline,
+            "tolerance": args.tolerance,
+            "rss_tolerance": args.rss_tolerance,
+            "runs": compare(report["runs"], baseline, args.tolerance, args.rss_tolerance)
+        }
+        if len(report["comparison"]["runs"]) < len(report["runs"]):
+            print(f"⚠️ {len(report['runs']) - len(report['comparison']['runs'])} runs have no "
+                  f"matching baseline run and were not compared", file=sys.stderr)
+        regressed = [c for c in report["comparison"]["runs"] if c["regressions"]]
+        report["comparison"]["regressed"] = len(regressed)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        print(f"💾 Report saved to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+    if args.baseline:
+        for comparison in regressed:
+            print(f"❌ Regression ({', '.join(comparison['regressions'])}): {describe(comparison)}", file=sys.stderr)
+        if regressed:
+            sys.exit(1)
+        print(f"✅ No regressions beyond {args.tolerance:.0%} against {args.baseline}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+classify_statements.py
+
+Offline bulk classifier for backfilling bank statements.
+This script:
+1. Reads bank CSVs with the same columns /upload-csv expects
+   (Remarks, Amount(+) Rs, Amount(-) Rs, Balance) in chunks
+2. Classifies the expense rows (Amount(-) Rs > 0 with a remark) on a pool
+   of worker processes, each with its own torch thread count
+3. Writes every row plus category, confidence, confidence_level and
+   top_predictions columns to CSV, or to a Parquet dataset directory
+4. Records progress after each chunk so an interrupted run can --resume
+
+Usage:
+    python classify_statements.py statements/*.csv --output labeled.csv --workers 4
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+REQUIRED_HEADERS = ["Remarks", "Amount(+) Rs", "Amount(-) Rs", "Balance"]
+PROGRESS_SUFFIX = ".progress.json"
+
+
+def available_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def safe_parse(series):
+    """Parse amounts the same way the backend's /upload-csv does"""
+    cleaned = series.fillna("0").astype(str).str.replace(r"[,₹\s]", "", regex=True)
+    return pd.to_numeric(cleaned.replace("", "0"), errors="coerce")
+
+
+# -----------------------------------------
+# Worker process
+# -----------------------------------------
+def init_worker(num_threads):
+    # Set before torch is imported so OpenMP sizes its pool accordingly
+    os.environ["OMP_NUM_THREADS"] = str(num_threads)
+    os.environ["MKL_NUM_THREADS"] = str(num_threads)
+    import torch
+    torch.set_num_threads(num_threads)
+    torch.set_num_interop_threads(1)
+
+    global predict_batch
+    from predict import predict_batch
+
+
+def classify_remarks(remarks, top_k, batch_size):
+    return predict_batch(remarks, top_k=top_k, batch_size=batch_size)
+
+
+# -----------------------------------------
+# Input / output
+# -----------------------------------------
+def read_chunks(paths, chunk_size):
+    """Yield (chunk_index, DataFrame) across all inputs in order"""
+    index = 0
+    for path in paths:
+        reader = pd.read_csv(path, dtype=str, chunksize=chunk_size, keep_default_na=False)
+        for chunk in reader:
+            missing = [h for h in REQUIRED_HEADERS if h not in chunk.columns]
+            if missing:
+                raise ValueError(f"{path}: missing required columns: {', '.join(missing)}")
+            chunk["source_file"] = os.path.basename(path)
+            yield index, chunk
+            index += 1
+
+
+def prepare_chunk(chunk):
+    """Parse amounts, drop rows without a balance and find expense rows"""
+    chunk = chunk.copy()
+    chunk["Amount(+) Rs"] = safe_parse(chunk["Amount(+) Rs"]).fillna(0)
+    chunk["Amount(-) Rs"] = safe_parse(chunk["Amount(-) Rs"]).fillna(0)
+    chunk["Balance"] = safe_parse(chunk["Balance"])
+    chunk = chunk[chunk["Balance"].notna()]
+    chunk["Remarks"] = chunk["Remarks"].astype(str).str.strip()
+
+    is_expense = (chunk["Amount(-) Rs"] > 0) & (chunk["Remarks"].str.len() > 0)
+    return chunk, is_expense
+
+
+def attach_predictions(chunk, is_expense, results):
+    chunk = chunk.copy()
+    for column in ("category", "confidence", "confidence_level", "top_predictions"):
+        chunk[column] = None
+
+    expense_index = chunk.index[is_expense]
+    chunk.loc[expense_index, "category"] = [r["category"] for r in results]
+    chunk.loc[expense_index, "confidence"] = [r["confidence"] for r in results]
+    chunk.loc[expense_index, "confidence_level"] = [r["confidence_level"] for r in results]
+    chunk.loc[expense_index, "top_predictions"] = [json.dumps(r["top_predictions"]) for r in results]
+    return chunk
+
+
+class ChunkWriter:
+    """Append chunks to a CSV file or to a directory of Parquet parts"""
+
+    def __init__(self, output, truncate_to=None):
+        self.output = output
+        self.parquet = output.endswith(".parquet")
+
+        if self.parquet:
+            os.makedirs(output, exist_ok=True)
+            if truncate_to is None:
+                for name in os.listdir(output):
+                    if name.startswith("part-"):
+                        os.remove(os.path.join(output, name))
+        elif truncate_to is not None and os.path.exists(output):
+            # Drop anything written after the last recorded chunk
+            with open(output, "r+b") as f:
+                f.truncate(truncate_to)
+        elif os.path.exists(output):
+            os.remove(output)
+
+    def write(self, index, chunk):
+        if self.parquet:
+            chunk.to_parquet(os.path.join(self.output, f"part-{index:06d}.parquet"), index=False)
+            return None
+
+        header = not os.path.exists(self.output) or os.path.getsize(self.output) == 0
+        chunk.to_csv(self.output, mode="a", header=header, index=False)
+        return os.path.getsize(self.output)
+
+
+def load_progress(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_progress(path, progress):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(progress, f, indent=2)
+    os.replace(tmp, path)
+
+
+# -----------------------------------------
+# Main
+# -----------------------------------------
+def main():
+    cpus = available_cpus()
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('inputs', nargs='+', help='Bank statement CSV files')
+    parser.add_argument('--output', required=True, help='Output .csv file or .parquet directory')
+    parser.add_argument('--chunk-size', type=int, default=5000, help='Rows read per chunk')
+    parser.add_argument('--workers', type=int, default=max(1, cpus // 2), help='Worker processes')
+    parser.add_argument('--threads-per-worker', type=int, help='torch threads per worker (default: cpus / workers)')
+    parser.add_argument('--batch-size', type=int, default=64, help='Remarks per forward pass')
+    parser.add_argument('--top-k', type=int, default=3, help='Top predictions per row')
+    parser.add_argument('--resume', action='store_true', help='Continue after the last completed chunk')
+    args = parser.parse_args()
+
+    threads = args.threads_per_worker or max(1, cpus // args.workers)
+    progress_path = args.output.rstrip("/") + PROGRESS_SUFFIX
+    run_config = {
+        "inputs": [os.path.abspath(p) for p in args.inputs],
+        "chunk_size": args.chunk_size,
+        "top_k": args.top_k
+    }
+
+    progress = load_progress(progress_path) if args.resume else None
+    if progress is not None and progress["config"] != run_config:
+        print("❌ --resume needs the same inputs, --chunk-size and --top-k as the interrupted run")
+        sys.exit(1)
+    if progress is None:
+        progress = {"config": run_config, "completed_chunks": 0, "rows": 0, "expense_rows": 0, "csv_bytes": 0}
+    elif progress["completed_chunks"]:
+        print(f"⏩ Resuming after chunk {progress['completed_chunks'] - 1} ({progress['rows']} rows done)")
+
+    writer = ChunkWriter(args.output, truncate_to=progress["csv_bytes"] if args.resume else None)
+
+    print(f"🚀 {args.workers} workers x {threads} threads, chunks of {args.chunk_size} rows\n")
+
+    start = time.perf_counter()
+    rows_this_run = 0
+    max_in_flight = args.workers * 2
+    in_flight = {}  # chunk index -> (chunk, is_expense, future)
+    next_to_write = progress["completed_chunks"]
+
+    def flush_ready(block):
+        nonlocal next_to_write, rows_this_run
+        while next_to_write in in_flight:
+            chunk, is_expense, future = in_flight[next_to_write]
+            if not block and not future.done():
+                return
+            results = future.result()
+            del in_flight[next_to_write]
+
+            csv_bytes = writer.write(next_to_write, attach_predictions(chunk, is_expense, results))
+            rows_this_run += len(chunk)
+            progress["completed_chunks"] = next_to_write + 1
+            progress["rows"] += len(chunk)
+            progress["expense_rows"] += int(is_expense.sum())
+            if csv_bytes is not None:
+                progress["csv_bytes"] = csv_bytes
+            save_progress(progress_path, progress)
+
+            elapsed = time.perf_counter() - start
+            print(f"✅ Chunk {next_to_write}: {progress['rows']} rows total, "
+                  f"{rows_this_run / elapsed:,.0f} rows/s")
+            next_to_write += 1
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(args.workers, mp_context=context,
+                             initializer=init_worker, initargs=(threads,)) as pool:
+        for index, raw in read_chunks(args.inputs, args.chunk_size):
+            if index < progress["completed_chunks"]:
+                continue
+
+            chunk, is_expense = prepare_chunk(raw)
+            remarks = chunk.loc[is_expense, "Remarks"].tolist()
+            future = pool.submit(classify_remarks, remarks, args.top_k, args.batch_size)
+            in_flight[index] = (chunk, is_expense, future)
+
+            flush_ready(block=False)
+            while len(in_flight) >= max_in_flight:
+                flush_ready(block=True)
+
+        while in_flight:
+            flush_ready(block=True)
+
+    elapsed = time.perf_counter() - start
+    print("\n" + "="*60)
+    print(f"🎉 Classified {progress['expense_rows']} expense rows out of {progress['rows']}")
+    print(f"⏱️  {rows_this_run} rows this run in {elapsed:.1f}s ({rows_this_run / max(elapsed, 1e-9):,.0f} rows/s)")
+    print(f"💾 Output: {args.output}")
+    print("="*60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+# ai/corrections_store.py
+"""
+On-disk dataset of user corrections for retrain_model.py.
+
+Corrections are pulled from the backend's export-corrections endpoint one
+cursor page at a time, parsed row by row while the response streams in,
+and upserted into SQLite keyed by the normalized remark (the row fetched
+last wins, so a remark that was corrected again keeps its latest label).
+Each page and the cursor (highest transaction id seen) are committed
+together, so an interrupted fetch resumes after the last complete page.
+
+The backend only exports corrections not yet used for training. After a
+successful job, exactly the transaction ids fetched are marked as used and
+the cursor is reset, so the next job transfers only newer corrections while
+the dataset on disk keeps everything collected so far. A transaction the
+backend exports again (it was re-corrected) counts as new and is marked
+again after the next job.
+"""
+import os
+import csv
+import sqlite3
+import time
+from training_data import preprocess_text
+
+# Rows written per executemany() while a page streams in
+_WRITE_CHUNK = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS corrections (
+    text       TEXT    PRIMARY KEY,
+    label      TEXT    NOT NULL,
+    source_id  INTEGER NOT NULL,
+    fetched_at REAL    NOT NULL
+);
+CREATE TABLE IF NOT EXISTS fetched (
+    source_id INTEGER PRIMARY KEY,
+    marked    INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def iter_csv_rows(lines):
+    """Yield (id, text, label) from streamed export-corrections CSV lines"""
+    reader = csv.DictReader(lines)
+    missing = {"id", "text", "label"} - set(reader.fieldnames or [])
+    if missing:
+        raise ValueError(f"export-corrections response is missing columns: {', '.join(sorted(missing))}")
+    for row in reader:
+        yield int(row["id"]), row["text"], row["label"]
+
+
+class CorrectionsStore:
+    """SQLite-backed, deduplicated corrections dataset with a fetch cursor"""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+
+    def _get_state(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_state(self, key, value):
+        self.conn.execute(
+            "INSERT INTO sync_state (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, str(value))
+        )
+
+    @property
+    def cursor(self):
+        """Highest backend transaction id fetched in the current cycle"""
+        return int(self._get_state("cursor", 0))
+
+    def unmarked_ids(self):
+        """Transaction ids fetched but not yet reported as used"""
+        return [row[0] for row in self.conn.execute("SELECT source_id FROM fetched WHERE marked = 0 ORDER BY source_id")]
+
+    def count_new(self):
+        """Stored corrections whose transactions are not yet reported as used"""
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM corrections JOIN fetched USING (source_id) WHERE fetched.marked = 0"
+        ).fetchone()[0]
+
+    def finish_cycle(self, marked_ids):
+        """Record ids the backend marked as used and restart paging from the beginning"""
+        with self.conn:
+            self.conn.executemany("UPDATE fetched SET marked = 1 WHERE source_id = ?", [(i,) for i in marked_ids])
+            self._set_state("cursor", 0)
+
+    def append_page(self, rows):
+        """
+        Upsert one page of (id, text, label) rows and advance the cursor
+
+        The page is committed as a whole; if iterating `rows` fails half
+        way (e.g. the connection drops), nothing from it is kept.
+
+        Returns:
+            (rows read, highest id in the page or None)
+        """
+        now = time.time()
+        read = 0
+        last_id = None
+        pending = []
+
+        def flush():
+            # Exported again means corrected again: it needs marking again
+            self.conn.executemany(
+                "INSERT INTO fetched (source_id) VALUES (?) "
+                "ON CONFLICT(source_id) DO UPDATE SET marked = 0",
+                [(row[2],) for row in pending]
+            )
+            self.conn.executemany(
+                "INSERT INTO corrections (text, label, source_id, fetched_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(text) DO UPDATE SET "
+                "label = excluded.label, source_id = excluded.source_id, fetched_at = excluded.fetched_at",
+                pending
+            )
+            pending.clear()
+
+        try:
+            for source_id, text, label in rows:
+                read += 1
+                last_id = source_id if last_id is None else max(last_id, source_id)
+                text = preprocess_text(text)
+                label = str(label).strip().lower()
+                if not text or not label:
+                    continue
+                pending.append((text, label, source_id, now))
+                if len(pending) >= _WRITE_CHUNK:
+                    flush()
+            if pending:
+                flush()
+            if last_id is not None and last_id > self.cursor:
+                self._set_state("cursor", last_id)
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+
+        return read, last_id
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM corrections").fetchone()[0]
+
+    def to_dataframe(self):
+        import pandas as pd
+        return pd.read_sql_query("SELECT text, label FROM corrections ORDER BY source_id", self.conn)
+
+    def close(self):
+        self.conn.close()
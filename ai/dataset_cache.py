@@ -0,0 +1,154 @@
+# ai/dataset_cache.py
+"""
+On-disk cache of tokenized train/test splits for train.py and retrain_model.py.
+
+Two layers, both stored as Arrow datasets that are memory-mapped on load:
+
+- Row pool: every remark ever tokenized with a given tokenizer, max_length
+  and padding mode, kept as append-only shards. Only remarks missing from
+  the pool are tokenized; they are written as a new shard.
+- Splits: the finished train/test DatasetDict, keyed by a fingerprint of the
+  split contents, the tokenizer, max_length, padding and the split seed. An
+  unchanged run loads it directly without touching the tokenizer.
+"""
+import os
+import json
+import shutil
+import hashlib
+import pandas as pd
+from datasets import Dataset, DatasetDict, concatenate_datasets, load_from_disk
+
+CACHE_DIR = os.getenv("TOKENIZED_CACHE_DIR", "./cache/tokenized")
+
+# Finished split datasets kept on disk; older ones are removed
+MAX_CACHED_SPLITS = 4
+
+
+def tokenizer_fingerprint(tokenizer):
+    """Hash of the tokenizer's vocabulary, normalizer and special tokens"""
+    state = json.loads(tokenizer.backend_tokenizer.to_str())
+    # Truncation / padding are per-call settings the backend remembers
+    state.pop("truncation", None)
+    state.pop("padding", None)
+
+    digest = hashlib.sha256(type(tokenizer).__name__.encode())
+    digest.update(json.dumps(state, sort_keys=True).encode())
+    digest.update(repr(sorted(tokenizer.special_tokens_map.items())).encode())
+    return digest.hexdigest()[:16]
+
+
+def data_fingerprint(df):
+    """Hash of the text and label_id columns, in order"""
+    hashed = pd.util.hash_pandas_object(df[["text", "label_id"]], index=False)
+    return hashlib.sha256(hashed.values.tobytes()).hexdigest()[:16]
+
+
+def _key(*parts):
+    return hashlib.sha256("|".join(str(p) for p in parts).encode()).hexdigest()[:16]
+
+
+class TokenizedPool:
+    """Append-only pool of tokenized remarks, one Arrow shard per append"""
+
+    def __init__(self, path, tokenizer, max_length, padding):
+        self.path = path
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+        self.padding = padding
+        os.makedirs(path, exist_ok=True)
+
+        shards = sorted(name for name in os.listdir(path) if name.startswith("shard-"))
+        self.shards = [load_from_disk(os.path.join(path, name)) for name in shards]
+        self.dataset = concatenate_datasets(self.shards) if self.shards else None
+        self.index = {
+            text: i for i, text in enumerate(self.dataset["text"] if self.dataset else [])
+        }
+
+    def _tokenize(self, batch):
+        return self.tokenizer(
+            batch["text"],
+            truncation=True,
+            padding=self.padding,
+            max_length=self.max_length,
+            return_attention_mask=True
+        )
+
+    def add(self, texts):
+        """Tokenize texts not yet in the pool and write them as a new shard"""
+        new = [text for text in dict.fromkeys(texts) if text not in self.index]
+        if not new:
+            return 0
+
+        shard = Dataset.from_dict({"text": new}).map(self._tokenize, batched=True)
+        shard_path = os.path.join(self.path, f"shard-{len(self.shards):05d}")
+        shard.save_to_disk(shard_path + ".tmp")
+        os.replace(shard_path + ".tmp", shard_path)
+
+        self.shards.append(load_from_disk(shard_path))
+        self.dataset = concatenate_datasets(self.shards)
+        offset = len(self.index)
+        self.index.update((text, offset + i) for i, text in enumerate(new))
+        return len(new)
+
+    def select(self, df):
+        """Tokenized rows for df.text, in order, with label_id and labels columns"""
+        rows = self.dataset.select([self.index[text] for text in df["text"]])
+        label_ids = [int(label_id) for label_id in df["label_id"]]
+        rows = rows.add_column("label_id", label_ids)
+        rows = rows.add_column("labels", label_ids)
+        return rows.flatten_indices()
+
+
+def _prune_splits(splits_dir, keep):
+    entries = sorted(
+        (os.path.join(splits_dir, name) for name in os.listdir(splits_dir)),
+        key=os.path.getmtime,
+        reverse=True
+    )
+    for path in entries[keep:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def tokenized_splits(train_df, test_df, tokenizer, max_length, seed,
+                     padding="max_length", cache_dir=CACHE_DIR):
+    """
+    Tokenized train/test DatasetDict, reusing whatever is cached
+
+    Args:
+        train_df, test_df: DataFrames with text and label_id columns
+        tokenizer: Fast tokenizer used for training
+        max_length: Truncation (and padding) length
+        seed: Seed used for the train/test split
+        padding: Padding mode passed to the tokenizer
+        cache_dir: Root directory of the cache
+
+    Returns:
+        DatasetDict with train and test splits
+    """
+    tokenizer_fp = tokenizer_fingerprint(tokenizer)
+    split_key = _key(
+        data_fingerprint(train_df), data_fingerprint(test_df),
+        tokenizer_fp, max_length, padding, seed
+    )
+    splits_dir = os.path.join(cache_dir, "splits")
+    split_path = os.path.join(splits_dir, split_key)
+
+    if os.path.isdir(split_path):
+        print(f"⚡ Using cached tokenized splits {split_key}")
+        os.utime(split_path)
+        return load_from_disk(split_path)
+
+    pool = TokenizedPool(
+        os.path.join(cache_dir, "pools", _key(tokenizer_fp, max_length, padding)),
+        tokenizer, max_length, padding
+    )
+    added = pool.add(list(train_df["text"]) + list(test_df["text"]))
+    print(f"🔤 Tokenized {added} new remarks ({len(pool.index) - added} reused from cache)")
+
+    dataset = DatasetDict({"train": pool.select(train_df), "test": pool.select(test_df)})
+    os.makedirs(splits_dir, exist_ok=True)
+    dataset.save_to_disk(split_path + ".tmp")
+    os.replace(split_path + ".tmp", split_path)
+    _prune_splits(splits_dir, MAX_CACHED_SPLITS)
+
+    return load_from_disk(split_path)
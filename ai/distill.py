@@ -0,0 +1,340 @@
+"""
+distill.py
+
+Knowledge distillation of a small student classifier from the trained DistilBERT.
+This script:
+1. Scores data/train.csv, plus optional unlabeled remarks, with the teacher
+   once and keeps its logits
+2. Builds a DistilBERT student with --layers transformer layers (default 2),
+   starting from the teacher's embeddings, evenly spaced teacher layers and
+   classifier head
+3. Trains the student on the teacher's temperature-softened logits (KL) plus
+   cross-entropy on the labeled remarks
+4. Reports accuracy, F1 and latency of the student against the teacher on the
+   test split
+5. Saves the student as a regular model directory, so the inference servers
+   load it as MODEL_ID (it also works with export_onnx.py and quantize.py)
+
+Usage:
+    python distill.py --teacher ./model --output ./model/student --unlabeled data/remarks.csv
+"""
+
+import os
+import json
+import time
+import shutil
+import argparse
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn.functional as F
+from transformers import (
+    DistilBertTokenizerFast,
+    DistilBertForSequenceClassification,
+    TrainingArguments,
+    EarlyStoppingCallback,
+    DataCollatorWithPadding
+)
+from sklearn.metrics import accuracy_score, f1_score
+from datetime import datetime
+from training_data import TRAIN_CSV, load_training_data, stratified_split, preprocess_text
+from dataset_cache import tokenized_splits
+from training_utils import LengthGroupedTrainer
+from progress import ProgressReporter
+
+# Configuration
+TEACHER_PATH = "./model"
+OUTPUT_DIR = "./model/student"
+STUDENT_LAYERS = 2
+
+# Distillation parameters
+TEMPERATURE = 2.0
+ALPHA = 0.7  # weight of the KL term; 1 - ALPHA goes to cross-entropy on labels
+BATCH_SIZE = 32
+LEARNING_RATE = 1e-4
+EPOCHS = 10
+MAX_LENGTH = 96
+SPLIT_SEED = 42
+
+# Remarks timed one at a time for the latency report
+LATENCY_SAMPLES = 200
+UNLABELED = -100
+
+
+# -----------------------------------------
+# Teacher and student
+# -----------------------------------------
+def teacher_logits(model, tokenizer, texts, batch_size=64):
+    """Teacher logits for `texts`, in order, as a float32 array"""
+    model.eval()
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    logits = np.zeros((len(texts), model.config.num_labels), dtype=np.float32)
+
+    for start in range(0, len(order), batch_size):
+        chunk = order[start:start + batch_size]
+        inputs = tokenizer(
+            [texts[i] for i in chunk],
+            truncation=True,
+            max_length=MAX_LENGTH,
+            padding=True,
+            return_tensors="pt"
+        )
+        with torch.no_grad():
+            logits[chunk] = model(**inputs).logits.numpy()
+    return logits
+
+
+def build_student(teacher, layers=STUDENT_LAYERS):
+    """
+    DistilBERT with `layers` transformer layers initialized from `teacher`
+
+    Embeddings and the classifier head are copied; student layer i starts
+    from one of the teacher layers spread evenly from first to last.
+    """
+    teacher_layers = teacher.config.n_layers
+    if not 1 <= layers <= teacher_layers:
+        raise ValueError(f"Student needs between 1 and {teacher_layers} layers, got {layers}")
+
+    config = teacher.config.__class__.from_dict(teacher.config.to_dict())
+    config.n_layers = layers
+    student = DistilBertForSequenceClassification(config)
+
+    picked = np.linspace(0, teacher_layers - 1, layers).round().astype(int).tolist()
+    state = teacher.state_dict()
+    student_state = {}
+    for name in student.state_dict():
+        source = name
+        if name.startswith("distilbert.transformer.layer."):
+            _, _, _, index, rest = name.split(".", 4)
+            source = f"distilbert.transformer.layer.{picked[int(index)]}.{rest}"
+        student_state[name] = state[source].clone()
+    student.load_state_dict(student_state)
+    return student, picked
+
+
+class DistillationTrainer(LengthGroupedTrainer):
+    """Trains on KL to the teacher's soft logits plus CE on labeled rows"""
+
+    def __init__(self, *args, temperature=TEMPERATURE, alpha=ALPHA, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.temperature = temperature
+        self.alpha = alpha
+
+    def compute_loss(self, model, inputs, return_outputs=False, num_items_in_batch=None):
+        labels = inputs.pop("labels")
+        soft_targets = inputs.pop("teacher_logits")
+        outputs = model(**inputs)
+        logits = outputs.logits
+
+        t = self.temperature
+        kl = F.kl_div(
+            F.log_softmax(logits / t, dim=-1),
+            F.log_softmax(soft_targets / t, dim=-1),
+            log_target=True,
+            reduction="batchmean"
+        ) * (t * t)
+
+        labeled = labels != UNLABELED
+        if labeled.any():
+            ce = F.cross_entropy(logits[labeled], labels[labeled])
+            loss = self.alpha * kl + (1 - self.alpha) * ce
+        else:
+            loss = kl
+
+        return (loss, outputs) if return_outputs else loss
+
+
+def compute_metrics(eval_pred):
+    logits, labels = eval_pred
+    predictions = np.argmax(logits, axis=-1)
+    return {
+        'accuracy': accuracy_score(labels, predictions),
+        'f1_macro': f1_score(labels, predictions, average='macro'),
+        'f1_weighted': f1_score(labels, predictions, average='weighted')
+    }
+
+
+# -----------------------------------------
+# Comparison
+# -----------------------------------------
+def evaluate_model(model, tokenizer, texts, labels):
+    """Accuracy, F1 and per-remark latency (single and batched) of `model`"""
+    model.eval()
+    start = time.perf_counter()
+    logits = teacher_logits(model, tokenizer, texts, batch_size=BATCH_SIZE)
+    batched_ms = (time.perf_counter() - start) * 1000 / len(texts)
+    predictions = logits.argmax(axis=1)
+
+    single = []
+    for text in texts[:LATENCY_SAMPLES]:
+        inputs = tokenizer(text, truncation=True, max_length=MAX_LENGTH, return_tensors="pt")
+        start = time.perf_counter()
+        with torch.no_grad():
+            model(**inputs)
+        single.append((time.perf_counter() - start) * 1000)
+
+    return predictions, {
+        "accuracy": float(accuracy_score(labels, predictions)),
+        "f1_macro": float(f1_score(labels, predictions, average="macro")),
+        "f1_weighted": float(f1_score(labels, predictions, average="weighted")),
+        "latency_ms_single_p50": float(np.percentile(single, 50)),
+        "latency_ms_single_p95": float(np.percentile(single, 95)),
+        "latency_ms_per_remark_batched": batched_ms,
+        "parameters": sum(p.numel() for p in model.parameters())
+    }
+
+
+def load_unlabeled(paths, exclude):
+    """Preprocessed, deduplicated remarks from CSVs with a text column"""
+    remarks = []
+    for path in paths:
+        df = pd.read_csv(path)
+        df.columns = df.columns.str.strip().str.lower()
+        remarks.extend(df["text"].dropna().map(preprocess_text))
+    return [text for text in dict.fromkeys(remarks) if text and text not in exclude]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', type=str, default=TRAIN_CSV, help='Labeled training CSV')
+    parser.add_argument('--unlabeled', type=str, nargs='*', default=[],
+                        help='CSVs with a text column of extra remarks labeled only by the teacher')
+    parser.add_argument('--teacher', type=str, default=TEACHER_PATH, help='Trained DistilBERT model directory')
+    parser.add_argument('--output', type=str, default=OUTPUT_DIR, help='Where to save the student')
+    parser.add_argument('--layers', type=int, default=STUDENT_LAYERS, help='Student transformer layers')
+    parser.add_argument('--temperature', type=float, default=TEMPERATURE, help='Softmax temperature for the KL term')
+    parser.add_argument('--alpha', type=float, default=ALPHA, help='Weight of the KL term vs cross-entropy')
+    parser.add_argument('--epochs', type=int, default=EPOCHS)
+    args = parser.parse_args()
+
+    print("\n" + "="*60)
+    print("🎓 KNOWLEDGE DISTILLATION")
+    print("="*60 + "\n")
+
+    # Same labels and split as train.py, so test scores are comparable
+    df = load_training_data(args.data)
+    train_df, test_df = stratified_split(df, seed=SPLIT_SEED)
+    unlabeled = load_unlabeled(args.unlabeled, set(df["text"]))
+    if unlabeled:
+        train_df = pd.concat(
+            [train_df, pd.DataFrame({"text": unlabeled, "label_id": UNLABELED})],
+            ignore_index=True
+        )
+    print(f"📊 Train: {len(train_df) - len(unlabeled)} labeled + {len(unlabeled)} unlabeled | Test: {len(test_df)}")
+
+    print(f"📥 Loading teacher from {args.teacher}...")
+    tokenizer = DistilBertTokenizerFast.from_pretrained(args.teacher)
+    teacher = DistilBertForSequenceClassification.from_pretrained(args.teacher)
+    teacher.eval()
+
+    print("🧑‍🏫 Scoring remarks with the teacher...")
+    train_logits = teacher_logits(teacher, tokenizer, train_df["text"].tolist())
+    test_logits = teacher_logits(teacher, tokenizer, test_df["text"].tolist())
+
+    student, picked = build_student(teacher, args.layers)
+    print(f"🧒 Student: {args.layers} layers from teacher layers {picked} "
+          f"({sum(p.numel() for p in student.parameters()):,} vs "
+          f"{sum(p.numel() for p in teacher.parameters()):,} parameters)\n")
+
+    tokenized = tokenized_splits(
+        train_df, test_df, tokenizer,
+        max_length=MAX_LENGTH,
+        seed=SPLIT_SEED,
+        padding="do_not_pad"
+    )
+    keep = ["input_ids", "attention_mask", "labels"]
+    train_dataset = tokenized["train"].select_columns(keep).add_column("teacher_logits", train_logits.tolist())
+    test_dataset = tokenized["test"].select_columns(keep).add_column("teacher_logits", test_logits.tolist())
+
+    # Trainer checkpoints go to a scratch dir so --output holds only the
+    # servable student
+    checkpoint_dir = args.output.rstrip("/\\") + ".checkpoints"
+    training_args = TrainingArguments(
+        output_dir=checkpoint_dir,
+        num_train_epochs=args.epochs,
+        per_device_train_batch_size=BATCH_SIZE,
+        per_device_eval_batch_size=BATCH_SIZE,
+        learning_rate=LEARNING_RATE,
+        weight_decay=0.01,
+        warmup_ratio=0.06,
+        eval_strategy="epoch",
+        save_strategy="epoch",
+        logging_steps=50,
+        load_best_model_at_end=True,
+        metric_for_best_model="f1_weighted",
+        greater_is_better=True,
+        report_to="none",
+        save_total_limit=2,
+        # teacher_logits is not a model input but the loss needs it
+        remove_unused_columns=False,
+    )
+
+    trainer = DistillationTrainer(
+        model=student,
+        args=training_args,
+        train_dataset=train_dataset,
+        eval_dataset=test_dataset,
+        data_collator=DataCollatorWithPadding(tokenizer),
+        compute_metrics=compute_metrics,
+        callbacks=[
+            EarlyStoppingCallback(early_stopping_patience=3),
+            ProgressReporter(run_name=f"distill-{args.layers}l", layers=args.layers, learning_rate=LEARNING_RATE)
+        ],
+        temperature=args.temperature,
+        alpha=args.alpha
+    )
+
+    print("🚀 Starting distillation...")
+    try:
+        trainer.train()
+    finally:
+        shutil.rmtree(checkpoint_dir, ignore_errors=True)
+
+    # Compare on the held-out split
+    print("\n" + "="*60)
+    print("📊 STUDENT VS TEACHER")
+    print("="*60)
+    texts = test_df["text"].tolist()
+    labels = test_df["label_id"].to_numpy()
+    student = trainer.model.cpu()
+    teacher_pred, teacher_report = evaluate_model(teacher, tokenizer, texts, labels)
+    student_pred, student_report = evaluate_model(student, tokenizer, texts, labels)
+    agreement = float((teacher_pred == student_pred).mean())
+
+    print(f"\n{'':<28}{'teacher':>12}{'student':>12}")
+    for key, fmt in (("accuracy", ".4f"), ("f1_macro", ".4f"), ("f1_weighted", ".4f"),
+                     ("latency_ms_single_p50", ".2f"), ("latency_ms_single_p95", ".2f"),
+                     ("latency_ms_per_remark_batched", ".3f"), ("parameters", ",")):
+        print(f"{key:<28}{teacher_report[key]:>12{fmt}}{student_report[key]:>12{fmt}}")
+    speedup = teacher_report["latency_ms_single_p50"] / student_report["latency_ms_single_p50"]
+    print(f"\n✅ Student agrees with the teacher on {agreement:.2%} of test remarks, {speedup:.1f}x faster per remark")
+
+    # Save the student as a drop-in model directory
+    print(f"\n💾 Saving student to {args.output}...")
+    # save_pretrained rather than trainer.save_model: no training_args.bin
+    student.save_pretrained(args.output)
+    tokenizer.save_pretrained(args.output)
+
+    metadata = {
+        "distilled_at": datetime.now().isoformat(),
+        "teacher_model": args.teacher,
+        "student_layers": args.layers,
+        "initialized_from_teacher_layers": picked,
+        "temperature": args.temperature,
+        "alpha": args.alpha,
+        "epochs": args.epochs,
+        "labeled_samples": len(train_df) - len(unlabeled),
+        "unlabeled_samples": len(unlabeled),
+        "test_samples": len(test_df),
+        "teacher_agreement": agreement,
+        "teacher": teacher_report,
+        "student": student_report
+    }
+    with open(os.path.join(args.output, "distill_metadata.json"), "w") as f:
+        json.dump(metadata, f, indent=2)
+
+    print(f"✅ Student saved. Serve it with MODEL_ID={args.output} or POST /admin/reload")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""
+early_exit.py
+
+Confidence-based early exit for the DistilBERT classifier.
+This script:
+1. Runs the trained model (frozen) over data/train.csv once and keeps the
+   [CLS] hidden state after every transformer layer
+2. Trains a small exit head per intermediate layer on those features, with
+   cross-entropy on the labels plus KL to the full model's logits
+3. Calibrates the confidence threshold on the test split: of the thresholds
+   whose accuracy stays within --max-accuracy-drop of the full model, the
+   one saving the most compute
+4. Saves the heads and the calibration next to the model weights
+
+At inference (see EarlyExitBackend) a forward hook on each layer runs that
+layer's head. A remark is answered by the first head whose top probability
+reaches the threshold, and the forward pass stops as soon as every remark
+in the batch has been answered. The backbone is never changed, so remarks
+no head is sure about get exactly the full model's answer.
+
+Usage:
+    python early_exit.py --model ./model
+    TRAIN_EARLY_EXIT=1 python train.py      # train the heads right after training
+"""
+
+import os
+import json
+import argparse
+import threading
+import numpy as np
+import torch
+from torch import nn
+import torch.nn.functional as F
+from backends import TorchBackend
+from adapters import base_fingerprint
+
+HEADS_WEIGHTS_NAME = "early_exit_heads.pt"
+HEADS_CONFIG_NAME = "early_exit_config.json"
+
+# Head training on cached features
+EPOCHS = 30
+BATCH_SIZE = 64
+LEARNING_RATE = 1e-3
+DISTILL_WEIGHT = 0.5  # share of the loss matching the full model's logits
+MAX_LENGTH = 96
+
+MAX_ACCURACY_DROP = 0.005
+THRESHOLDS = tuple(np.round(np.arange(0.50, 1.0, 0.01), 2).tolist()) + (0.995, 0.999)
+
+
+class ExitHead(nn.Module):
+    """pre_classifier -> ReLU -> classifier, shaped like DistilBERT's own head"""
+
+    def __init__(self, dim, num_labels, dropout=0.1):
+        super().__init__()
+        self.pre_classifier = nn.Linear(dim, dim)
+        self.dropout = nn.Dropout(dropout)
+        self.classifier = nn.Linear(dim, num_labels)
+
+    def forward(self, cls_hidden):
+        return self.classifier(self.dropout(F.relu(self.pre_classifier(cls_hidden))))
+
+
+def build_heads(model):
+    """One ExitHead per layer except the last, initialized from the model's head"""
+    config = model.config
+    heads = nn.ModuleList(
+        ExitHead(config.dim, config.num_labels, config.seq_classif_dropout)
+        for _ in range(config.n_layers - 1)
+    )
+    for head in heads:
+        head.pre_classifier.load_state_dict(model.pre_classifier.state_dict())
+        head.classifier.load_state_dict(model.classifier.state_dict())
+    return heads
+
+
+# -----------------------------------------
+# Training and calibration
+# -----------------------------------------
+def collect_features(model, tokenizer, texts, batch_size=64):
+    """
+    [CLS] hidden state after each layer and the final logits
+
+    Returns:
+        (features (layers, n, dim), logits (n, num_labels)) tensors
+    """
+    model.eval()
+    features, logits = [], []
+    for start in range(0, len(texts), batch_size):
+        inputs = tokenizer(
+            texts[start:start + batch_size],
+            truncation=True,
+            max_length=MAX_LENGTH,
+            padding=True,
+            return_tensors="pt"
+        )
+        with torch.no_grad():
+            outputs = model(**inputs, output_hidden_states=True)
+        # hidden_states[0] is the embedding output, [i + 1] follows layer i
+        features.append(torch.stack([h[:, 0] for h in outputs.hidden_states[1:-1]]))
+        logits.append(outputs.logits)
+    return torch.cat(features, dim=1), torch.cat(logits)
+
+
+def train_heads(heads, features, final_logits, labels, epochs=EPOCHS, seed=42):
+    """Fit every exit head on its layer's features"""
+    generator = torch.Generator().manual_seed(seed)
+    labels = torch.as_tensor(labels, dtype=torch.long)
+    optimizer = torch.optim.AdamW(heads.parameters(), lr=LEARNING_RATE, weight_decay=0.01)
+    soft_targets = F.log_softmax(final_logits, dim=-1)
+
+    heads.train()
+    for epoch in range(epochs):
+        order = torch.randperm(len(labels), generator=generator)
+        total = 0.0
+        for start in range(0, len(order), BATCH_SIZE):
+            batch = order[start:start + BATCH_SIZE]
+            loss = 0.0
+            for layer, head in enumerate(heads):
+                logits = head(features[layer, batch])
+                ce = F.cross_entropy(logits, labels[batch])
+                kl = F.kl_div(F.log_softmax(logits, dim=-1), soft_targets[batch], log_target=True, reduction="batchmean")
+                loss = loss + (1 - DISTILL_WEIGHT) * ce + DISTILL_WEIGHT * kl
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            total += loss.item() * len(batch)
+        if epoch == 0 or (epoch + 1) % 10 == 0:
+            print(f"   epoch {epoch + 1}/{epochs}: loss {total / len(order) / len(heads):.4f}")
+    heads.eval()
+    return heads
+
+
+def simulate_exits(heads, features, final_logits, threshold):
+    """(predictions, layers used) when exiting at the first head >= threshold"""
+    n_layers = len(heads) + 1
+    predictions = final_logits.argmax(-1).clone()
+    layers = torch.full((len(predictions),), n_layers)
+    done = torch.zeros(len(predictions), dtype=torch.bool)
+    with torch.no_grad():
+        for layer, head in enumerate(heads):
+            confidence, predicted = F.softmax(head(features[layer]), dim=-1).max(-1)
+            newly = ~done & (confidence >= threshold)
+            predictions[newly] = predicted[newly]
+            layers[newly] = layer + 1
+            done |= newly
+    return predictions.numpy(), layers.numpy()
+
+
+def calibrate(heads, features, final_logits, labels, max_drop=MAX_ACCURACY_DROP, thresholds=THRESHOLDS):
+    """
+    Accuracy and compute saved per threshold on held-out data
+
+    Returns:
+        (chosen threshold or None, full model accuracy, per-threshold rows)
+    """
+    labels = np.asarray(labels)
+    n_layers = len(heads) + 1
+    full_accuracy = float((final_logits.argmax(-1).numpy() == labels).mean())
+    table = []
+    for threshold in thresholds:
+        predictions, layers = simulate_exits(heads, features, final_logits, threshold)
+        table.append({
+            "threshold": threshold,
+            "accuracy": float((predictions == labels).mean()),
+            "accuracy_drop": full_accuracy - float((predictions == labels).mean()),
+            "mean_layers": float(layers.mean()),
+            "compute_saved": 1.0 - float(layers.mean()) / n_layers
+        })
+
+    within = [row for row in table if row["accuracy_drop"] <= max_drop]
+    # Ties go to the higher, safer threshold
+    chosen = max(within, key=lambda row: (row["compute_saved"], row["threshold"])) if within else None
+    return (chosen["threshold"] if chosen else None), full_accuracy, table
+
+
+def add_early_exit(model_dir, train_df, test_df, max_drop=MAX_ACCURACY_DROP, epochs=EPOCHS):
+    """Train, calibrate and save exit heads for the model in `model_dir`"""
+    from transformers import DistilBertTokenizerFast, DistilBertForSequenceClassification
+
+    tokenizer = DistilBertTokenizerFast.from_pretrained(model_dir)
+    model = DistilBertForSequenceClassification.from_pretrained(model_dir)
+    if model.config.n_layers < 2:
+        raise ValueError("Early exit needs a model with at least 2 layers")
+
+    print(f"📥 Collecting per-layer features from {model_dir}...")
+    train_features, train_logits = collect_features(model, tokenizer, train_df["text"].tolist())
+    test_features, test_logits = collect_features(model, tokenizer, test_df["text"].tolist())
+
+    print(f"🚀 Training {model.config.n_layers - 1} exit heads...")
+    heads = train_heads(build_heads(model), train_features, train_logits, train_df["label_id"].to_numpy(), epochs)
+
+    threshold, full_accuracy, table = calibrate(heads, test_features, test_logits, test_df["label_id"].to_numpy(), max_drop)
+    print(f"\n{'threshold':>10}{'accuracy':>10}{'layers':>8}{'saved':>8}")
+    for row in table[:-2:5] + table[-2:]:
+        print(f"{row['threshold']:>10.3f}{row['accuracy']:>10.4f}{row['mean_layers']:>8.2f}{row['compute_saved']:>8.1%}")
+    if threshold is None:
+        # Keep the heads but leave exiting effectively off
+        threshold = 1.0
+        print(f"⚠️ No threshold keeps accuracy within {max_drop:.3f} of the full model; saved with threshold 1.0")
+    else:
+        chosen = next(row for row in table if row["threshold"] == threshold)
+        print(f"\n📊 Full model accuracy: {full_accuracy:.4f}")
+        print(f"📊 Threshold {threshold}: accuracy {chosen['accuracy']:.4f}, "
+              f"{chosen['mean_layers']:.2f}/{model.config.n_layers} layers, {chosen['compute_saved']:.1%} compute saved")
+
+    torch.save(heads.state_dict(), os.path.join(model_dir, HEADS_WEIGHTS_NAME))
+    with open(os.path.join(model_dir, HEADS_CONFIG_NAME), "w") as f:
+        json.dump({
+            "n_layers": model.config.n_layers,
+            "threshold": threshold,
+            "max_accuracy_drop": max_drop,
+            "full_accuracy": full_accuracy,
+            "base_fingerprint": base_fingerprint(model_dir),
+            "calibration": table
+        }, f, indent=2)
+    print(f"✅ Exit heads saved to {model_dir}")
+    return threshold
+
+
+# -----------------------------------------
+# Inference
+# -----------------------------------------
+class _AllExited(Exception):
+    """Raised from a layer hook to skip the remaining layers"""
+
+
+class _ExitState:
+    def __init__(self, batch_size, num_labels, n_layers, threshold):
+        self.threshold = threshold
+        self.logits = torch.empty(batch_size, num_labels)
+        self.layers = torch.full((batch_size,), n_layers)
+        self.done = torch.zeros(batch_size, dtype=torch.bool)
+
+
+class EarlyExitBackend(TorchBackend):
+    """TorchBackend answering each remark at its first confident exit head"""
+
+    name = "torch-early-exit"
+
+    def __init__(self, model, device, heads, threshold):
+        super().__init__(model, device)
+        self.heads = heads.to(device).eval()
+        self.threshold = threshold
+        self.n_layers = model.config.n_layers
+        # Hooks stay registered; they only act while a call on their own
+        # thread has set its state, so concurrent batches do not interfere
+        self._local = threading.local()
+        for index, layer in enumerate(model.distilbert.transformer.layer[:-1]):
+            layer.register_forward_hook(self._hook(index))
+
+    def _hook(self, index):
+        def hook(module, args, output):
+            state = getattr(self._local, "state", None)
+            if state is None:
+                return
+            hidden = output[0] if isinstance(output, tuple) else output
+            logits = self.heads[index](hidden[:, 0]).float().cpu()
+            confidence = F.softmax(logits, dim=-1).max(-1).values
+            newly = ~state.done & (confidence >= state.threshold)
+            if newly.any():
+                state.logits[newly] = logits[newly]
+                state.layers[newly] = index + 1
+                state.done |= newly
+                if state.done.all():
+                    raise _AllExited()
+        return hook
+
+    def logits_with_exits(self, input_ids, attention_mask):
+        """
+        Returns:
+            (logits, layers run per remark) CPU tensors
+        """
+        state = _ExitState(input_ids.shape[0], self.config.num_labels, self.n_layers, self.threshold)
+        self._local.state = state
+        try:
+            with torch.no_grad():
+                logits = self.model(
+                    input_ids=input_ids.to(self.device),
+                    attention_mask=attention_mask.to(self.device)
+                ).logits.cpu()
+            state.logits[~state.done] = logits[~state.done]
+        except _AllExited:
+            pass
+        finally:
+            self._local.state = None
+        return state.logits, state.layers
+
+    def logits(self, input_ids, attention_mask):
+        return self.logits_with_exits(input_ids, attention_mask)[0]
+
+
+def load_early_exit(backend, model_dir, threshold=None):
+    """
+    Wrap a TorchBackend in EarlyExitBackend if `model_dir` has exit heads
+
+    Returns `backend` unchanged when there are no heads, or when they were
+    trained for other weights.
+    """
+    config_path = os.path.join(str(model_dir), HEADS_CONFIG_NAME)
+    if not os.path.isfile(config_path):
+        return backend
+    with open(config_path, "r") as f:
+        config = json.load(f)
+    if config["base_fingerprint"] != base_fingerprint(model_dir):
+        print(f"⚠️ Early-exit heads in {model_dir} were trained for other weights, ignoring them")
+        return backend
+
+    heads = build_heads(backend.model)
+    heads.load_state_dict(torch.load(os.path.join(model_dir, HEADS_WEIGHTS_NAME), map_location="cpu"))
+    return EarlyExitBackend(
+        backend.model, backend.device, heads,
+        config["threshold"] if threshold is None else threshold
+    )
+
+
+def main():
+    from training_data import TRAIN_CSV, load_training_data, stratified_split
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', type=str, default=TRAIN_CSV, help='Training CSV')
+    parser.add_argument('--model', type=str, default="./model", help='Trained model directory')
+    parser.add_argument('--epochs', type=int, default=EPOCHS, help='Head training epochs')
+    parser.add_argument('--max-accuracy-drop', type=float, default=MAX_ACCURACY_DROP,
+                        help='Allowed accuracy loss vs the full model when picking the threshold')
+    args = parser.parse_args()
+
+    df = load_training_data(args.data)
+    train_df, test_df = stratified_split(df)
+    print(f"📊 Train: {len(train_df)} | Test: {len(test_df)}")
+    add_early_exit(args.model, train_df, test_df, args.max_accuracy_drop, args.epochs)
+
+
+if __name__ == "__main__":
+    main()
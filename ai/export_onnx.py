@@ -0,0 +1,171 @@
+"""
+export_onnx.py
+
+Export the trained classifier to ONNX for the `onnx` inference backend.
+This script:
+1. Loads ./model (or the MODEL_ID snapshot) with its tokenizer
+2. Exports it to ONNX with dynamic batch and sequence axes
+3. Runs every remark in data/train.csv through PyTorch and ONNX Runtime
+   and fails if the logits differ by more than --atol
+4. Publishes model.onnx, the tokenizer and export metadata to --output
+   only if the check passed (the export is staged next to it until then)
+
+Serve it with INFERENCE_BACKEND=onnx ONNX_MODEL_PATH=<output>.
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import torch
+import numpy as np
+from datetime import datetime
+from dotenv import load_dotenv
+from transformers import DistilBertTokenizerFast, DistilBertForSequenceClassification
+from backends import OnnxBackend, ONNX_FILE_NAME
+from training_data import TRAIN_CSV, load_training_data
+
+load_dotenv()
+
+DEFAULT_MODEL = "./model" if os.path.isdir("./model") else os.getenv("MODEL_ID", "finPal/distilbert")
+DEFAULT_OUTPUT = "./model/onnx"
+OPSET = 17
+VERIFY_BATCH_SIZE = 64
+
+
+class LogitsOnly(torch.nn.Module):
+    """Return a plain logits tensor so the exported graph has one output"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask).logits
+
+
+def export(model, tokenizer, output_dir, opset=OPSET):
+    os.makedirs(output_dir, exist_ok=True)
+    onnx_path = os.path.join(output_dir, ONNX_FILE_NAME)
+
+    sample = tokenizer(
+        ["netflix subscription monthly", "electricity bill payment for january"],
+        padding=True,
+        return_tensors="pt"
+    )
+
+    print(f"📦 Exporting to {onnx_path} (opset {opset})...")
+    # The wrapper must be in eval mode too: export restores its training
+    # flag afterwards, which would otherwise switch dropout back on
+    torch.onnx.export(
+        LogitsOnly(model).eval(),
+        (sample["input_ids"], sample["attention_mask"]),
+        onnx_path,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["logits"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "logits": {0: "batch"}
+        },
+        opset_version=opset,
+        do_constant_folding=True,
+        dynamo=False
+    )
+
+    tokenizer.save_pretrained(output_dir)
+    model.config.save_pretrained(output_dir)
+    return onnx_path
+
+
+def compare_logits(model, tokenizer, session, texts, batch_size=VERIFY_BATCH_SIZE):
+    """Max absolute logit difference and argmax agreement over `texts`"""
+    max_diff = 0.0
+    agree = 0
+
+    # Sort by length so each batch is padded as little as possible
+    texts = sorted(texts, key=len)
+    for start in range(0, len(texts), batch_size):
+        inputs = tokenizer(
+            texts[start:start + batch_size],
+            truncation=True,
+            max_length=128,
+            padding=True,
+            return_tensors="pt"
+        )
+        with torch.no_grad():
+            torch_logits = model(**inputs).logits.numpy()
+        onnx_logits = session.logits(inputs["input_ids"], inputs["attention_mask"]).numpy()
+
+        max_diff = max(max_diff, float(np.abs(torch_logits - onnx_logits).max()))
+        agree += int((torch_logits.argmax(-1) == onnx_logits.argmax(-1)).sum())
+
+    return max_diff, agree / len(texts)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', type=str, default=DEFAULT_MODEL, help='Model directory or hub id')
+    parser.add_argument('--output', type=str, default=DEFAULT_OUTPUT, help='Output directory')
+    parser.add_argument('--data', type=str, default=TRAIN_CSV, help='CSV used to check the export')
+    parser.add_argument('--opset', type=int, default=OPSET, help='ONNX opset version')
+    parser.add_argument('--atol', type=float, default=1e-3, help='Max allowed logit difference')
+    args = parser.parse_args()
+
+    print("\n" + "="*60)
+    print("📤 ONNX EXPORT")
+    print("="*60 + "\n")
+
+    print(f"📥 Loading model from {args.model}...")
+    hf_token = os.getenv("HF_TOKEN")
+    tokenizer = DistilBertTokenizerFast.from_pretrained(args.model, token=hf_token)
+    model = DistilBertForSequenceClassification.from_pretrained(
+        args.model,
+        token=hf_token,
+        attn_implementation="eager"
+    )
+    model.eval()
+
+    # Export next to --output and publish only once verified
+    output_dir = args.output.rstrip("/")
+    staging_dir = output_dir + ".staging"
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    export(model, tokenizer, staging_dir, args.opset)
+
+    print("🔍 Comparing ONNX Runtime and PyTorch logits...")
+    session = OnnxBackend(staging_dir)
+    texts = load_training_data(args.data)["text"].tolist()
+    max_diff, agreement = compare_logits(model, tokenizer, session, texts)
+
+    print(f"   Remarks checked: {len(texts)}")
+    print(f"   Max |logit diff|: {max_diff:.2e}")
+    print(f"   Argmax agreement: {agreement:.4%}")
+
+    metadata = {
+        "exported_at": datetime.now().isoformat(),
+        "source_model": args.model,
+        "opset": args.opset,
+        "verified_on": args.data,
+        "verified_samples": len(texts),
+        "max_abs_logit_diff": max_diff,
+        "argmax_agreement": agreement
+    }
+    if max_diff > args.atol:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        print(f"\n❌ Logit difference {max_diff:.2e} exceeds tolerance {args.atol:.0e}, export NOT published")
+        sys.exit(1)
+
+    with open(os.path.join(staging_dir, "export_metadata.json"), "w") as f:
+        json.dump(metadata, f, indent=2)
+
+    del session
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(staging_dir, output_dir)
+
+    print(f"\n✅ Exported and verified: {os.path.join(output_dir, ONNX_FILE_NAME)}")
+    print(f"💡 Serve with: INFERENCE_BACKEND=onnx ONNX_MODEL_PATH={args.output}")
+
+
+if __name__ == "__main__":
+    main()
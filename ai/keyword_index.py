@@ -0,0 +1,271 @@
+"""
+keyword_index.py
+
+Merchant / keyword index that settles obvious remarks before the transformer.
+
+Patterns are word n-grams mined from data/train.csv plus a curated keyword
+list. Each pattern maps to a label2id category with a precision estimate:
+the Laplace-smoothed share of training remarks containing the pattern that
+carry its label, counted from real matches only. Only patterns at or above
+--min-precision are kept, except curated keywords with fewer than
+--min-support training matches that all agree with them, which are kept
+unscored; other curated keywords below the bar are dropped and listed.
+The probability served for a curated keyword adds pseudo-votes for its
+category as a prior. At serving time the patterns are compiled into a
+token trie; a remark is answered from the index when a kept pattern
+matches and no other kept pattern disagrees. A serving threshold stricter
+than the one the index was built with (KEYWORD_MIN_PRECISION) also drops
+the unscored keywords.
+
+Usage:
+    python keyword_index.py --output ./model/keyword_index.json
+"""
+
+import re
+import json
+import argparse
+from collections import Counter, defaultdict
+
+# Curated merchants / keywords and the category they usually settle
+CURATED_KEYWORDS = {
+    "uber": "transportation",
+    "lyft": "transportation",
+    "taxi": "transportation",
+    "metro card": "transportation",
+    "netflix": "subscriptions",
+    "spotify": "subscriptions",
+    "walmart": "shopping",
+    "grocery": "food & dining",
+    "restaurant": "food & dining",
+    "electricity bill": "utilities",
+    "water bill": "utilities",
+    "internet bill": "utilities",
+    "rent": "rent",
+    "tuition": "education",
+    "pharmacy": "healthcare",
+    "doctor": "healthcare",
+    "income tax": "tax",
+    "property tax": "tax",
+    "insurance premium": "insurance",
+    "movie": "entertainment"
+}
+CURATED_PSEUDO_VOTES = 5
+
+MAX_NGRAM = 2
+MIN_SUPPORT = 5
+MIN_PRECISION = 0.9
+
+_TOKEN_RE = re.compile(r"[a-z0-9&']+")
+_TERMINAL = ""
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(str(text).lower())
+
+
+def ngrams(tokens, max_n=MAX_NGRAM):
+    for n in range(1, max_n + 1):
+        for start in range(len(tokens) - n + 1):
+            yield " ".join(tokens[start:start + n])
+
+
+def build_patterns(texts, label_ids, label2id, max_ngram=MAX_NGRAM,
+                   min_support=MIN_SUPPORT, min_precision=MIN_PRECISION,
+                   curated=CURATED_KEYWORDS):
+    """Mine n-gram patterns and score them; returns the kept pattern dicts"""
+    counts = defaultdict(Counter)
+    for text, label_id in zip(texts, label_ids):
+        for gram in set(ngrams(tokenize(text), max_ngram)):
+            counts[gram][int(label_id)] += 1
+
+    curated_ids = {
+        " ".join(tokenize(keyword)): label2id[category]
+        for keyword, category in curated.items()
+        if category in label2id
+    }
+
+    patterns = []
+    for gram in set(counts) | set(curated_ids):
+        votes = Counter(counts.get(gram, {}))
+        support = sum(votes.values())
+        curated_pattern = gram in curated_ids
+        if not curated_pattern and support < min_support:
+            continue
+
+        if curated_pattern:
+            label_id, top = curated_ids[gram], votes[curated_ids[gram]]
+        else:
+            label_id, top = votes.most_common(1)[0]
+        # Precision from real matches only; pseudo-votes only shape the
+        # probability served for a curated keyword
+        precision = (top + 1) / (support + 2)
+        # Too rare to measure and never contradicted: trust the curation
+        unscored = curated_pattern and support < min_support and top == support
+        if precision < min_precision and not unscored:
+            if curated_pattern:
+                print(f"⚠️ Dropping curated keyword {gram!r}: precision {precision:.3f} "
+                      f"on {support} training remarks is below {min_precision}")
+            continue
+
+        pseudo = CURATED_PSEUDO_VOTES if curated_pattern else 0
+        patterns.append({
+            "pattern": gram,
+            "label_id": label_id,
+            "precision": round(precision, 4),
+            "confidence": round((top + pseudo + 1) / (support + pseudo + 2), 4),
+            "support": support,
+            "curated": curated_pattern,
+            "unscored": unscored,
+            "label_counts": {str(k): v for k, v in sorted(counts.get(gram, {}).items())}
+        })
+
+    patterns.sort(key=lambda p: (-p["precision"], -p["support"], p["pattern"]))
+    return patterns
+
+
+class KeywordIndex:
+    """Token trie over scored patterns"""
+
+    def __init__(self, patterns, num_labels, min_precision=MIN_PRECISION, keep_unscored=True):
+        self.num_labels = num_labels
+        self.min_precision = min_precision
+        self.patterns = [
+            p for p in patterns
+            if p["precision"] >= min_precision or (keep_unscored and p.get("unscored"))
+        ]
+        self._root = {}
+
+        for entry in self.patterns:
+            node = self._root
+            for token in entry["pattern"].split(" "):
+                node = node.setdefault(token, {})
+            node[_TERMINAL] = entry
+
+    def __len__(self):
+        return len(self.patterns)
+
+    @classmethod
+    def load(cls, path, min_precision=None):
+        with open(path, "r") as f:
+            data = json.load(f)
+        threshold = max(data["min_precision"], min_precision or 0.0)
+        # Unscored keywords only met the build-time bar on trust; a stricter
+        # serving threshold has nothing to check them against, so drops them
+        return cls(data["patterns"], data["num_labels"], threshold,
+                   keep_unscored=threshold <= data["min_precision"])
+
+    def save(self, path, metadata=None):
+        with open(path, "w") as f:
+            json.dump({
+                "min_precision": self.min_precision,
+                "num_labels": self.num_labels,
+                **(metadata or {}),
+                "patterns": self.patterns
+            }, f, indent=2)
+
+    def matches(self, text):
+        """Every kept pattern occurring in `text` as whole tokens"""
+        tokens = tokenize(text)
+        found = []
+        for start in range(len(tokens)):
+            node = self._root
+            for token in tokens[start:]:
+                node = node.get(token)
+                if node is None:
+                    break
+                if _TERMINAL in node:
+                    found.append(node[_TERMINAL])
+        return found
+
+    def lookup(self, text):
+        """
+        Ranking for `text` if the index settles it, else None
+
+        Returns:
+            (probs, label_ids) ranked highest first, like the model path
+        """
+        found = self.matches(text)
+        if not found or len({entry["label_id"] for entry in found}) > 1:
+            return None
+
+        best = max(found, key=lambda entry: (entry["precision"], entry["support"]))
+        return self.ranking(best)
+
+    def ranking(self, entry):
+        """Spread the pattern's confidence and leftover mass into a full ranking"""
+        label_id = entry["label_id"]
+        confidence = entry.get("confidence", entry["precision"])
+        others = {
+            int(k): v for k, v in entry["label_counts"].items() if int(k) != label_id
+        }
+        remainder = 1.0 - confidence
+        total = sum(others.values())
+
+        probs = [0.0] * self.num_labels
+        probs[label_id] = confidence
+        for i in range(self.num_labels):
+            if i == label_id:
+                continue
+            if total:
+                probs[i] = remainder * others.get(i, 0) / total
+            else:
+                probs[i] = remainder / (self.num_labels - 1)
+
+        order = sorted(range(self.num_labels), key=lambda i: -probs[i])
+        return tuple(probs[i] for i in order), tuple(order)
+
+
+def main():
+    from training_data import TRAIN_CSV, load_training_data, load_label_map, stratified_split
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', type=str, default=TRAIN_CSV, help='Training CSV')
+    parser.add_argument('--output', type=str, default="./model/keyword_index.json", help='Index file')
+    parser.add_argument('--max-ngram', type=int, default=MAX_NGRAM)
+    parser.add_argument('--min-support', type=int, default=MIN_SUPPORT, help='Min remarks per mined pattern')
+    parser.add_argument('--min-precision', type=float, default=MIN_PRECISION, help='Min precision kept')
+    args = parser.parse_args()
+
+    id2label, label2id = load_label_map()
+    df = load_training_data(args.data)
+    train_df, test_df = stratified_split(df)
+
+    print(f"🔎 Mining patterns from {len(train_df)} training remarks...")
+    patterns = build_patterns(
+        train_df["text"], train_df["label_id"], label2id,
+        max_ngram=args.max_ngram,
+        min_support=args.min_support,
+        min_precision=args.min_precision
+    )
+    index = KeywordIndex(patterns, len(id2label), args.min_precision)
+
+    # Held-out estimate of how often the fast path fires and how often it is right
+    answered = correct = 0
+    for text, label_id in zip(test_df["text"], test_df["label_id"]):
+        ranked = index.lookup(text)
+        if ranked is not None:
+            answered += 1
+            correct += int(ranked[1][0] == label_id)
+
+    coverage = answered / len(test_df)
+    precision = correct / answered if answered else 0.0
+    print(f"📊 Patterns kept: {len(index)} ({sum(p['curated'] for p in patterns)} curated, "
+          f"{sum(p['unscored'] for p in patterns)} of them unscored for lack of training remarks)")
+    print(f"📊 Test coverage: {coverage:.2%} | Test precision: {precision:.2%}")
+    for entry in index.patterns[:10]:
+        print(f"   {entry['pattern']!r:<28} → {id2label[entry['label_id']]:<20} {entry['precision']:.3f} (n={entry['support']})")
+    unscored = [entry["pattern"] for entry in index.patterns if entry.get("unscored")]
+    if unscored:
+        print(f"   unscored curated: {', '.join(sorted(unscored))}")
+
+    index.save(args.output, {
+        "test_coverage": coverage,
+        "test_precision": precision,
+        "max_ngram": args.max_ngram,
+        "min_support": args.min_support
+    })
+    print(f"\n✅ Keyword index saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+linear_cascade.py
+
+Cheap TF-IDF + logistic regression first stage for the prediction cascade.
+
+The linear model is trained on the same labels and stratified split as
+train.py. Remarks whose top linear probability reaches the calibrated
+threshold are answered directly; the rest go on to DistilBERT. The
+threshold is the lowest one (most remarks answered by the linear model)
+that keeps cascade accuracy on the test split within --max-accuracy-drop
+of DistilBERT alone.
+
+Usage:
+    python linear_cascade.py --model ./model --output ./model/linear_cascade.joblib
+"""
+
+import json
+import argparse
+import joblib
+import numpy as np
+
+DEFAULT_OUTPUT = "./model/linear_cascade.joblib"
+MAX_ACCURACY_DROP = 0.005
+
+
+class LinearCascade:
+    """First cascade stage: answers remarks the linear model is sure about"""
+
+    def __init__(self, pipeline, threshold, num_labels):
+        self.pipeline = pipeline
+        self.threshold = threshold
+        self.num_labels = num_labels
+        # predict_proba columns follow pipeline.classes_, which are label ids
+        self.classes = np.asarray(pipeline.classes_, dtype=int)
+
+    @classmethod
+    def load(cls, path, threshold=None):
+        data = joblib.load(path)
+        if threshold is None:
+            threshold = data["threshold"]
+        return cls(data["pipeline"], threshold, data["num_labels"])
+
+    def save(self, path, metadata=None):
+        joblib.dump({
+            "pipeline": self.pipeline,
+            "threshold": self.threshold,
+            "num_labels": self.num_labels,
+            "metadata": metadata or {}
+        }, path)
+
+    def probabilities(self, texts):
+        """(n, num_labels) probabilities indexed by label id"""
+        probs = np.zeros((len(texts), self.num_labels))
+        probs[:, self.classes] = self.pipeline.predict_proba(texts)
+        return probs
+
+    def rank(self, texts):
+        """
+        Rankings for remarks the linear model is confident about
+
+        Returns:
+            list with a (probs, label_ids) ranking, or None below threshold
+        """
+        if not texts:
+            return []
+
+        probs = self.probabilities(texts)
+        order = np.argsort(-probs, axis=1)
+        ranked = []
+        for row, row_order in zip(probs, order):
+            if row[row_order[0]] < self.threshold:
+                ranked.append(None)
+            else:
+                ranked.append((tuple(row[row_order].tolist()), tuple(row_order.tolist())))
+        return ranked
+
+
+def build_pipeline():
+    from sklearn.pipeline import make_pipeline, make_union
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+
+    return make_pipeline(
+        make_union(
+            TfidfVectorizer(lowercase=True, ngram_range=(1, 2), sublinear_tf=True),
+            TfidfVectorizer(lowercase=True, analyzer="char_wb", ngram_range=(2, 5), sublinear_tf=True)
+        ),
+        LogisticRegression(C=10.0, max_iter=2000, class_weight="balanced")
+    )
+
+
+def transformer_predictions(model_path, texts, batch_size=64):
+    """DistilBERT argmax predictions for `texts`, in order"""
+    import torch
+    from transformers import DistilBertTokenizerFast, DistilBertForSequenceClassification
+
+    tokenizer = DistilBertTokenizerFast.from_pretrained(model_path)
+    model = DistilBertForSequenceClassification.from_pretrained(model_path)
+    model.eval()
+
+    predictions = []
+    for start in range(0, len(texts), batch_size):
+        inputs = tokenizer(
+            texts[start:start + batch_size],
+            truncation=True,
+            max_length=128,
+            padding=True,
+            return_tensors="pt"
+        )
+        with torch.no_grad():
+            predictions.extend(model(**inputs).logits.argmax(-1).tolist())
+    return np.asarray(predictions)
+
+
+def calibrate_threshold(linear_probs, transformer_pred, labels, max_drop):
+    """
+    Lowest threshold keeping cascade accuracy within `max_drop` of the transformer
+
+    Returns:
+        (threshold, cascade_accuracy, linear_coverage)
+    """
+    linear_pred = linear_probs.argmax(axis=1)
+    confidence = linear_probs.max(axis=1)
+    target = (transformer_pred == labels).mean() - max_drop
+
+    best = (1.0 + 1e-9, (transformer_pred == labels).mean(), 0.0)
+    for threshold in sorted(set(np.round(confidence, 4).tolist()), reverse=True):
+        use_linear = confidence >= threshold
+        cascade_pred = np.where(use_linear, linear_pred, transformer_pred)
+        accuracy = (cascade_pred == labels).mean()
+        if accuracy < target:
+            break
+        best = (threshold, accuracy, use_linear.mean())
+    return best
+
+
+def main():
+    from sklearn.metrics import accuracy_score, f1_score
+    from training_data import TRAIN_CSV, load_training_data, load_label_map, stratified_split
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', type=str, default=TRAIN_CSV, help='Training CSV')
+    parser.add_argument('--model', type=str, default="./model", help='DistilBERT model used for calibration')
+    parser.add_argument('--output', type=str, default=DEFAULT_OUTPUT, help='Where to save the cascade stage')
+    parser.add_argument('--max-accuracy-drop', type=float, default=MAX_ACCURACY_DROP,
+                        help='Allowed cascade accuracy loss vs DistilBERT alone')
+    args = parser.parse_args()
+
+    id2label, _ = load_label_map()
+    df = load_training_data(args.data)
+    train_df, test_df = stratified_split(df)
+    print(f"📊 Train: {len(train_df)} | Test: {len(test_df)}")
+
+    print("🚀 Fitting TF-IDF + logistic regression...")
+    pipeline = build_pipeline()
+    pipeline.fit(train_df["text"].tolist(), train_df["label_id"].to_numpy())
+    cascade = LinearCascade(pipeline, 1.0, len(id2label))
+
+    test_texts = test_df["text"].tolist()
+    labels = test_df["label_id"].to_numpy()
+    linear_probs = cascade.probabilities(test_texts)
+    linear_pred = linear_probs.argmax(axis=1)
+    print(f"📊 Linear accuracy: {accuracy_score(labels, linear_pred):.4f} | "
+          f"F1 (weighted): {f1_score(labels, linear_pred, average='weighted'):.4f}")
+
+    print(f"📥 Scoring test split with DistilBERT from {args.model}...")
+    transformer_pred = transformer_predictions(args.model, test_texts)
+    transformer_accuracy = (transformer_pred == labels).mean()
+
+    threshold, cascade_accuracy, coverage = calibrate_threshold(
+        linear_probs, transformer_pred, labels, args.max_accuracy_drop
+    )
+    cascade.threshold = threshold
+
+    print(f"\n📊 DistilBERT accuracy: {transformer_accuracy:.4f}")
+    print(f"📊 Cascade accuracy:   {cascade_accuracy:.4f} (threshold {threshold:.4f})")
+    print(f"📊 Answered by linear: {coverage:.2%}")
+
+    metadata = {
+        "threshold": threshold,
+        "max_accuracy_drop": args.max_accuracy_drop,
+        "linear_accuracy": float(accuracy_score(labels, linear_pred)),
+        "transformer_accuracy": float(transformer_accuracy),
+        "cascade_accuracy": float(cascade_accuracy),
+        "linear_coverage": float(coverage),
+        "calibrated_with": args.model,
+        "test_samples": len(test_df)
+    }
+    cascade.save(args.output, metadata)
+    with open(args.output.rsplit(".", 1)[0] + "_metadata.json", "w") as f:
+        json.dump(metadata, f, indent=2)
+
+    print(f"\n✅ Linear cascade stage saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+# ai/metrics.py
+"""
+Prometheus text-format metrics for api.py and app.py.
+
+predict.py times each inference stage (tokenize, forward, softmax/top-k)
+and the forward batch size. TimedJSONResponse times JSON serialization, and
+MetricsMiddleware times every request end to end. Gauges such as queue
+depth, cache hit ratio, model version and RSS are registered as callbacks
+and read only when /metrics is scraped.
+
+Recording a sample is one bisect and one locked increment, so collection
+can stay on in production.
+"""
+import os
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from starlette.responses import JSONResponse, Response
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by label values"""
+
+    def __init__(self, name, help, buckets, labelnames=()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+        register(self)
+
+    def observe(self, value, *labelvalues):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                # counts per bucket plus +Inf, then the running sum
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, *labelvalues):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labelvalues)
+
+    def render(self):
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labelvalues, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                labels = _format_labels(self.labelnames, labelvalues, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {series[-1]!r}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Callback:
+    """Gauge or counter whose value is read from `read()` at scrape time"""
+
+    def __init__(self, name, help, read, kind="gauge", labelnames=()):
+        """
+        Args:
+            read: Returns a number, or a {label values tuple: number} dict
+            kind: "gauge" or "counter"
+        """
+        self.name = name
+        self.help = help
+        self.read = read
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        register(self)
+
+    def render(self):
+        try:
+            value = self.read()
+        except Exception:
+            return []
+        if value is None:
+            return []
+        values = value if isinstance(value, dict) else {(): value}
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labelvalues, number in sorted(values.items()):
+            if number is None:
+                continue
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(number)}")
+        return lines
+
+
+def register(metric):
+    """Add a metric to /metrics, replacing any earlier one with its name"""
+    with _registry_lock:
+        _registry[:] = [m for m in _registry if m.name != metric.name]
+        _registry.append(metric)
+    return metric
+
+
+def render():
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def resident_memory_bytes():
+    """Current RSS of this process (Linux), else None"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+# -----------------------------------------
+# Metrics
+# -----------------------------------------
+STAGE_SECONDS = Histogram(
+    "finpal_inference_stage_seconds",
+    "Time spent per inference stage (tokenize, forward, softmax_topk, serialize)",
+    STAGE_BUCKETS,
+    ("stage",)
+)
+BATCH_SIZE = Histogram(
+    "finpal_inference_batch_size",
+    "Remarks per model forward pass",
+    BATCH_BUCKETS
+)
+REQUEST_SECONDS = Histogram(
+    "finpal_request_duration_seconds",
+    "End-to-end HTTP request latency",
+    REQUEST_BUCKETS,
+    ("path", "status")
+)
+Callback(
+    "finpal_process_resident_memory_bytes",
+    "Resident set size of the serving process",
+    resident_memory_bytes
+)
+
+
+# -----------------------------------------
+# HTTP
+# -----------------------------------------
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse recording its serialization time as the serialize stage"""
+
+    def render(self, content):
+        start = time.perf_counter()
+        body = super().render(content)
+        STAGE_SECONDS.observe(time.perf_counter() - start, "serialize")
+        return body
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing each HTTP request until its response is sent"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = ["500"]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Label by route template so ids in the path cannot add series
+            path = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.observe(time.perf_counter() - start, path, status[0])
+
+
+def install(app):
+    """Add request timing and the /metrics route to a FastAPI app"""
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return Response(render(), media_type=CONTENT_TYPE)
@@ -1,13 +1,48 @@
 #ai/predict.py
-import torch
 import json
-import re
 import os
 import sys
+
+# CLI fast path: if a predict_daemon.py is running, let it classify the text
+# and skip importing torch/transformers and loading the model here
+if __name__ == "__main__" and len(sys.argv) > 2 and sys.argv[1] == "--predict":
+    from predict_daemon import query_daemon
+    daemon_result = query_daemon(sys.argv[2])
+    if daemon_result is not None:
+        if "error" in daemon_result:
+            print(json.dumps(daemon_result), file=sys.stderr)
+            sys.exit(1)
+        print(json.dumps(daemon_result))
+        sys.exit(0)
+
+import torch
+import re
+import hashlib
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
 from transformers import DistilBertTokenizerFast, DistilBertForSequenceClassification
 import torch.nn.functional as F
 from dotenv import load_dotenv
 import warnings
+from prediction_cache import PredictionCache
+from prediction_store import PredictionStore
+from keyword_index import KeywordIndex
+from linear_cascade import LinearCascade
+from shadow import ShadowScorer
+import metrics
+import profiling
+from backends import (
+    BACKENDS,
+    TorchBackend,
+    OnnxBackend,
+    ONNX_FILE_NAME,
+    QUANTIZED_WEIGHTS_NAME,
+    is_quantized_model_dir,
+    load_quantized_model
+)
+from early_exit import EarlyExitBackend, HEADS_WEIGHTS_NAME, load_early_exit
 
 # Suppress all warnings when running in CLI mode
 if len(sys.argv) > 2 and sys.argv[1] == "--predict":
@@ -21,6 +56,13 @@ load_dotenv()
 HF_TOKEN = os.getenv("HF_TOKEN")
 MODEL_ID = os.getenv("MODEL_ID", "finPal/distilbert")
 
+# Inference backend: "torch" runs MODEL_ID eagerly (fp32, or int8 when it
+# points at a quantize.py output), "onnx" runs an export_onnx.py or
+# quantize.py --mode static output in ONNX_MODEL_PATH through ONNX Runtime
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch").lower()
+ONNX_MODEL_PATH = os.getenv("ONNX_MODEL_PATH", "./model/onnx")
+ONNX_NUM_THREADS = int(os.getenv("ONNX_NUM_THREADS", "0"))
+
 # Load label mapping
 LABEL_MAP_FILE = "label_map.json"
 try:
@@ -40,11 +82,333 @@ except FileNotFoundError:
 id2label = {int(k): v for k, v in maps["id2label"].items()}
 label2id = {v: int(k) for k, v in maps["id2label"].items()}
 
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+MAX_LENGTH = 128
+PREDICT_BATCH_SIZE = int(os.getenv("PREDICT_BATCH_SIZE", "32"))
+
+# Prediction cache keyed on preprocess_text() output; size 0 disables it
+cache = PredictionCache(
+    max_entries=int(os.getenv("PREDICTION_CACHE_SIZE", "10000")),
+    max_bytes=int(float(os.getenv("PREDICTION_CACHE_MB", "64")) * 1024 * 1024)
+)
+
+# Optional on-disk store shared across processes and restarts
+PREDICTION_STORE_PATH = os.getenv("PREDICTION_STORE_PATH")
+store = PredictionStore(PREDICTION_STORE_PATH) if PREDICTION_STORE_PATH else None
+# Revisions no process used for this long are deleted on model swaps; 0 disables
+PREDICTION_STORE_MAX_AGE_DAYS = float(os.getenv("PREDICTION_STORE_MAX_AGE_DAYS", "7"))
+
+# Optional keyword index (built by keyword_index.py) answering obvious remarks
+KEYWORD_INDEX_PATH = os.getenv("KEYWORD_INDEX_PATH", "./model/keyword_index.json")
+KEYWORD_MIN_PRECISION = float(os.getenv("KEYWORD_MIN_PRECISION", "0"))
+keyword_index = (
+    KeywordIndex.load(KEYWORD_INDEX_PATH, KEYWORD_MIN_PRECISION)
+    if os.path.isfile(KEYWORD_INDEX_PATH) else None
+)
+
+# Optional TF-IDF linear first stage (built by linear_cascade.py); remarks it
+# is not confident about fall through to the transformer
+LINEAR_CASCADE_PATH = os.getenv("LINEAR_CASCADE_PATH", "./model/linear_cascade.joblib")
+LINEAR_CASCADE_THRESHOLD = os.getenv("LINEAR_CASCADE_THRESHOLD")
+linear_cascade = (
+    LinearCascade.load(
+        LINEAR_CASCADE_PATH,
+        float(LINEAR_CASCADE_THRESHOLD) if LINEAR_CASCADE_THRESHOLD else None
+    )
+    if os.path.isfile(LINEAR_CASCADE_PATH) else None
+)
+
+# Early exit, when the model directory has heads from early_exit.py:
+# unset uses their calibrated threshold, "off" runs every layer
+EARLY_EXIT_THRESHOLD = os.getenv("EARLY_EXIT_THRESHOLD")
+
+# Previously active models kept loaded for instant rollback
+MODEL_HISTORY = int(os.getenv("MODEL_HISTORY", "1"))
+
+# How many remarks each path answered: keyword index, cache, store, linear, model
+path_counts = Counter()
+# Remarks the model answered, by number of layers run
+exit_counts = Counter()
+_path_lock = threading.Lock()
+
+
+def count_path(path, n=1):
+    if n:
+        with _path_lock:
+            path_counts[path] += n
+
+
+# Files in a model directory that decide its answers. Sidecars written next
+# to them (keyword_index.json, training metadata, ...) are not hashed, so
+# rebuilding one does not change the revision and orphan the stored predictions.
+REVISION_FILES = (
+    "config.json", "tokenizer.json", "tokenizer_config.json", "special_tokens_map.json",
+    "vocab.txt", "added_tokens.json",
+    "model.safetensors", "pytorch_model.bin", ONNX_FILE_NAME, QUANTIZED_WEIGHTS_NAME
+)
+
+
+def is_revision_file(name):
+    if name in REVISION_FILES:
+        return True
+    # Sharded checkpoints: model-00001-of-00002.safetensors, pytorch_model-00001-of-00002.bin
+    return "-of-" in name and name.startswith(("model-", "pytorch_model-")) and name.endswith((".safetensors", ".bin"))
+
+
+def model_revision(model_id, model):
+    """
+    Hash identifying the loaded weights
+
+    Local model directories are hashed by the contents of their config,
+    tokenizer and weight files (and exit heads, when serving them); hub
+    models by their resolved commit.
+    """
+    digest = hashlib.sha256(str(model_id).encode())
+    early_exit = isinstance(model, EarlyExitBackend)
+
+    if os.path.isdir(model_id):
+        for name in sorted(os.listdir(model_id)):
+            path = os.path.join(model_id, name)
+            if not os.path.isfile(path) or not (is_revision_file(name) or (early_exit and name == HEADS_WEIGHTS_NAME)):
+                continue
+            digest.update(name.encode())
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+    else:
+        config = getattr(model, "config", None)
+        digest.update(str(getattr(config, "_commit_hash", None)).encode())
+
+    # Another threshold gives other answers from the same files
+    if early_exit:
+        digest.update(f"early_exit:{model.threshold}".encode())
+
+    return digest.hexdigest()[:16]
+
+
+class LoadedModel:
+    """A tokenizer and weights pair, with a count of batches running on it"""
+
+    def __init__(self, tokenizer, model, model_id, backend, revision):
+        self.tokenizer = tokenizer
+        self.model = model
+        self.model_id = model_id
+        self.backend = backend
+        self.revision = revision
+        self.loaded_at = time.time()
+        self._in_flight = 0
+        self._idle = threading.Condition()
+
+    @contextmanager
+    def use(self):
+        """Mark a batch as running on this model for the duration of the block"""
+        with self._idle:
+            self._in_flight += 1
+        try:
+            yield self
+        finally:
+            with self._idle:
+                self._in_flight -= 1
+                if not self._in_flight:
+                    self._idle.notify_all()
+
+    def drain(self, timeout=None):
+        """Wait until no batch is running on this model; False on timeout"""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._in_flight == 0, timeout)
+
+    def describe(self):
+        with self._idle:
+            in_flight = self._in_flight
+        return {
+            "version": self.revision,
+            "model_id": str(self.model_id),
+            "backend": self.backend,
+            "loaded_at": self.loaded_at,
+            "in_flight": in_flight
+        }
+
+
+def build_model(model_id=None, backend=None):
+    """Load tokenizer and weights into a LoadedModel without activating it"""
+    backend = backend or INFERENCE_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of {BACKENDS}")
+    model_id = model_id or (ONNX_MODEL_PATH if backend == "onnx" else MODEL_ID)
+
+    if backend == "onnx":
+        new_tokenizer = DistilBertTokenizerFast.from_pretrained(model_id)
+        new_model = OnnxBackend(model_id, num_threads=ONNX_NUM_THREADS)
+    elif is_quantized_model_dir(model_id):
+        # int8 variant written by quantize.py; quantized kernels are CPU only
+        new_tokenizer = DistilBertTokenizerFast.from_pretrained(model_id)
+        new_model = TorchBackend(load_quantized_model(model_id), torch.device("cpu"))
+    else:
+        new_tokenizer = DistilBertTokenizerFast.from_pretrained(model_id, use_auth_token=HF_TOKEN)
+        weights = DistilBertForSequenceClassification.from_pretrained(model_id, use_auth_token=HF_TOKEN)
+        weights.eval()
+        weights.to(device)
+        new_model = TorchBackend(weights, device)
+        if os.path.isdir(model_id) and (EARLY_EXIT_THRESHOLD or "").lower() != "off":
+            new_model = load_early_exit(
+                new_model, model_id,
+                float(EARLY_EXIT_THRESHOLD) if EARLY_EXIT_THRESHOLD else None
+            )
+
+    return LoadedModel(new_tokenizer, new_model, model_id, backend, model_revision(model_id, new_model))
+
+
+def check_labels(loaded):
+    """Refuse weights whose named labels disagree with label_map.json"""
+    config = getattr(loaded.model, "config", None)
+    names = {int(k): v for k, v in (getattr(config, "id2label", None) or {}).items()}
+    if any(name != f"LABEL_{i}" for i, name in names.items()) and names != id2label:
+        raise ValueError(f"{loaded.model_id} was trained with different labels than label_map.json")
+
+
+def warm_up(loaded):
+    """Run a few padded batches so the first real requests skip one-off setup"""
+    samples = ["warm up", "warm up " * 8, "warm up " * 32]
+    for batch_size in (1, len(samples)):
+        rank_batch(samples[:batch_size], loaded=loaded, observe=False)
+
+
+active = None
+history = deque(maxlen=max(MODEL_HISTORY, 1))
+_swap_lock = threading.Lock()
+
+
+def activate(loaded, drain_timeout=30.0):
+    """
+    Make `loaded` the model new batches run on
+
+    Batches already running keep the model they started with; the previous
+    model is drained, then kept in `history` for rollback.
+    """
+    global active
+
+    with _swap_lock:
+        previous, active = active, loaded
+        cache.clear()
+        if previous is not None:
+            if MODEL_HISTORY > 0:
+                history.append(previous)
+            # Rolling back to a kept model takes it out of the history
+            for kept in [m for m in history if m.revision == loaded.revision]:
+                history.remove(kept)
+
+    if previous is not None and not previous.drain(drain_timeout):
+        print(f"⚠️ Model {previous.revision} still busy after {drain_timeout}s")
+
+    if store is not None:
+        # Other processes may still serve older revisions from the same
+        # file, so only revisions nobody used for a while are deleted
+        with _swap_lock:
+            kept = [loaded.revision] + [m.revision for m in history]
+        for revision in kept:
+            store.touch(revision, force=True)
+        if PREDICTION_STORE_MAX_AGE_DAYS > 0:
+            store.purge_unused(PREDICTION_STORE_MAX_AGE_DAYS)
+    return previous
+
+
+def load_model(model_id=None, backend=None):
+    """Load tokenizer and weights, replace the active model and flush the cache"""
+    activate(build_model(model_id, backend))
+
+
+def reload_model(model_id=None, backend=None):
+    """Load, check and warm a model in the calling thread, then swap it in"""
+    loaded = build_model(model_id, backend)
+    check_labels(loaded)
+    warm_up(loaded)
+    activate(loaded)
+    return loaded
+
+
+def kept_model(version=None):
+    """The kept model with `version` (the most recent one by default)"""
+    with _swap_lock:
+        candidates = [m for m in history if version is None or m.revision == version]
+    if not candidates:
+        raise ValueError(f"No kept model with version {version}" if version else "No previous model kept")
+    return candidates[-1]
+
+
+def rollback(version=None):
+    """Swap back to a kept model (the most recent one by default)"""
+    loaded = kept_model(version)
+    activate(loaded)
+    return loaded
+
+
+def find_kept(model_id):
+    """A model in `history` loaded from `model_id` whose files are unchanged since, or None"""
+    with _swap_lock:
+        kept = [m for m in history if os.path.abspath(str(m.model_id)) == os.path.abspath(str(model_id))]
+    for loaded in reversed(kept):
+        if model_revision(loaded.model_id, loaded.model) == loaded.revision:
+            return loaded
+    return None
+
+
+def model_versions():
+    with _swap_lock:
+        return {
+            "active": active.describe(),
+            "history": [m.describe() for m in reversed(history)]
+        }
+
+
+# Candidate model scored in the background on a sample of live traffic
+shadow = None
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "0.05"))
+
+
+def start_shadow(model_id, backend=None, sample_rate=None):
+    """Load, check and warm a candidate, then start shadow scoring it"""
+    global shadow
+
+    candidate = build_model(model_id, backend)
+    check_labels(candidate)
+    warm_up(candidate)
+
+    scorer = ShadowScorer(
+        candidate, rank_batch, id2label,
+        sample_rate=SHADOW_SAMPLE_RATE if sample_rate is None else sample_rate
+    )
+    scorer.start()
+    previous, shadow = shadow, scorer
+    if previous is not None:
+        previous.stop()
+    return scorer
+
+
+def stop_shadow():
+    """Stop shadow scoring; returns the final stats, or None if none ran"""
+    global shadow
+
+    previous, shadow = shadow, None
+    if previous is None:
+        return None
+    previous.stop()
+    return previous.stats()
+
+
+def promote_shadow():
+    """Make the shadow candidate the active model"""
+    scorer = shadow
+    if scorer is None:
+        raise ValueError("No shadow candidate loaded")
+    stop_shadow()
+    activate(scorer.candidate)
+    return scorer.candidate
+
+
 # Load model and tokenizer
 try:
-    tokenizer = DistilBertTokenizerFast.from_pretrained(MODEL_ID, use_auth_token=HF_TOKEN)
-    model = DistilBertForSequenceClassification.from_pretrained(MODEL_ID, use_auth_token=HF_TOKEN)
-    model.eval()
+    load_model()
 except Exception as e:
     if len(sys.argv) > 2 and sys.argv[1] == "--predict":
         print(json.dumps({"error": f"Failed to load model: {str(e)}"}), file=sys.stderr)
@@ -52,9 +416,6 @@ except Exception as e:
     else:
         raise
 
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-model.to(device)
-
 
 def preprocess_text(text):
     """Preprocess text same as training"""
@@ -63,67 +424,302 @@ def preprocess_text(text):
     return text
 
 
-def predict(text, top_k=3):
+def confidence_level(confidence):
+    """Bucket a confidence score into high / medium / low"""
+    if confidence >= 0.7:
+        return "high"
+    elif confidence >= 0.4:
+        return "medium"
+    return "low"
+
+
+def format_prediction(text, top_probs, top_indices, model_version=None, exit_layer=None):
     """
-    Predict category for given transaction remark
-    
-    Args:
-        text: Transaction remark/description
-        top_k: Number of top predictions to return
-    
+    Build the prediction dict from top-k probabilities and label ids
+
+    `exit_layer` is the number of transformer layers the model ran for this
+    remark; None when it was answered without running the model.
+    """
+    confidence = float(top_probs[0])
+
+    return {
+        "text": text,
+        "model_version": model_version,
+        "exit_layer": exit_layer,
+        "category": id2label[int(top_indices[0])],
+        "confidence": confidence,
+        "confidence_level": confidence_level(confidence),
+        "top_predictions": [
+            {
+                "category": id2label[int(idx)],
+                "confidence": float(prob)
+            }
+            for prob, idx in zip(top_probs, top_indices)
+        ]
+    }
+
+
+def pad_batch(sequences, pad_token_id):
+    """Pad token id sequences to the longest one in the batch"""
+    longest = max(len(ids) for ids in sequences)
+    input_ids = torch.full((len(sequences), longest), pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(sequences), longest), dtype=torch.long)
+
+    for row, ids in enumerate(sequences):
+        input_ids[row, :len(ids)] = torch.tensor(ids, dtype=torch.long)
+        attention_mask[row, :len(ids)] = 1
+
+    return {"input_ids": input_ids, "attention_mask": attention_mask}
+
+
+def rank_batch(texts, batch_size=PREDICT_BATCH_SIZE, loaded=None, observe=True, exit_layers=None):
+    """
+    Run the model over preprocessed remarks
+
+    Remarks are sorted by token length and split into chunks of
+    `batch_size`, and each chunk is padded only to its longest member.
+    With `observe`, stage timings and batch sizes go to /metrics.
+    If `exit_layers` is a list as long as `texts`, it is filled with the
+    number of layers run per remark.
+
     Returns:
-        dict with primary prediction and top-k predictions
+        list of (probs, label_ids) tuples ranked highest first, in input order
     """
-    try:
-        text = preprocess_text(text)
+    loaded = loaded or active
+    started = time.perf_counter()
+    encodings = loaded.tokenizer(texts, truncation=True, max_length=MAX_LENGTH)["input_ids"]
+    order = sorted(range(len(texts)), key=lambda i: len(encodings[i]))
+    ranked = [None] * len(texts)
+    timings = {"tokenize": time.perf_counter() - started, "forward": 0.0, "softmax_topk": 0.0}
 
-        # Tokenize
-        inputs = tokenizer(
-            text, 
-            return_tensors="pt", 
-            truncation=True, 
-            padding="max_length", 
-            max_length=128
-        )
+    for start in range(0, len(order), batch_size):
+        chunk = order[start:start + batch_size]
+        inputs = pad_batch([encodings[i] for i in chunk], loaded.tokenizer.pad_token_id)
+        started = time.perf_counter()
+        if isinstance(loaded.model, EarlyExitBackend):
+            logits, layers = loaded.model.logits_with_exits(**inputs)
+            layers = layers.tolist()
+        else:
+            logits = loaded.model.logits(**inputs)
+            layers = [getattr(getattr(loaded.model, "config", None), "n_layers", None)] * len(chunk)
+        forwarded = time.perf_counter()
+        if exit_layers is not None:
+            for i, layer in zip(chunk, layers):
+                exit_layers[i] = layer
 
-        inputs = {k: v.to(device) for k, v in inputs.items()}
+        probs = F.softmax(logits, dim=-1)
+        top_probs, top_indices = torch.sort(probs, dim=-1, descending=True)
 
-        # Predict
-        with torch.no_grad():
-            logits = model(**inputs).logits
+        for i, row_probs, row_indices in zip(chunk, top_probs.tolist(), top_indices.tolist()):
+            ranked[i] = (tuple(row_probs), tuple(row_indices))
 
-        probs = F.softmax(logits, dim=-1)[0]
-        top_probs, top_indices = torch.topk(probs, min(top_k, len(id2label)))
+        timings["forward"] += forwarded - started
+        timings["softmax_topk"] += time.perf_counter() - forwarded
+        if observe:
+            metrics.BATCH_SIZE.observe(len(chunk))
 
-        pred_id = top_indices[0].item()
-        confidence = top_probs[0].item()
+    if observe:
+        for stage, seconds in timings.items():
+            metrics.STAGE_SECONDS.observe(seconds, stage)
+    return ranked
 
-        top_predictions = [
-            {
-                "category": id2label[idx.item()],
-                "confidence": float(prob.item())
-            }
-            for prob, idx in zip(top_probs, top_indices)
-        ]
 
-        if confidence >= 0.7:
-            confidence_level = "high"
-        elif confidence >= 0.4:
-            confidence_level = "medium"
+def _cache_lookups():
+    stats = cache.stats()
+    return {("hit",): stats["hits"], ("miss",): stats["misses"]}
+
+
+def _path_totals():
+    with _path_lock:
+        return {(path,): count for path, count in path_counts.items()}
+
+
+def _exit_totals():
+    with _path_lock:
+        return {(str(layer),): count for layer, count in exit_counts.items()}
+
+
+metrics.Callback(
+    "finpal_prediction_cache_lookups_total",
+    "In-memory prediction cache lookups by result",
+    _cache_lookups, kind="counter", labelnames=("result",)
+)
+metrics.Callback(
+    "finpal_prediction_cache_hit_ratio",
+    "Share of in-memory prediction cache lookups that hit",
+    lambda: cache.stats()["hit_ratio"]
+)
+metrics.Callback(
+    "finpal_prediction_cache_entries",
+    "Remarks held in the in-memory prediction cache",
+    lambda: len(cache)
+)
+metrics.Callback(
+    "finpal_predictions_total",
+    "Remarks answered per serving path (keyword, cache, store, linear, model)",
+    _path_totals, kind="counter", labelnames=("path",)
+)
+metrics.Callback(
+    "finpal_exit_layer_total",
+    "Remarks answered by the model, by number of transformer layers run",
+    _exit_totals, kind="counter", labelnames=("layer",)
+)
+metrics.Callback(
+    "finpal_model_info",
+    "Model currently serving; always 1",
+    lambda: {(active.revision, str(active.model_id), active.backend): 1},
+    labelnames=("version", "model_id", "backend")
+)
+
+
+def cache_stats():
+    """Counters for the in-memory cache, the on-disk store and each serving path"""
+    stats = cache.stats()
+    current = active
+    stats["model_revision"] = current.revision
+    stats["backend"] = current.model.name
+    if store is not None:
+        stats["store"] = store.stats()
+    if keyword_index is not None:
+        stats["keyword_patterns"] = len(keyword_index)
+    if linear_cascade is not None:
+        stats["linear_threshold"] = linear_cascade.threshold
+    if isinstance(current.model, EarlyExitBackend):
+        stats["early_exit_threshold"] = current.model.threshold
+    with _path_lock:
+        stats["paths"] = dict(path_counts)
+        stats["exit_layers"] = dict(exit_counts)
+    return stats
+
+
+def fast_prediction(text, top_k=3):
+    """
+    Return the prediction for `text` from the keyword index or cache, else None
+
+    Cheap enough to call on an event loop. The linear stage and everything
+    after it run in predict_batch(), on the caller's worker thread.
+    """
+    text = preprocess_text(text)
+    current = active
+    ranked = keyword_index.lookup(text) if keyword_index is not None else None
+    if ranked is not None:
+        count_path("keyword")
+    else:
+        ranked = cache.get(text, record_miss=False)
+        if ranked is None:
+            return None
+        count_path("cache")
+    result = format_prediction(text, ranked[0][:top_k], ranked[1][:top_k], current.revision)
+    if shadow is not None:
+        shadow.offer([result], current)
+    return result
+
+
+def predict_batch(texts, top_k=3, batch_size=PREDICT_BATCH_SIZE):
+    """
+    Predict categories for many transaction remarks at once
+
+    Remarks settled by the keyword index or already cached are answered
+    without inference, remarks the linear cascade stage is confident about
+    skip the transformer, and duplicate remarks in the batch are classified
+    only once.
+
+    Args:
+        texts: List of transaction remarks/descriptions
+        top_k: Number of top predictions to return per remark
+        batch_size: Maximum number of remarks per forward pass
+
+    Returns:
+        list of dicts shaped like `predict()` output, in input order
+    """
+    texts = [preprocess_text(text) for text in texts]
+    # Read the generation before the model: a swap in between then only
+    # drops this batch's cache writes instead of caching old-model results
+    generation = cache.generation
+    current = active
+    with current.use(), profiling.profiled():
+        results = _predict_batch(texts, top_k, batch_size, generation, current)
+
+    scorer = shadow
+    if scorer is not None:
+        scorer.offer(results, current)
+    return results
+
+
+def _predict_batch(texts, top_k, batch_size, generation, current):
+    revision = current.revision
+    ranked = {}
+    exits = {}
+    missing = []
+
+    for text in dict.fromkeys(texts):
+        hit = keyword_index.lookup(text) if keyword_index is not None else None
+        if hit is not None:
+            count_path("keyword")
+            ranked[text] = hit
+            continue
+
+        hit = cache.get(text)
+        if hit is None:
+            missing.append(text)
         else:
-            confidence_level = "low"
+            count_path("cache")
+            ranked[text] = hit
 
-        return {
-            "text": text,
-            "category": id2label[pred_id],
-            "confidence": float(confidence),
-            "confidence_level": confidence_level,
-            "top_predictions": top_predictions
-        }
+    if missing and store is not None:
+        found = store.get_many(revision, missing)
+        for text, result in found.items():
+            ranked[text] = result
+            cache.put(text, result, generation)
+        count_path("store", len(found))
+        missing = [text for text in missing if text not in ranked]
+
+    if missing and linear_cascade is not None:
+        answered = 0
+        for text, result in zip(missing, linear_cascade.rank(missing)):
+            if result is not None:
+                ranked[text] = result
+                cache.put(text, result, generation)
+                answered += 1
+        count_path("linear", answered)
+        missing = [text for text in missing if text not in ranked]
+
+    if missing:
+        count_path("model", len(missing))
+        layers = [None] * len(missing)
+        computed = list(zip(missing, rank_batch(missing, batch_size, current, exit_layers=layers)))
+        exits = dict(zip(missing, layers))
+        with _path_lock:
+            exit_counts.update(layers)
+        for text, result in computed:
+            ranked[text] = result
+            cache.put(text, result, generation)
+        if store is not None:
+            store.put_many(revision, computed)
+
+    return [
+        format_prediction(text, ranked[text][0][:top_k], ranked[text][1][:top_k], revision, exits.get(text))
+        for text in texts
+    ]
+
+
+def predict(text, top_k=3):
+    """
+    Predict category for given transaction remark
+    
+    Args:
+        text: Transaction remark/description
+        top_k: Number of top predictions to return
+    
+    Returns:
+        dict with primary prediction and top-k predictions
+    """
+    try:
+        return predict_batch([text], top_k=top_k, batch_size=1)[0]
     except Exception as e:
         return {
             "error": str(e),
-            "text": text
+            "text": preprocess_text(text)
         }
 
 
@@ -0,0 +1,151 @@
+"""
+predict_daemon.py
+
+Long-lived prediction daemon for the `predict.py --predict` CLI path.
+The model is loaded once; requests are JSON lines of the form
+    {"text": "<remark>", "top_k": 3}       -> one predict() result
+    {"texts": ["<remark>", ...]}          -> list of predict_batch() results
+and each gets exactly one JSON line back.
+
+Usage:
+    python predict_daemon.py                    # Unix socket at PREDICT_SOCKET
+    python predict_daemon.py --socket /path.sock
+    python predict_daemon.py --stdio            # JSON lines on stdin/stdout
+
+`query_daemon()` is the client used by `predict.py --predict`. It only uses
+the standard library so the CLI can reach a running daemon without
+importing torch or transformers.
+"""
+
+import os
+import sys
+import json
+import socket
+import argparse
+import socketserver
+
+DEFAULT_SOCKET = os.getenv("PREDICT_SOCKET", "/tmp/finpal-predict.sock")
+CONNECT_TIMEOUT = 0.5
+RESPONSE_TIMEOUT = 30
+
+
+def query_daemon(text, top_k=3, socket_path=DEFAULT_SOCKET):
+    """
+    Ask a running daemon to classify `text`
+
+    Returns:
+        the prediction dict, or None if no daemon is reachable
+    """
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(socket_path):
+        return None
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.settimeout(CONNECT_TIMEOUT)
+            conn.connect(socket_path)
+            conn.settimeout(RESPONSE_TIMEOUT)
+            conn.sendall((json.dumps({"text": text, "top_k": top_k}) + "\n").encode())
+
+            with conn.makefile("r", encoding="utf-8") as reader:
+                line = reader.readline()
+        return json.loads(line) if line else None
+    except (OSError, ValueError):
+        return None
+
+
+def handle_request(line):
+    """Answer one JSON request line"""
+    # Imported here so query_daemon() stays free of torch
+    from predict import predict, predict_batch
+
+    try:
+        request = json.loads(line)
+        top_k = int(request.get("top_k", 3))
+        if "texts" in request:
+            return predict_batch(request["texts"], top_k=top_k)
+        return predict(request["text"], top_k=top_k)
+    except Exception as e:
+        return {"error": str(e), "type": type(e).__name__}
+
+
+class PredictionHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for raw in self.rfile:
+            line = raw.decode("utf-8").strip()
+            if not line:
+                continue
+            response = handle_request(line)
+            self.wfile.write((json.dumps(response) + "\n").encode())
+            self.wfile.flush()
+
+
+class PredictionServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def claim_socket(socket_path):
+    """Remove a stale socket file, or exit if another daemon is listening"""
+    if not os.path.exists(socket_path):
+        return
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.connect(socket_path)
+        print(f"❌ A daemon is already listening on {socket_path}", file=sys.stderr)
+        sys.exit(1)
+    except ConnectionRefusedError:
+        os.unlink(socket_path)
+
+
+def serve_socket(socket_path):
+    if not hasattr(socket, "AF_UNIX"):
+        print("❌ Unix sockets are not available on this platform, use --stdio", file=sys.stderr)
+        sys.exit(1)
+
+    claim_socket(socket_path)
+    import predict  # noqa: F401  (load the model before accepting connections)
+
+    with PredictionServer(socket_path, PredictionHandler) as server:
+        os.chmod(socket_path, 0o600)
+        print(f"✅ Prediction daemon listening on {socket_path}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+
+def serve_stdio():
+    # Keep the real stdout for the protocol and point fd 1 at stderr, so
+    # diagnostics printed by predict.py or native libraries cannot end up
+    # between response lines
+    sys.stdout.flush()
+    protocol = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    import predict  # noqa: F401
+
+    print("✅ Prediction daemon reading JSON lines from stdin", file=sys.stderr)
+    for raw in sys.stdin:
+        line = raw.strip()
+        if not line:
+            continue
+        protocol.write(json.dumps(handle_request(line)) + "\n")
+        protocol.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--socket', type=str, default=DEFAULT_SOCKET, help='Unix socket path')
+    parser.add_argument('--stdio', action='store_true', help='Serve JSON lines on stdin/stdout')
+    args = parser.parse_args()
+
+    if args.stdio:
+        serve_stdio()
+    else:
+        serve_socket(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# ai/prediction_cache.py
+"""
+In-process LRU cache of model predictions keyed on normalized remark text.
+
+Each entry holds the full ranking for a remark (probabilities and label ids,
+highest first), so any `top_k` can be served from it. The cache is bounded
+both by entry count and by an estimate of its memory footprint.
+"""
+import sys
+import threading
+from collections import OrderedDict
+
+# Rough per-entry overhead of the OrderedDict slot and its linked-list node
+_ENTRY_OVERHEAD = 120
+
+
+def _entry_size(key, value):
+    probs, indices = value
+    return (
+        _ENTRY_OVERHEAD
+        + sys.getsizeof(key)
+        + sys.getsizeof(probs) + sum(sys.getsizeof(p) for p in probs)
+        + sys.getsizeof(indices) + sum(sys.getsizeof(i) for i in indices)
+    )
+
+
+class PredictionCache:
+    """Thread-safe LRU cache bounded by entry count and approximate bytes"""
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, record_miss=True):
+        """Return the cached ranking for `key`, or None"""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                if record_miss:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, generation=None):
+        """
+        Store a ranking for `key`
+
+        `generation` should be the value of `self.generation` read before
+        inference started; results computed against a model that has since
+        been replaced are dropped instead of cached.
+        """
+        if not self.enabled:
+            return
+
+        size = _entry_size(key, value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+
+            if key in self._entries:
+                self.bytes -= self._sizes[key]
+                self._entries.move_to_end(key)
+
+            self._entries[key] = value
+            self._sizes[key] = size
+            self.bytes += size
+
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                old_key, _ = self._entries.popitem(last=False)
+                self.bytes -= self._sizes.pop(old_key)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry, e.g. after the loaded model changes"""
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self.bytes = 0
+            self.generation += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "generation": self.generation
+            }
@@ -0,0 +1,213 @@
+# ai/prediction_store.py
+"""
+Persistent prediction store shared by inference server processes.
+
+Predictions are kept in SQLite (WAL mode, so any number of processes can
+read while one writes), keyed by (model revision, normalized text). Each
+row holds the predicted label id, its confidence and the full top-k
+ranking. Rows written for other model revisions are never returned, so
+the store is only garbage collected by age: each process records when it
+last used a revision, and revisions no process used for --max-age-days
+are deleted. Other processes sharing the file (api.py and app.py, a torch
+and an int8 server, serve.py workers mid-swap) keep their rows.
+
+Usage:
+    python prediction_store.py --path ./data/predictions.db --max-age-days 7
+"""
+import os
+import json
+import argparse
+import sqlite3
+import threading
+import time
+
+# SQLite's default limit on host parameters is 999 on older builds
+_LOOKUP_CHUNK = 500
+
+# Seconds between writes of a revision's last-used time by one process
+_TOUCH_INTERVAL = 300
+
+MAX_AGE_DAYS = 7
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    revision   TEXT    NOT NULL,
+    text       TEXT    NOT NULL,
+    label_id   INTEGER NOT NULL,
+    confidence REAL    NOT NULL,
+    top_k      TEXT    NOT NULL,
+    created_at REAL    NOT NULL,
+    PRIMARY KEY (revision, text)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS revisions (
+    revision  TEXT PRIMARY KEY,
+    last_used REAL NOT NULL
+);
+"""
+
+
+class PredictionStore:
+    """SQLite-backed store of ranked predictions, one connection per thread"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._touched = {}
+
+        conn = self._connection()
+        conn.executescript(_SCHEMA)
+        conn.commit()
+
+        # SQLite connections must not cross fork(); forked workers open their own
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._forget_connections)
+
+    def _forget_connections(self):
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def touch(self, revision, force=False):
+        """Record that this process uses `revision`, at most every _TOUCH_INTERVAL seconds"""
+        now = time.time()
+        with self._lock:
+            if not force and now - self._touched.get(revision, 0) < _TOUCH_INTERVAL:
+                return
+            self._touched[revision] = now
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT INTO revisions (revision, last_used) VALUES (?, ?) "
+                "ON CONFLICT(revision) DO UPDATE SET last_used = MAX(last_used, excluded.last_used)",
+                (revision, now)
+            )
+
+    def get_many(self, revision, texts):
+        """
+        Look up many normalized texts for one model revision
+
+        Returns:
+            dict mapping each found text to a (probs, label_ids) ranking
+        """
+        self.touch(revision)
+        texts = list(dict.fromkeys(texts))
+        found = {}
+        conn = self._connection()
+
+        for start in range(0, len(texts), _LOOKUP_CHUNK):
+            chunk = texts[start:start + _LOOKUP_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT text, top_k FROM predictions "
+                f"WHERE revision = ? AND text IN ({placeholders})",
+                [revision, *chunk]
+            )
+            for text, top_k in rows:
+                ranking = json.loads(top_k)
+                found[text] = (
+                    tuple(prob for _, prob in ranking),
+                    tuple(label_id for label_id, _ in ranking)
+                )
+
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(texts) - len(found)
+
+        return found
+
+    def put_many(self, revision, items):
+        """Store (text, (probs, label_ids)) pairs for one model revision"""
+        now = time.time()
+        rows = [
+            (
+                revision,
+                text,
+                int(label_ids[0]),
+                float(probs[0]),
+                json.dumps([[int(i), float(p)] for p, i in zip(probs, label_ids)]),
+                now
+            )
+            for text, (probs, label_ids) in items
+        ]
+        if not rows:
+            return
+
+        self.touch(revision)
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO predictions "
+                "(revision, text, label_id, confidence, top_k, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+        with self._lock:
+            self.writes += len(rows)
+
+    def purge_unused(self, max_age_days=MAX_AGE_DAYS):
+        """
+        Delete rows of revisions no process used for `max_age_days`
+
+        Rows of a revision never touched (written before last-used times
+        were recorded) are aged by their own created_at.
+
+        Returns:
+            number of prediction rows deleted
+        """
+        cutoff = time.time() - max_age_days * 86400
+        conn = self._connection()
+        with conn:
+            deleted = conn.execute(
+                "DELETE FROM predictions WHERE revision IN "
+                "(SELECT revision FROM revisions WHERE last_used < ?)",
+                (cutoff,)
+            ).rowcount
+            deleted += conn.execute(
+                "DELETE FROM predictions WHERE created_at < ? AND revision NOT IN "
+                "(SELECT revision FROM revisions)",
+                (cutoff,)
+            ).rowcount
+            conn.execute("DELETE FROM revisions WHERE last_used < ?", (cutoff,))
+        return deleted
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "path": self.path,
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "hit_ratio": self.hits / lookups if lookups else 0.0
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--path', type=str, default=os.getenv("PREDICTION_STORE_PATH"),
+                        help='Prediction store file (default: $PREDICTION_STORE_PATH)')
+    parser.add_argument('--max-age-days', type=float, default=MAX_AGE_DAYS,
+                        help='Delete revisions no server used for this many days')
+    args = parser.parse_args()
+    if not args.path:
+        parser.error("--path or PREDICTION_STORE_PATH is required")
+
+    store = PredictionStore(args.path)
+    deleted = store.purge_unused(args.max_age_days)
+    print(f"🧹 Deleted {deleted} predictions of revisions unused for {args.max_age_days:g} days from {args.path}")
+
+
+if __name__ == "__main__":
+    main()
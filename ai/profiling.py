@@ -0,0 +1,284 @@
+# ai/profiling.py
+"""
+On-demand profiling of a running inference server.
+
+A capture runs for a number of seconds or until a number of requests have
+finished, whichever comes first, while the server keeps serving. There are
+two modes:
+
+- sampling: a background thread samples the stack of every thread with
+  sys._current_frames() and writes collapsed stacks (`.folded`), which
+  flamegraph.pl, speedscope and similar viewers open
+- torch: each inference batch runs under torch.profiler on the thread that
+  executes it, and the batches are merged into one Chrome trace (`.json`)
+  for chrome://tracing or Perfetto. The torch profiler only records the
+  thread that enabled it, so one batch is profiled at a time.
+
+Captures are started with POST /admin/profile (see admin.py) or by sending
+SIGUSR1 to the server process, which runs a PROFILE_SECONDS sampling
+capture. Files go to PROFILE_DIR, named with the mode, time and pid.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import tempfile
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+import torch
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+PROFILE_SECONDS = float(os.getenv("PROFILE_SECONDS", "30"))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+MAX_PROFILE_SECONDS = 600
+
+PROFILE_MODES = ("sampling", "torch")
+
+
+class Capture:
+    """One profiling run; stops after `seconds` or `requests` requests"""
+
+    suffix = None
+
+    def __init__(self, seconds=None, requests=None, output_dir=PROFILE_DIR):
+        self.seconds = min(seconds or PROFILE_SECONDS, MAX_PROFILE_SECONDS)
+        self.max_requests = requests
+        self.requests = 0
+        self.started_at = time.time()
+        self.finished_at = None
+        self.error = None
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started_at))
+        self.path = os.path.join(output_dir, f"profile-{self.mode}-{stamp}-{os.getpid()}{self.suffix}")
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"profiler-{self.mode}", daemon=True)
+
+    def start(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def request_done(self):
+        if self._stop.is_set():
+            return
+        self.requests += 1
+        if self.max_requests and self.requests >= self.max_requests:
+            self._stop.set()
+
+    @property
+    def running(self):
+        return self.finished_at is None
+
+    def _run(self):
+        try:
+            self.collect(self._stop, time.monotonic() + self.seconds)
+            self.write()
+        except Exception as e:
+            self.error = str(e)
+            print(f"❌ {self.mode} profile failed: {e}")
+        else:
+            print(f"🔬 {self.mode} profile written to {self.path}")
+        finally:
+            self.finished_at = time.time()
+            _finished(self)
+
+    def describe(self):
+        return {
+            "mode": self.mode,
+            "path": self.path,
+            "seconds": self.seconds,
+            "max_requests": self.max_requests,
+            "requests": self.requests,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "running": self.running,
+            "error": self.error
+        }
+
+
+class SamplingCapture(Capture):
+    """Periodic stack samples of all threads, written as collapsed stacks"""
+
+    mode = "sampling"
+    suffix = ".folded"
+
+    def __init__(self, *args, interval_ms=PROFILE_SAMPLE_INTERVAL_MS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.interval = interval_ms / 1000.0
+        self.stacks = Counter()
+        self.samples = 0
+
+    def collect(self, stop, deadline):
+        own = threading.get_ident()
+        while not stop.wait(self.interval) and time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write(self):
+        with open(self.path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def describe(self):
+        return {**super().describe(), "samples": self.samples, "interval_ms": self.interval * 1000}
+
+
+class TorchCapture(Capture):
+    """torch.profiler over inference batches, merged into one Chrome trace"""
+
+    mode = "torch"
+    suffix = ".json"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batches = 0
+        self._trace = None
+        self._events = []
+        self._busy = threading.Lock()
+        self._closed = False
+        self._activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            self._activities.append(torch.profiler.ProfilerActivity.CUDA)
+
+    @contextmanager
+    def batch(self):
+        """Profile the enclosed batch unless another one is being profiled"""
+        if self._closed or not self._busy.acquire(blocking=False):
+            yield
+            return
+        try:
+            with torch.profiler.profile(activities=self._activities, record_shapes=True) as prof:
+                yield
+            self._add(prof)
+        finally:
+            self._busy.release()
+
+    def _add(self, prof):
+        # Traces share Kineto's time base, so their events can be concatenated
+        with tempfile.NamedTemporaryFile(suffix=".json", dir=os.path.dirname(self.path) or ".", delete=False) as tmp:
+            part = tmp.name
+        try:
+            prof.export_chrome_trace(part)
+            with open(part, "r", encoding="utf-8") as f:
+                trace = json.load(f)
+        finally:
+            os.unlink(part)
+        if self._trace is None:
+            self._trace = {k: v for k, v in trace.items() if k != "traceEvents"}
+        self._events.extend(trace.get("traceEvents", []))
+        self.batches += 1
+
+    def collect(self, stop, deadline):
+        stop.wait(max(0.0, deadline - time.monotonic()))
+        self._closed = True
+        # Let a batch that is still being profiled finish and be added
+        with self._busy:
+            pass
+
+    def write(self):
+        trace = dict(self._trace or {"schemaVersion": 1})
+        trace["traceEvents"] = self._events
+        trace["traceName"] = self.path
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(trace, f)
+
+    def describe(self):
+        return {**super().describe(), "batches": self.batches}
+
+
+# -----------------------------------------
+# Process-wide capture
+# -----------------------------------------
+current = None
+recent = deque(maxlen=10)
+_lock = threading.Lock()
+
+
+def _finished(capture):
+    global current
+    with _lock:
+        if current is capture:
+            current = None
+        recent.appendleft(capture.describe())
+
+
+def start(mode="sampling", seconds=None, requests=None, **kwargs):
+    """
+    Start a capture; raises RuntimeError if one is already running
+
+    Args:
+        mode: "sampling" or "torch"
+        seconds: Longest the capture runs (default PROFILE_SECONDS)
+        requests: Stop early once this many requests have finished
+    """
+    global current
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode '{mode}', expected one of {PROFILE_MODES}")
+    with _lock:
+        if current is not None:
+            raise RuntimeError(f"A {current.mode} profile is already running until {current.path} is written")
+        capture = (TorchCapture if mode == "torch" else SamplingCapture)(seconds, requests, **kwargs)
+        current = capture
+    capture.start()
+    return capture
+
+
+@contextmanager
+def profiled():
+    """Wrap one inference batch; profiles it while a torch capture runs"""
+    capture = current
+    if capture is None or capture.mode != "torch":
+        yield
+        return
+    with capture.batch():
+        yield
+
+
+def request_done():
+    capture = current
+    if capture is not None:
+        capture.request_done()
+
+
+def install_signal_handler(signum=getattr(signal, "SIGUSR1", None)):
+    """Start a PROFILE_SECONDS sampling capture on `signum` (main thread only)"""
+    if signum is None or threading.current_thread() is not threading.main_thread():
+        return False
+
+    def handle(signum, frame):
+        try:
+            capture = start("sampling")
+            print(f"🔬 Sampling profile for {capture.seconds:.0f}s -> {capture.path}")
+        except RuntimeError as e:
+            print(f"⚠️ {e}")
+
+    signal.signal(signum, handle)
+    return True
+
+
+class ProfilingMiddleware:
+    """ASGI middleware counting finished requests toward a capture's limit"""
+
+    def __init__(self, app, skip=("/admin", "/metrics")):
+        self.app = app
+        self.skip = skip
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if scope["type"] == "http" and current is not None and not scope["path"].startswith(self.skip):
+                request_done()
@@ -0,0 +1,299 @@
+# ai/progress.py
+"""
+Training progress reporting for train.py and retrain_model.py.
+
+ProgressReporter is a TrainerCallback. On every Trainer log it records the
+epoch, step, loss, latest eval metrics, samples per second, peak RSS and an
+ETA, and appends the record to a local JSONL log, so runs can be compared
+over time.
+
+For a retraining job the same record is also PUT to the backend as the
+job's progress. A background thread does the sending over one pooled
+requests.Session. The training loop only replaces the pending update and
+never waits on the network. If the backend is slow, intermediate updates are
+skipped and only the latest one is sent.
+
+Usage (compare runs in the log):
+    python progress.py --log ./logs/training_progress.jsonl
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+from datetime import datetime
+import requests
+from requests.adapters import HTTPAdapter
+from transformers import TrainerCallback
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROGRESS_LOG = os.getenv("PROGRESS_LOG", "./logs/training_progress.jsonl")
+# Minimum seconds between backend updates for regular training logs;
+# eval results and the final record are always sent
+PROGRESS_INTERVAL = float(os.getenv("PROGRESS_INTERVAL", "10"))
+
+# Trainer log keys copied into each record as they are
+_TRAIN_KEYS = ("loss", "learning_rate", "grad_norm", "padding_waste", "samples_per_second")
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None if unavailable"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 ** 2 if sys.platform == "darwin" else 1024), 1)
+
+
+class ProgressSender:
+    """Sends the latest progress payload from a background thread"""
+
+    def __init__(self, url, timeout=(5, 10)):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self.sent = 0
+        self.skipped = 0
+        self.failed = 0
+        self._pending = None
+        self._closing = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._loop, name="progress-sender", daemon=True)
+        self._thread.start()
+
+    def submit(self, payload):
+        """Queue `payload`, replacing any update not sent yet"""
+        with self._cond:
+            if self._pending is not None:
+                self.skipped += 1
+            self._pending = payload
+            self._cond.notify()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closing:
+                    self._cond.wait()
+                payload, self._pending = self._pending, None
+                if payload is None:
+                    return
+            try:
+                response = self.session.put(self.url, json=payload, timeout=self.timeout)
+                response.raise_for_status()
+                self.sent += 1
+            except Exception as e:
+                self.failed += 1
+                if self.failed == 1 or self.failed % 10 == 0:
+                    print(f"⚠️ Progress update failed ({self.failed} so far): {e}")
+
+    def close(self):
+        """
+        Send the last pending update, then stop the thread
+
+        Waits for the send in flight (bounded by the request timeout): a
+        "running" PUT landing after the caller's final job status would
+        flip a finished job back to running.
+        """
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._thread.join()
+        self.session.close()
+
+
+class ProgressReporter(TrainerCallback):
+    """Logs training progress to a JSONL file and, for a job, to the backend"""
+
+    def __init__(self, log_path=PROGRESS_LOG, job_id=None, backend_url=None,
+                 min_interval=PROGRESS_INTERVAL, run_name=None, **details):
+        """
+        Args:
+            log_path: JSONL file records are appended to (None to disable)
+            job_id: Retraining job whose progress is updated in the backend
+            backend_url: Backend base URL, required with job_id
+            min_interval: Minimum seconds between regular backend updates
+            run_name: Label for this run in the log (e.g. the script name)
+            **details: Extra fields stored with every record (mode, lr, ...)
+        """
+        self.log_path = log_path
+        self.job_id = job_id
+        self.url = f"{backend_url}/api/retraining/jobs/{job_id}" if job_id else None
+        self.min_interval = min_interval
+        self.run_name = run_name
+        self.details = details
+        self.run_id = uuid.uuid4().hex[:12]
+        self.sender = None
+        self._log = None
+        self._started = None
+        self._start_step = 0
+        self._last_sent = 0.0
+        self._last_eval = {}
+
+    # -----------------------------------------
+    # Trainer events
+    # -----------------------------------------
+    def on_train_begin(self, args, state, control, **kwargs):
+        self._started = time.perf_counter()
+        self._start_step = state.global_step
+        if self.log_path:
+            directory = os.path.dirname(self.log_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._log = open(self.log_path, "a", encoding="utf-8")
+        if self.url and self.sender is None:
+            self.sender = ProgressSender(self.url)
+        self._emit(self._record("start", state), force=True)
+
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        if self._started is None or not logs:
+            return
+        if "train_runtime" in logs:
+            # Trainer's closing summary; reported by on_train_end
+            return
+        eval_metrics = {k[len("eval_"):]: v for k, v in logs.items() if k.startswith("eval_")}
+        if eval_metrics:
+            self._last_eval = eval_metrics
+            self._emit(self._record("eval", state), force=True)
+        elif "loss" in logs:
+            record = self._record("train", state)
+            record.update({key: logs[key] for key in _TRAIN_KEYS if key in logs})
+            self._emit(record)
+
+    def on_train_end(self, args, state, control, **kwargs):
+        if self._started is None:
+            return
+        record = self._record("end", state)
+        record["best_metric"] = state.best_metric
+        self._emit(record, force=True)
+        self.close()
+
+    # -----------------------------------------
+    # Records
+    # -----------------------------------------
+    def _record(self, event, state):
+        elapsed = time.perf_counter() - self._started
+        done = state.global_step - self._start_step
+        remaining = max(state.max_steps - state.global_step, 0)
+        return {
+            "run_id": self.run_id,
+            "run_name": self.run_name,
+            "job_id": self.job_id,
+            "event": event,
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "epoch": round(state.epoch, 3) if state.epoch is not None else None,
+            "step": state.global_step,
+            "max_steps": state.max_steps,
+            "elapsed_s": round(elapsed, 1),
+            "eta_s": round(elapsed / done * remaining, 1) if done else None,
+            "peak_rss_mb": peak_rss_mb(),
+            "eval": dict(self._last_eval),
+            **self.details
+        }
+
+    def _emit(self, record, force=False):
+        if self._log is not None:
+            self._log.write(json.dumps(record, default=str) + "\n")
+            self._log.flush()
+
+        if self.sender is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_sent < self.min_interval:
+            return
+        self._last_sent = now
+        self.sender.submit({"status": "running", "progress": record})
+
+    def close(self):
+        """Flush and stop reporting; safe to call more than once"""
+        if self.sender is not None:
+            self.sender.close()
+            print(f"📡 Progress updates: {self.sender.sent} sent, "
+                  f"{self.sender.skipped} superseded, {self.sender.failed} failed")
+            self.sender = None
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+
+# -----------------------------------------
+# Comparing runs
+# -----------------------------------------
+def summarize_runs(log_path):
+    """One summary dict per run in the JSONL log, oldest first"""
+    runs = {}
+    with open(log_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            run = runs.setdefault(record["run_id"], {
+                "run_id": record["run_id"],
+                "run_name": record.get("run_name"),
+                "started": record["time"],
+                "speeds": [],
+                "best_f1": None,
+                "last": None
+            })
+            if record.get("samples_per_second"):
+                run["speeds"].append(record["samples_per_second"])
+            f1 = record.get("eval", {}).get("f1_weighted")
+            if f1 is not None and (run["best_f1"] is None or f1 > run["best_f1"]):
+                run["best_f1"] = f1
+            if record.get("loss") is not None:
+                run["loss"] = record["loss"]
+            run["last"] = record
+
+    summaries = []
+    for run in runs.values():
+        last = run.pop("last")
+        speeds = run.pop("speeds")
+        summaries.append({
+            **run,
+            "finished": last["event"] == "end",
+            "steps": last["step"],
+            "duration_s": last["elapsed_s"],
+            "samples_per_second": round(sum(speeds) / len(speeds), 2) if speeds else None,
+            "peak_rss_mb": last["peak_rss_mb"]
+        })
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--log', type=str, default=PROGRESS_LOG, help='Progress JSONL log')
+    parser.add_argument('--last', type=int, default=10, help='Number of most recent runs to show')
+    args = parser.parse_args()
+
+    summaries = summarize_runs(args.log)[-args.last:]
+    if not summaries:
+        print(f"No runs logged in {args.log}")
+        return
+
+    def show(value, fmt):
+        return format(value, fmt) if value is not None else "-"
+
+    print(f"{'started':<20} {'run':<16} {'steps':>6} {'loss':>7} {'best f1':>8} "
+          f"{'samples/s':>10} {'rss MB':>8} {'time s':>8}")
+    for run in summaries:
+        name = run["run_name"] or run["run_id"]
+        if not run["finished"]:
+            name += "*"
+        print(f"{run['started']:<20} {name[:16]:<16} {run['steps']:>6} "
+              f"{show(run.get('loss'), '.4f'):>7} {show(run['best_f1'], '.4f'):>8} "
+              f"{show(run['samples_per_second'], '.1f'):>10} {show(run['peak_rss_mb'], '.0f'):>8} "
+              f"{show(run['duration_s'], '.0f'):>8}")
+    if any(not run["finished"] for run in summaries):
+        print("* run did not finish")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+quantize.py
+
+Build an int8 variant of the trained classifier for CPU serving.
+This script:
+1. Loads the fp32 model (./model or MODEL_ID)
+2. Quantizes it:
+   - dynamic: int8 weights for every Linear layer (PyTorch), served with
+     INFERENCE_BACKEND=torch MODEL_ID=<output>
+   - static:  int8 weights and activations (ONNX Runtime), calibrated on
+     data/train.csv remarks, served with INFERENCE_BACKEND=onnx
+     ONNX_MODEL_PATH=<output>
+3. Evaluates fp32 and int8 on the same stratified test split as train.py
+4. Refuses to publish if weighted F1 drops by more than --max-f1-drop
+5. Saves the int8 model, tokenizer and quantization_metadata.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import torch
+import numpy as np
+from datetime import datetime
+from dotenv import load_dotenv
+from sklearn.metrics import accuracy_score, f1_score
+from transformers import DistilBertTokenizerFast, DistilBertForSequenceClassification
+from backends import (
+    OnnxBackend,
+    ONNX_FILE_NAME,
+    QUANTIZED_WEIGHTS_NAME,
+    quantize_dynamic_int8
+)
+from training_data import TRAIN_CSV, load_training_data, stratified_split
+
+load_dotenv()
+
+DEFAULT_MODEL = "./model" if os.path.isdir("./model") else os.getenv("MODEL_ID", "finPal/distilbert")
+DEFAULT_OUTPUTS = {
+    "dynamic": "./model/int8",
+    "static": "./model/onnx-int8"
+}
+EVAL_BATCH_SIZE = 32
+CALIBRATION_BATCH_SIZE = 16
+MAX_LENGTH = 128
+
+
+def batched_inputs(tokenizer, texts, batch_size):
+    """Yield dynamically padded batches, shortest remarks first"""
+    for start in range(0, len(texts), batch_size):
+        yield tokenizer(
+            texts[start:start + batch_size],
+            truncation=True,
+            max_length=MAX_LENGTH,
+            padding=True,
+            return_tensors="pt"
+        )
+
+
+def evaluate(logits_fn, tokenizer, test_df):
+    """Accuracy, F1 and mean per-remark latency of `logits_fn` on the test split"""
+    test_df = test_df.assign(length=test_df["text"].str.len()).sort_values("length")
+    texts = test_df["text"].tolist()
+    predictions = []
+
+    start = time.perf_counter()
+    for inputs in batched_inputs(tokenizer, texts, EVAL_BATCH_SIZE):
+        logits = logits_fn(inputs["input_ids"], inputs["attention_mask"])
+        predictions.extend(np.argmax(logits.numpy(), axis=-1).tolist())
+    elapsed = time.perf_counter() - start
+
+    labels = test_df["label_id"].tolist()
+    return {
+        "accuracy": accuracy_score(labels, predictions),
+        "f1_macro": f1_score(labels, predictions, average='macro', zero_division=0),
+        "f1_weighted": f1_score(labels, predictions, average='weighted', zero_division=0),
+        "ms_per_remark": elapsed * 1000 / len(texts)
+    }
+
+
+def torch_logits_fn(model):
+    def logits_fn(input_ids, attention_mask):
+        with torch.no_grad():
+            return model(input_ids=input_ids, attention_mask=attention_mask).logits
+    return logits_fn
+
+
+def quantize_dynamic(model, tokenizer, output_dir):
+    """int8 Linear weights with activations quantized on the fly"""
+    qmodel = quantize_dynamic_int8(model)
+
+    os.makedirs(output_dir, exist_ok=True)
+    torch.save(qmodel.state_dict(), os.path.join(output_dir, QUANTIZED_WEIGHTS_NAME))
+    model.config.save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
+
+    return torch_logits_fn(qmodel)
+
+
+def quantize_static(model, tokenizer, output_dir, calibration_texts):
+    """int8 weights and activations through ONNX Runtime, calibrated on remarks"""
+    from onnxruntime.quantization import (
+        CalibrationDataReader,
+        QuantFormat,
+        QuantType,
+        quantize_static as ort_quantize_static
+    )
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+    from export_onnx import export
+
+    class RemarkReader(CalibrationDataReader):
+        def __init__(self):
+            self.batches = (
+                {
+                    "input_ids": inputs["input_ids"].numpy(),
+                    "attention_mask": inputs["attention_mask"].numpy()
+                }
+                for inputs in batched_inputs(tokenizer, calibration_texts, CALIBRATION_BATCH_SIZE)
+            )
+
+        def get_next(self):
+            return next(self.batches, None)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fp32_path = export(model, tokenizer, tmp)
+        prepared_path = os.path.join(tmp, "model.prepared.onnx")
+        quant_pre_process(fp32_path, prepared_path, skip_symbolic_shape=True)
+
+        os.makedirs(output_dir, exist_ok=True)
+        print(f"📏 Calibrating on {len(calibration_texts)} remarks...")
+        ort_quantize_static(
+            prepared_path,
+            os.path.join(output_dir, ONNX_FILE_NAME),
+            RemarkReader(),
+            quant_format=QuantFormat.QDQ,
+            op_types_to_quantize=["MatMul", "Gemm"],
+            per_channel=True,
+            activation_type=QuantType.QInt8,
+            weight_type=QuantType.QInt8
+        )
+
+    model.config.save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
+
+    return OnnxBackend(output_dir).logits
+
+
+def directory_size(path):
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, files in os.walk(path)
+        for name in files
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', choices=["dynamic", "static"], default="dynamic", help='Quantization mode')
+    parser.add_argument('--model', type=str, default=DEFAULT_MODEL, help='fp32 model directory or hub id')
+    parser.add_argument('--output', type=str, help='Output directory (default depends on --mode)')
+    parser.add_argument('--data', type=str, default=TRAIN_CSV, help='Training CSV')
+    parser.add_argument('--max-f1-drop', type=float, default=0.01, help='Max allowed weighted F1 drop vs fp32')
+    parser.add_argument('--calibration-samples', type=int, default=512, help='Remarks used for static calibration')
+    args = parser.parse_args()
+
+    output_dir = args.output or DEFAULT_OUTPUTS[args.mode]
+    staging_dir = output_dir.rstrip("/") + ".staging"
+
+    print("\n" + "="*60)
+    print(f"🗜️  INT8 QUANTIZATION ({args.mode})")
+    print("="*60 + "\n")
+
+    print(f"📥 Loading fp32 model from {args.model}...")
+    hf_token = os.getenv("HF_TOKEN")
+    tokenizer = DistilBertTokenizerFast.from_pretrained(args.model, token=hf_token)
+    model = DistilBertForSequenceClassification.from_pretrained(
+        args.model,
+        token=hf_token,
+        attn_implementation="eager"
+    )
+    model.eval()
+
+    df = load_training_data(args.data)
+    train_df, test_df = stratified_split(df)
+    print(f"📊 Train: {len(train_df)} | Test: {len(test_df)}\n")
+
+    print("📊 Evaluating fp32...")
+    fp32_metrics = evaluate(torch_logits_fn(model), tokenizer, test_df)
+
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    if args.mode == "dynamic":
+        int8_logits_fn = quantize_dynamic(model, tokenizer, staging_dir)
+    else:
+        calibration_texts = train_df["text"].sample(
+            n=min(args.calibration_samples, len(train_df)), random_state=42
+        )
+        calibration_texts = sorted(calibration_texts.tolist(), key=len)
+        int8_logits_fn = quantize_static(model, tokenizer, staging_dir, calibration_texts)
+
+    print("📊 Evaluating int8...")
+    int8_metrics = evaluate(int8_logits_fn, tokenizer, test_df)
+    f1_drop = fp32_metrics["f1_weighted"] - int8_metrics["f1_weighted"]
+
+    print(f"\n{'':<14}{'fp32':>10}{'int8':>10}")
+    for key in ("accuracy", "f1_macro", "f1_weighted", "ms_per_remark"):
+        print(f"{key:<14}{fp32_metrics[key]:>10.4f}{int8_metrics[key]:>10.4f}")
+    print(f"\nWeighted F1 drop: {f1_drop:.4f} (max allowed {args.max_f1_drop:.4f})")
+
+    if f1_drop > args.max_f1_drop:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        print("\n❌ Accuracy gate failed, int8 model NOT published")
+        sys.exit(1)
+
+    metadata = {
+        "quantized_at": datetime.now().isoformat(),
+        "source_model": args.model,
+        "mode": args.mode,
+        "backend": "torch" if args.mode == "dynamic" else "onnx",
+        "dtype": "int8",
+        "max_f1_drop": args.max_f1_drop,
+        "f1_drop": f1_drop,
+        "fp32": fp32_metrics,
+        "int8": int8_metrics,
+        "size_bytes": directory_size(staging_dir),
+        "test_samples": len(test_df)
+    }
+    with open(os.path.join(staging_dir, "quantization_metadata.json"), "w") as f:
+        json.dump(metadata, f, indent=2)
+
+    # Publish only after the gate passed
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(staging_dir, output_dir)
+
+    print(f"\n✅ int8 model published to {output_dir}")
+    if args.mode == "dynamic":
+        print(f"💡 Serve with: INFERENCE_BACKEND=torch MODEL_ID={output_dir}")
+    else:
+        print(f"💡 Serve with: INFERENCE_BACKEND=onnx ONNX_MODEL_PATH={output_dir}")
+
+
+if __name__ == "__main__":
+    main()
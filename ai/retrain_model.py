@@ -3,7 +3,9 @@ retrain_corrections_only.py
 
 Train the model ONLY with user corrections (no original training data).
 This script:
-1. Fetches ONLY the 100+ corrections from database
+1. Streams new corrections from the database into an on-disk dataset
+   and trains on ONLY the corrections collected there; a job only runs
+   once --min-samples of them have not been used for training yet
 2. Trains from scratch or continues from existing model
 3. Does NOT combine with original training data
 4. Updates job status in the database
@@ -17,20 +19,24 @@ import requests
 import pandas as pd
 import numpy as np
 import torch
-import re
-from datasets import Dataset, DatasetDict
+import time
 from sklearn.model_selection import train_test_split
 from transformers import (
     DistilBertTokenizerFast,
     DistilBertForSequenceClassification,
-    Trainer,
     TrainingArguments,
-    EarlyStoppingCallback
+    EarlyStoppingCallback,
+    DataCollatorWithPadding
 )
 from torch.nn import CrossEntropyLoss
 from sklearn.metrics import accuracy_score, f1_score, classification_report
 from dotenv import load_dotenv
 from datetime import datetime
+from dataset_cache import tokenized_splits
+from corrections_store import CorrectionsStore, iter_csv_rows
+from training_utils import LengthGroupedTrainer
+from progress import ProgressReporter
+from adapters import PEFT_MODES, TOP_LAYERS, LORA_RANK, LORA_ALPHA, LORA_TARGETS, prepare_model, save_delta, merge_delta
 
 load_dotenv()
 
@@ -38,13 +44,30 @@ load_dotenv()
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:3000")
 EXISTING_MODEL_PATH = "./model"  # Your already trained model
 OUTPUT_DIR = "./model/retrained"
+DELTA_DIR = "./model/retrained-delta"  # head / lora modes only save the trained tensors here
+
+# full: fine-tune every weight; head / lora: see adapters.py
+RETRAIN_MODES = ("full",) + PEFT_MODES
+RETRAIN_MODE = os.getenv("RETRAIN_MODE", "lora")
+
+# Corrections are streamed in cursor pages into an on-disk dataset
+CORRECTIONS_DB = os.getenv("CORRECTIONS_DB", "./data/corrections.db")
+# The backend clamps ?limit to its MAX_EXPORT_PAGE
+MAX_EXPORT_PAGE = 10000
+CORRECTIONS_PAGE_SIZE = min(int(os.getenv("CORRECTIONS_PAGE_SIZE", "5000")), MAX_EXPORT_PAGE)
+CORRECTIONS_FETCH_RETRIES = 4
+MARK_USED_CHUNK = 1000
 
 # Training parameters
 BATCH_SIZE = 4
 GRADIENT_ACCUMULATION_STEPS = 8
 LEARNING_RATE = 2e-5
+# Fewer trainable weights tolerate (and need) larger steps
+MODE_LEARNING_RATES = {"full": LEARNING_RATE, "head": 1e-4, "lora": 3e-4}
 EPOCHS = 8
+WARMUP_RATIO = 0.1
 MAX_LENGTH = 96
+SPLIT_SEED = 42
 
 
 def update_job_status(job_id, status, data=None):
@@ -64,56 +87,77 @@ def update_job_status(job_id, status, data=None):
         print(f"⚠️ Error updating job status: {e}")
 
 
-def fetch_corrections():
-    """Fetch ONLY corrections from database (no original data)"""
-    try:
-        print("📥 Fetching corrections from database...")
-        response = requests.get(
-            f"{BACKEND_URL}/api/retraining/export-corrections",
-            timeout=30
-        )
-        
-        if response.status_code == 200:
-            # Parse CSV response
-            from io import StringIO
-            corrections_df = pd.read_csv(StringIO(response.text))
-            print(f"✅ Fetched {len(corrections_df)} corrections")
-            return corrections_df
-        else:
-            print(f"❌ Failed to fetch corrections: {response.status_code}")
-            return None
-    except Exception as e:
-        print(f"❌ Error fetching corrections: {e}")
-        return None
+def fetch_page(session, store):
+    """
+    Stream one cursor page of corrections into the store
 
+    Returns:
+        (rows read, X-Next-Cursor of the page or None on the last page)
+    """
+    with session.get(
+        f"{BACKEND_URL}/api/retraining/export-corrections",
+        params={"afterId": store.cursor, "limit": CORRECTIONS_PAGE_SIZE},
+        stream=True,
+        timeout=(10, 60)
+    ) as response:
+        response.raise_for_status()
+        next_cursor = response.headers.get("X-Next-Cursor")
+        lines = response.iter_lines(decode_unicode=True)
+        read, _ = store.append_page(iter_csv_rows(lines))
+    return read, next_cursor
 
-def preprocess_text(text):
-    """Preprocess text (same as train.py)"""
-    text = str(text).strip()
-    text = re.sub(r'\s+', ' ', text)
-    return text
 
+def fetch_corrections(store):
+    """
+    Pull corrections newer than the store's cursor, page by page
 
-def prepare_training_data():
+    A failed page is retried with backoff; pages already stored are kept,
+    so a later run resumes where this one stopped.
+
+    Returns:
+        number of correction rows transferred, or None if fetching failed
+    """
+    print(f"📥 Fetching corrections after id {store.cursor}...")
+    session = requests.Session()
+    fetched = 0
+
+    while True:
+        for attempt in range(1, CORRECTIONS_FETCH_RETRIES + 1):
+            try:
+                read, next_cursor = fetch_page(session, store)
+                break
+            except Exception as e:
+                print(f"⚠️ Page after id {store.cursor} failed (attempt {attempt}): {e}")
+                if attempt == CORRECTIONS_FETCH_RETRIES:
+                    print(f"❌ Error fetching corrections, {fetched} rows kept for the next run")
+                    return None
+                time.sleep(2 ** attempt)
+
+        fetched += read
+        if read:
+            print(f"   ... {fetched} rows (cursor {store.cursor})")
+        # The backend only sends X-Next-Cursor for a full page
+        if not read or next_cursor is None:
+            break
+
+    print(f"✅ Fetched {fetched} new corrections ({store.count()} unique remarks stored)")
+    return fetched
+
+
+def prepare_training_data(store):
     """Prepare training data from ONLY corrections"""
     
-    # Fetch corrections
-    corrections_df = fetch_corrections()
+    # Fetch new corrections into the on-disk dataset (already preprocessed
+    # and deduplicated there), then train on everything it holds
+    if fetch_corrections(store) is None:
+        raise RuntimeError("Failed to fetch corrections from the backend")
     
-    if corrections_df is None or len(corrections_df) == 0:
+    corrections_df = store.to_dataframe()
+    
+    if len(corrections_df) == 0:
         print("❌ No corrections available")
         return None, None, None
     
-    # Preprocess
-    corrections_df["text"] = corrections_df["text"].apply(preprocess_text)
-    corrections_df["label"] = corrections_df["label"].astype(str).str.strip().str.lower()
-    
-    # Remove empty
-    corrections_df = corrections_df[
-        (corrections_df["text"].str.len() > 0) & 
-        (corrections_df["label"].notna())
-    ]
-    
     print(f"\n📊 Training with ONLY corrections: {len(corrections_df)} samples")
     print(f"\n📊 Label distribution:\n{corrections_df['label'].value_counts()}")
     
@@ -133,7 +177,7 @@ def prepare_training_data():
         train_df, test_df = train_test_split(
             corrections_df[["text", "label_id"]], 
             test_size=0.2, 
-            random_state=42,
+            random_state=SPLIT_SEED,
             stratify=corrections_df["label_id"]
         )
     except ValueError:
@@ -142,7 +186,7 @@ def prepare_training_data():
         train_df, test_df = train_test_split(
             corrections_df[["text", "label_id"]], 
             test_size=0.2, 
-            random_state=42
+            random_state=SPLIT_SEED
         )
     
     print(f"📊 Train: {len(train_df)} | Test: {len(test_df)}")
@@ -150,8 +194,8 @@ def prepare_training_data():
     return train_df, test_df, {"label2id": label2id, "id2label": id2label}
 
 
-class WeightedTrainer(Trainer):
-    """Custom trainer with class weighting"""
+class WeightedTrainer(LengthGroupedTrainer):
+    """Custom trainer with class weighting and length-grouped batches"""
     def __init__(self, *args, class_weights=None, **kwargs):
         super().__init__(*args, **kwargs)
         self.class_weights = class_weights
@@ -192,7 +236,7 @@ def compute_metrics(eval_pred):
     }
 
 
-def retrain_model(train_df, test_df, label_map, job_id=None):
+def retrain_model(train_df, test_df, label_map, job_id=None, mode=RETRAIN_MODE, top_layers=TOP_LAYERS, merge=True):
     """Continue training the existing model with ONLY corrections"""
     
     print("\n" + "="*60)
@@ -217,28 +261,36 @@ def retrain_model(train_df, test_df, label_map, job_id=None):
     )
     
     model.config.use_cache = False
-    model.gradient_checkpointing_enable()
-    
-    print("✅ Model loaded successfully\n")
     
-    # Tokenize data
-    def tokenize_fn(batch):
-        tokenized = tokenizer(
-            batch["text"],
-            truncation=True,
-            padding="max_length",
-            max_length=MAX_LENGTH,
-            return_attention_mask=True
+    if mode == "full":
+        model.gradient_checkpointing_enable()
+        trainable, total = sum(p.numel() for p in model.parameters()), None
+    else:
+        # Frozen lower layers keep no activations for backward, so
+        # gradient checkpointing would only cost recomputation here
+        trainable, total = prepare_model(
+            model, mode,
+            top_layers=top_layers,
+            rank=LORA_RANK,
+            alpha=LORA_ALPHA,
+            targets=LORA_TARGETS
         )
-        tokenized["labels"] = batch["label_id"]
-        return tokenized
+        print(f"🧊 Mode '{mode}': training {trainable:,} of {total:,} parameters ({trainable / total:.2%})")
+    learning_rate = MODE_LEARNING_RATES[mode]
     
-    dataset = DatasetDict({
-        "train": Dataset.from_pandas(train_df, preserve_index=False),
-        "test": Dataset.from_pandas(test_df, preserve_index=False)
-    })
+    print("✅ Model loaded successfully\n")
     
-    tokenized_dataset = dataset.map(tokenize_fn, batched=True)
+    # Tokenize data (cached; only corrections not seen before are tokenized).
+    # Examples stay unpadded and are padded per batch by the collator
+    tokenized_dataset = tokenized_splits(
+        train_df,
+        test_df,
+        tokenizer,
+        max_length=MAX_LENGTH,
+        seed=SPLIT_SEED,
+        padding="do_not_pad"
+    )
+    data_collator = DataCollatorWithPadding(tokenizer)
     
     # Calculate class weights
     class_counts = train_df["label_id"].value_counts().sort_index().values
@@ -257,9 +309,11 @@ def retrain_model(train_df, test_df, label_map, job_id=None):
         per_device_train_batch_size=BATCH_SIZE,
         per_device_eval_batch_size=BATCH_SIZE,
         gradient_accumulation_steps=GRADIENT_ACCUMULATION_STEPS,
-        learning_rate=LEARNING_RATE,
+        learning_rate=learning_rate,
         weight_decay=0.01,
-        warmup_steps=100,
+        # A share of the run: a few hundred corrections make only a few
+        # dozen optimizer steps, which a fixed 100-step warmup never finishes
+        warmup_ratio=WARMUP_RATIO,
         eval_strategy="epoch",
         save_strategy="epoch",
         logging_steps=50,
@@ -269,7 +323,17 @@ def retrain_model(train_df, test_df, label_map, job_id=None):
         report_to="none",
         save_total_limit=2,
         fp16=False,
-        gradient_checkpointing=True,
+        gradient_checkpointing=(mode == "full"),
+    )
+    
+    # Progress goes to the local JSONL log and, for a job, to the backend
+    progress = ProgressReporter(
+        job_id=job_id,
+        backend_url=BACKEND_URL,
+        run_name=f"retrain-{mode}",
+        mode=mode,
+        learning_rate=learning_rate,
+        train_samples=len(train_df)
     )
     
     # Create trainer
@@ -278,14 +342,19 @@ def retrain_model(train_df, test_df, label_map, job_id=None):
         args=training_args,
         train_dataset=tokenized_dataset["train"],
         eval_dataset=tokenized_dataset["test"],
+        data_collator=data_collator,
         compute_metrics=compute_metrics,
-        callbacks=[EarlyStoppingCallback(early_stopping_patience=3)],
+        callbacks=[EarlyStoppingCallback(early_stopping_patience=3), progress],
         class_weights=class_weights
     )
     
     # Train
     print("🚀 Starting training...")
-    trainer.train()
+    try:
+        trainer.train()
+    finally:
+        # Stop the sender before the job's final status is written
+        progress.close()
     
     # Evaluate
     print("\n" + "="*60)
@@ -308,24 +377,40 @@ def retrain_model(train_df, test_df, label_map, job_id=None):
     print(classification_report(
         true_labels, 
         pred_labels, 
-        target_names=[label_map["id2label"][str(i)] for i in range(len(label_map["id2label"]))],
+        target_names=[label_map["id2label"][i] for i in range(len(label_map["id2label"]))],
         digits=4,
         zero_division=0
     ))
     
     # Save model
-    print(f"\n💾 Saving retrained model to {OUTPUT_DIR}...")
-    trainer.save_model(OUTPUT_DIR)
-    tokenizer.save_pretrained(OUTPUT_DIR)
+    if mode == "full":
+        print(f"\n💾 Saving retrained model to {OUTPUT_DIR}...")
+        trainer.save_model(OUTPUT_DIR)
+        tokenizer.save_pretrained(OUTPUT_DIR)
+    else:
+        delta_bytes = save_delta(
+            trainer.model, DELTA_DIR, EXISTING_MODEL_PATH, mode,
+            top_layers=top_layers,
+            lora_rank=LORA_RANK,
+            lora_alpha=LORA_ALPHA,
+            lora_targets=list(LORA_TARGETS)
+        )
+        print(f"\n💾 Saved {mode} delta ({delta_bytes / 1024**2:.1f} MB) to {DELTA_DIR}")
+        if merge:
+            print(f"🔗 Merging delta into {OUTPUT_DIR}...")
+            merge_delta(EXISTING_MODEL_PATH, DELTA_DIR, OUTPUT_DIR)
     
     # Save metadata
     metadata = {
         "retrained_at": datetime.now().isoformat(),
         "base_model": EXISTING_MODEL_PATH,
         "training_method": "corrections_only",
+        "mode": mode,
+        "trainable_parameters": trainable,
+        "delta_dir": DELTA_DIR if mode != "full" else None,
         "original_data_used": False,
         "epochs": EPOCHS,
-        "learning_rate": LEARNING_RATE,
+        "learning_rate": learning_rate,
         "best_accuracy": eval_results['eval_accuracy'],
         "best_f1_weighted": eval_results['eval_f1_weighted'],
         "train_samples": len(train_df),
@@ -333,7 +418,8 @@ def retrain_model(train_df, test_df, label_map, job_id=None):
         "job_id": job_id
     }
     
-    with open(f"{OUTPUT_DIR}/retrain_metadata.json", "w") as f:
+    metadata_dir = OUTPUT_DIR if mode == "full" or merge else DELTA_DIR
+    with open(f"{metadata_dir}/retrain_metadata.json", "w") as f:
         json.dump(metadata, f, indent=2)
     
     print("✅ Model saved successfully!\n")
@@ -341,26 +427,41 @@ def retrain_model(train_df, test_df, label_map, job_id=None):
     return eval_results['eval_f1_weighted']
 
 
-def mark_corrections_used():
-    """Mark corrections as used in database"""
+def mark_corrections_used(store):
+    """Mark the corrections fetched into the store as used in database"""
+    ids = store.unmarked_ids()
+    marked = []
     try:
-        print("📝 Marking corrections as used...")
-        response = requests.post(
-            f"{BACKEND_URL}/api/retraining/mark-used",
-            timeout=10
-        )
-        if response.status_code == 200:
-            print("✅ Corrections marked as used")
+        print(f"📝 Marking {len(ids)} corrections as used...")
+        for start in range(0, len(ids), MARK_USED_CHUNK):
+            chunk = ids[start:start + MARK_USED_CHUNK]
+            response = requests.post(
+                f"{BACKEND_URL}/api/retraining/mark-used",
+                json={"ids": chunk},
+                timeout=10
+            )
+            if response.status_code != 200:
+                print(f"⚠️ Failed to mark corrections: {response.status_code}")
+                break
+            marked.extend(chunk)
         else:
-            print(f"⚠️ Failed to mark corrections: {response.status_code}")
+            print("✅ Corrections marked as used")
     except Exception as e:
         print(f"⚠️ Error marking corrections: {e}")
+    finally:
+        # Unmarked ids are retried after the next successful job
+        store.finish_cycle(marked)
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--job-id', type=str, help='Retraining job ID')
-    parser.add_argument('--min-samples', type=int, default=50, help='Minimum samples required')
+    parser.add_argument('--min-samples', type=int, default=50, help='Minimum new (not yet used) corrections required')
+    parser.add_argument('--corrections-db', type=str, default=CORRECTIONS_DB, help='On-disk corrections dataset')
+    parser.add_argument('--mode', choices=RETRAIN_MODES, default=RETRAIN_MODE,
+                        help='full fine-tune, or head / lora (parameter-efficient, saves a delta)')
+    parser.add_argument('--top-layers', type=int, default=TOP_LAYERS, help='Transformer layers trained in head mode')
+    parser.add_argument('--no-merge', action='store_true', help='Only save the delta, do not write a merged model')
     args = parser.parse_args()
     
     job_id = args.job_id
@@ -375,7 +476,8 @@ def main():
     
     try:
         # Prepare data (ONLY corrections, no original data)
-        train_df, test_df, label_map = prepare_training_data()
+        store = CorrectionsStore(args.corrections_db)
+        train_df, test_df, label_map = prepare_training_data(store)
         
         if train_df is None:
             error_msg = "No corrections available for retraining"
@@ -384,16 +486,23 @@ def main():
                 update_job_status(job_id, "failed", {"errorMessage": error_msg})
             sys.exit(1)
         
-        # Check minimum samples
-        if len(train_df) < args.min_samples:
-            error_msg = f"Insufficient samples: {len(train_df)} < {args.min_samples}"
+        # Check minimum samples: only corrections not yet used count, or
+        # every job would pass once the dataset on disk is large enough
+        new_samples = store.count_new()
+        if new_samples < args.min_samples:
+            error_msg = f"Insufficient new corrections: {new_samples} < {args.min_samples}"
             print(f"⚠️ {error_msg}")
             if job_id:
                 update_job_status(job_id, "failed", {"errorMessage": error_msg})
             sys.exit(1)
         
         # Retrain model with ONLY corrections
-        best_f1 = retrain_model(train_df, test_df, label_map, job_id)
+        best_f1 = retrain_model(
+            train_df, test_df, label_map, job_id,
+            mode=args.mode,
+            top_layers=args.top_layers,
+            merge=not args.no_merge
+        )
         
         # Update job status
         if job_id:
@@ -404,17 +513,24 @@ def main():
             })
         
         # Mark corrections as used
-        mark_corrections_used()
+        mark_corrections_used(store)
         
         print("\n" + "="*60)
         print("🎉 RETRAINING COMPLETE!")
         print("="*60)
-        print(f"\n✅ Retrained model saved to: {OUTPUT_DIR}")
+        if args.no_merge and args.mode != "full":
+            print(f"\n✅ Retrained {args.mode} delta saved to: {DELTA_DIR}")
+        else:
+            print(f"\n✅ Retrained model saved to: {OUTPUT_DIR}")
         print(f"✅ Best F1 Score: {best_f1:.4f}")
         print(f"✅ Trained on {len(train_df)} corrections (NO original data)")
         print(f"\n💡 To use the new model:")
+        if args.no_merge and args.mode != "full":
+            print(f"   0. Merge the delta: python adapters.py --base {EXISTING_MODEL_PATH} --delta {DELTA_DIR} --output {OUTPUT_DIR}")
         print(f"   1. Backup current: mv ./model ./model.backup")
         print(f"   2. Use retrained: mv ./model/retrained ./model")
+        print(f"   Or hot-swap a running server: write {OUTPUT_DIR} to its MODEL_POINTER_FILE,")
+        print(f"   or POST /admin/reload with {{\"model_id\": \"{OUTPUT_DIR}\"}}")
         
     except Exception as e:
         error_msg = str(e)
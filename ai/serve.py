@@ -0,0 +1,210 @@
+"""
+serve.py
+
+Multi-worker inference server for ai/api.py with fork-shared weights.
+This script:
+1. Loads the model once in the parent process (by importing api)
+2. Binds the listening socket in the parent
+3. Forks N workers that share the read-only weight pages copy-on-write
+4. Pins each worker to its own set of cores with a matching
+   torch.set_num_threads, so intra-op pools never compete
+5. Restarts any worker that exits until the parent is stopped, backing
+   off exponentially while a worker keeps crashing soon after start (the
+   other workers are still reaped and restarted meanwhile)
+6. Relays SIGHUP from any worker to all of them, so a model swap requested
+   through one worker's /admin routes reaches every worker through the
+   MODEL_POINTER_FILE (a temporary one is created if it is not set)
+
+Usage:
+    python serve.py --workers 4 --port 8001
+"""
+
+import os
+import gc
+import sys
+import time
+import signal
+import socket
+import argparse
+import tempfile
+
+# A worker that lived shorter than this counts as crashing on start; each
+# such exit in a row doubles the delay before its restart, up to the max
+MIN_UPTIME = 10.0
+RESTART_BACKOFF = 1.0
+MAX_RESTART_BACKOFF = 60.0
+# Seconds between supervisor checks for exited workers and due restarts
+SUPERVISE_POLL = 0.2
+
+
+def core_groups(workers, cores_per_worker=None):
+    """Split the CPUs this process may run on into one group per worker"""
+    cpus = sorted(os.sched_getaffinity(0))
+    size = cores_per_worker or max(1, len(cpus) // workers)
+    if size * workers > len(cpus):
+        print(f"⚠️ {workers} workers x {size} cores exceeds {len(cpus)} CPUs, groups will overlap")
+    return [
+        [cpus[(w * size + i) % len(cpus)] for i in range(size)]
+        for w in range(workers)
+    ]
+
+
+def bind_socket(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock, cores, log_level):
+    """Body of a forked worker; never returns"""
+    import torch
+    import uvicorn
+    import api
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    # Replaced by the profiling and pointer handlers once the app starts
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    os.sched_setaffinity(0, cores)
+    torch.set_num_threads(len(cores))
+
+    config = uvicorn.Config(api.app, log_level=log_level)
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+    os._exit(0)
+
+
+def spawn_worker(sock, cores, log_level):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            run_worker(sock, cores, log_level)
+        finally:
+            os._exit(1)
+    print(f"👷 Worker {pid} pinned to cores {cores}")
+    return pid
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, default="0.0.0.0")
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--workers', type=int, default=2, help='Number of forked workers')
+    parser.add_argument('--cores-per-worker', type=int, help='Cores pinned per worker (default: cpus / workers)')
+    parser.add_argument('--log-level', type=str, default="info")
+    args = parser.parse_args()
+
+    if not hasattr(os, "fork") or not hasattr(os, "sched_setaffinity"):
+        print("❌ serve.py needs fork() and CPU affinity (Linux); run api.py directly instead")
+        sys.exit(1)
+
+    # Keep the parent single-threaded so forking is safe; each worker sizes
+    # its own intra-op pool after it has been pinned
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    import torch
+    torch.set_num_threads(1)
+
+    # Admin swaps reach every worker only through the pointer file
+    own_pointer = None
+    if not os.getenv("MODEL_POINTER_FILE"):
+        own_pointer = os.path.join(tempfile.gettempdir(), f"finpal-model-{os.getpid()}.pointer")
+        os.environ["MODEL_POINTER_FILE"] = own_pointer
+
+    print("📥 Loading model in parent process...")
+    import api  # noqa: F401  (loads tokenizer and weights once)
+    import admin
+    import predict
+
+    admin.SERVE_PARENT_PID = os.getpid()
+    if own_pointer:
+        admin.write_pointer(predict.active.model_id)
+
+    # Move everything allocated so far out of the collector's reach, so
+    # gc passes in the workers do not write to (and un-share) those pages
+    gc.collect()
+    gc.freeze()
+
+    sock = bind_socket(args.host, args.port)
+    groups = core_groups(args.workers, args.cores_per_worker)
+    print(f"🚀 Serving on {args.host}:{args.port} with {args.workers} workers\n")
+
+    # Worker pid -> slot (index into groups); groups can overlap, so
+    # restart state is kept per slot, not per core set
+    workers = {spawn_worker(sock, cores, args.log_level): slot for slot, cores in enumerate(groups)}
+    started = {pid: time.monotonic() for pid in workers}
+    # Consecutive quick exits per slot, and when each waiting slot is
+    # respawned; one slot backing off does not hold up the others
+    crashes = {}
+    resume_at = {}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def forward(signum, frame):
+        # SIGUSR1 to the parent profiles every worker (see profiling.py);
+        # SIGHUP makes every worker re-read the model pointer (see admin.py)
+        for pid in list(workers):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGUSR1, forward)
+    signal.signal(signal.SIGHUP, forward)
+
+    while workers or resume_at:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pid, status = 0, 0
+        except InterruptedError:
+            continue
+
+        if pid:
+            slot = workers.pop(pid, None)
+            if slot is None or stopping:
+                continue
+            if time.monotonic() - started.pop(pid) < MIN_UPTIME:
+                crashes[slot] = crashes.get(slot, 0) + 1
+            else:
+                crashes[slot] = 0
+            delay = min(RESTART_BACKOFF * 2 ** (crashes[slot] - 1), MAX_RESTART_BACKOFF) if crashes[slot] else 0.0
+            print(f"⚠️ Worker {pid} exited with status {status}, restarting"
+                  + (f" in {delay:.0f}s" if delay else ""))
+            resume_at[slot] = time.monotonic() + delay
+            # Reap any other exited worker before sleeping
+            continue
+
+        if stopping:
+            resume_at.clear()
+        now = time.monotonic()
+        for slot, due in list(resume_at.items()):
+            if now >= due:
+                del resume_at[slot]
+                pid = spawn_worker(sock, groups[slot], args.log_level)
+                workers[pid] = slot
+                started[pid] = time.monotonic()
+        time.sleep(SUPERVISE_POLL)
+
+    sock.close()
+    if own_pointer and os.path.exists(own_pointer):
+        os.unlink(own_pointer)
+    print("👋 All workers stopped")
+
+
+if __name__ == "__main__":
+    main()
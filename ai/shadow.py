@@ -0,0 +1,200 @@
+# ai/shadow.py
+"""
+Shadow scoring of a candidate model on live traffic.
+
+A sample of the remarks the server answers is handed to a background
+thread. The thread re-scores them with the candidate model and, for the
+same batch, with the model that served them, so agreement, confidence
+shift and per-remark latency compare model with model like for like,
+even for remarks the keyword index, cache or linear stage answered.
+Requests never wait on the shadow thread: when its queue is full,
+samples are dropped and counted.
+"""
+import queue
+import random
+import threading
+import time
+from collections import Counter, defaultdict, deque
+
+_STOP = object()
+
+# Per-remark latencies kept for percentiles
+LATENCY_WINDOW = 2000
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _latency_summary(values):
+    return {
+        "mean": sum(values) / len(values) if values else None,
+        "p50": _percentile(values, 0.50),
+        "p95": _percentile(values, 0.95),
+        "p99": _percentile(values, 0.99)
+    }
+
+
+class ShadowScorer:
+    """Compares a candidate LoadedModel against live answers on a worker thread"""
+
+    def __init__(self, candidate, rank_batch, id2label, sample_rate=0.05,
+                 max_queue=1000, batch_size=16):
+        """
+        Args:
+            candidate: predict.LoadedModel to evaluate
+            rank_batch: predict.rank_batch, called with `loaded=` and `observe=False`
+            id2label: Label id to category mapping
+            sample_rate: Share of answered remarks that are shadow scored
+            max_queue: Sampled remarks waiting before new ones are dropped
+            batch_size: Remarks scored per shadow forward pass
+        """
+        self.candidate = candidate
+        self.rank_batch = rank_batch
+        self.id2label = id2label
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self.started_at = time.time()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self.offered = 0
+        self.dropped = 0
+        self.scored = 0
+        self.agreed = 0
+        self.confidence_shift = 0.0
+        self.abs_confidence_shift = 0.0
+        self.errors = 0
+        self.per_class = defaultdict(lambda: {"served": 0, "disagreed": 0, "candidate": Counter()})
+        self.candidate_ms = deque(maxlen=LATENCY_WINDOW)
+        self.active_ms = deque(maxlen=LATENCY_WINDOW)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="shadow-scorer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        if self._thread is None:
+            return
+        try:
+            self._queue.put_nowait(_STOP)
+        except queue.Full:
+            # Make room for the sentinel; the dropped sample is not scored
+            self._queue.get_nowait()
+            self._queue.put_nowait(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def offer(self, results, served_by):
+        """Sample formatted predictions answered by LoadedModel `served_by`"""
+        for result in results:
+            if random.random() >= self.sample_rate:
+                continue
+            with self._lock:
+                self.offered += 1
+            try:
+                self._queue.put_nowait((result["text"], served_by))
+            except queue.Full:
+                with self._lock:
+                    self.dropped += 1
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _timed_rank(self, texts, loaded):
+        start = time.perf_counter()
+        with loaded.use():
+            ranked = self.rank_batch(texts, loaded=loaded, observe=False)
+        return ranked, (time.perf_counter() - start) * 1000 / len(texts)
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+
+            # Score each group against the model that actually served it
+            groups = defaultdict(list)
+            for text, served_by in batch:
+                groups[served_by].append(text)
+
+            for served_by, texts in groups.items():
+                try:
+                    candidate_ranked, candidate_ms = self._timed_rank(texts, self.candidate)
+                    active_ranked, active_ms = self._timed_rank(texts, served_by)
+                except Exception as e:
+                    with self._lock:
+                        self.errors += 1
+                    print(f"⚠️ Shadow scoring failed: {e}")
+                    continue
+                self._record(active_ranked, candidate_ranked, candidate_ms, active_ms)
+
+    def _record(self, active_ranked, candidate_ranked, candidate_ms, active_ms):
+        with self._lock:
+            self.candidate_ms.append(candidate_ms)
+            self.active_ms.append(active_ms)
+            for (active_probs, active_ids), (probs, label_ids) in zip(active_ranked, candidate_ranked):
+                served = self.id2label[int(active_ids[0])]
+                served_confidence = active_probs[0]
+                candidate = self.id2label[int(label_ids[0])]
+                stats = self.per_class[served]
+                stats["served"] += 1
+                stats["candidate"][candidate] += 1
+
+                self.scored += 1
+                if candidate == served:
+                    self.agreed += 1
+                else:
+                    stats["disagreed"] += 1
+                shift = float(probs[0]) - float(served_confidence)
+                self.confidence_shift += shift
+                self.abs_confidence_shift += abs(shift)
+
+    def stats(self):
+        with self._lock:
+            scored = self.scored
+            return {
+                "candidate": self.candidate.describe(),
+                "sample_rate": self.sample_rate,
+                "running_for_s": round(time.time() - self.started_at, 1),
+                "offered": self.offered,
+                "dropped": self.dropped,
+                "scored": scored,
+                "errors": self.errors,
+                "queue_depth": self._queue.qsize(),
+                "agreement_rate": self.agreed / scored if scored else None,
+                "confidence_shift": {
+                    "mean": self.confidence_shift / scored if scored else None,
+                    "mean_abs": self.abs_confidence_shift / scored if scored else None
+                },
+                "per_class": {
+                    category: {
+                        "served": stats["served"],
+                        "disagreed": stats["disagreed"],
+                        "disagreement_rate": stats["disagreed"] / stats["served"],
+                        "candidate_labels": dict(stats["candidate"].most_common())
+                    }
+                    for category, stats in sorted(self.per_class.items())
+                },
+                "latency_ms_per_remark": {
+                    "candidate": _latency_summary(list(self.candidate_ms)),
+                    "active": _latency_summary(list(self.active_ms))
+                }
+            }
@@ -1,19 +1,23 @@
+import os
 import torch
 import pandas as pd
 import json
 import numpy as np
-from datasets import Dataset, DatasetDict
 from sklearn.model_selection import train_test_split
 from transformers import (
     DistilBertTokenizerFast,
     DistilBertForSequenceClassification,
-    Trainer,
     TrainingArguments,
-    EarlyStoppingCallback
+    EarlyStoppingCallback,
+    DataCollatorWithPadding
 )
 from torch.nn import CrossEntropyLoss
 from sklearn.metrics import accuracy_score, f1_score, classification_report
 import re
+from dataset_cache import tokenized_splits
+from training_utils import LengthGroupedTrainer
+from progress import ProgressReporter
+from early_exit import add_early_exit
 
 
 # -----------------------------------------
@@ -69,13 +73,8 @@ train_df, test_df = train_test_split(
     stratify=df["label_id"]  # ensures balanced splits
 )
 
-dataset = DatasetDict({
-    "train": Dataset.from_pandas(train_df, preserve_index=False),
-    "test": Dataset.from_pandas(test_df, preserve_index=False)
-})
-
-print(f"\nTraining samples: {len(dataset['train'])}")
-print(f"Test samples: {len(dataset['test'])}")
+print(f"\nTraining samples: {len(train_df)}")
+print(f"Test samples: {len(test_df)}")
 
 
 # -----------------------------------------
@@ -83,18 +82,18 @@ print(f"Test samples: {len(dataset['test'])}")
 # -----------------------------------------
 tokenizer = DistilBertTokenizerFast.from_pretrained("distilbert-base-uncased")
 
-def tokenize_fn(batch):
-    tokenized = tokenizer(
-        batch["text"],
-        truncation=True,
-        padding="max_length",
-        max_length=96,  # reduced from 128 to save RAM
-        return_attention_mask=True
-    )
-    tokenized["labels"] = batch["label_id"]
-    return tokenized
-
-tokenized_dataset = dataset.map(tokenize_fn, batched=True)
+# Tokenized splits are cached on disk (see dataset_cache.py); only remarks
+# not tokenized by an earlier run go through the tokenizer. Examples are
+# left unpadded and padded per batch by the collator
+tokenized_dataset = tokenized_splits(
+    train_df,
+    test_df,
+    tokenizer,
+    max_length=96,  # reduced from 128 to save RAM
+    seed=42,
+    padding="do_not_pad"
+)
+data_collator = DataCollatorWithPadding(tokenizer)
 
 
 
@@ -148,8 +147,9 @@ def compute_metrics(eval_pred):
 
 # -----------------------------------------
 # 8. Custom Trainer with class weighting
+#    (length-grouped, label-stratified batches; see training_utils.py)
 # -----------------------------------------
-class WeightedTrainer(Trainer):
+class WeightedTrainer(LengthGroupedTrainer):
     def compute_loss(self, model, inputs, return_outputs=False, num_items_in_batch=None):
         labels = inputs.get("labels")
         if labels is None:
@@ -200,8 +200,12 @@ trainer = WeightedTrainer(
     args=training_args,
     train_dataset=tokenized_dataset["train"],
     eval_dataset=tokenized_dataset["test"],
+    data_collator=data_collator,
     compute_metrics=compute_metrics,
-    callbacks=[EarlyStoppingCallback(early_stopping_patience=3)]
+    callbacks=[
+        EarlyStoppingCallback(early_stopping_patience=3),
+        ProgressReporter(run_name="train", learning_rate=training_args.learning_rate)
+    ]
 )
 
 print("\n" + "="*50)
@@ -238,4 +242,8 @@ print(classification_report(
 trainer.save_model("./model")
 tokenizer.save_pretrained("./model")
 
-print("\n✅ MODEL TRAINED AND SAVED TO ./model")
\ No newline at end of file
+print("\n✅ MODEL TRAINED AND SAVED TO ./model")
+
+# Optional early-exit heads on the saved model (see early_exit.py)
+if os.getenv("TRAIN_EARLY_EXIT", "0") == "1":
+    add_early_exit("./model", train_df, test_df)
\ No newline at end of file
@@ -0,0 +1,58 @@
+# ai/training_data.py
+"""
+Shared loading of data/train.csv for the offline tools (export, quantization,
+benchmarks, ...), mirroring the preprocessing and split used by train.py.
+Kept free of model loading so importing it is cheap.
+"""
+import json
+import os
+import re
+import pandas as pd
+from sklearn.model_selection import train_test_split
+
+AI_DIR = os.path.dirname(os.path.abspath(__file__))
+TRAIN_CSV = os.path.join(AI_DIR, "data", "train.csv")
+LABEL_MAP_FILE = os.path.join(AI_DIR, "label_map.json")
+
+TEST_SIZE = 0.2
+SPLIT_SEED = 42
+
+
+def preprocess_text(text):
+    """Preprocess text (same as train.py)"""
+    text = str(text).strip()
+    text = re.sub(r'\s+', ' ', text)
+    return text
+
+
+def load_label_map(path=LABEL_MAP_FILE):
+    with open(path, "r") as f:
+        maps = json.load(f)
+    id2label = {int(k): v for k, v in maps["id2label"].items()}
+    label2id = {v: int(k) for k, v in maps["id2label"].items()}
+    return id2label, label2id
+
+
+def load_training_data(path=TRAIN_CSV):
+    """Load and clean the training CSV, adding `label_id` from label_map.json"""
+    df = pd.read_csv(path)
+    df.columns = df.columns.str.strip().str.lower()
+
+    df["text"] = df["text"].apply(preprocess_text)
+    df["label"] = df["label"].astype(str).str.strip().str.lower()
+    df = df[(df["text"].str.len() > 0) & (df["label"].notna())]
+
+    _, label2id = load_label_map()
+    df = df[df["label"].isin(label2id)].copy()
+    df["label_id"] = df["label"].map(label2id)
+    return df
+
+
+def stratified_split(df, test_size=TEST_SIZE, seed=SPLIT_SEED):
+    """Stratified train/test split (same as train.py)"""
+    return train_test_split(
+        df[["text", "label_id"]],
+        test_size=test_size,
+        random_state=seed,
+        stratify=df["label_id"]
+    )
@@ -0,0 +1,111 @@
+# ai/training_utils.py
+"""
+Shared batching pieces for train.py and retrain_model.py.
+
+Examples are tokenized without padding and padded per batch by
+DataCollatorWithPadding. LengthGroupedTrainer feeds the Trainer batches of
+remarks with similar token lengths, so little of each padded batch is
+padding, while keeping every stretch of batches stratified by label. It
+also adds padding_waste and samples_per_second to the training logs.
+"""
+import time
+import numpy as np
+from torch.utils.data import Sampler
+from transformers import Trainer
+
+# Batches sorted together per mega-batch; larger groups lengths more
+# tightly but mixes labels over a longer stretch of steps
+MEGA_BATCH_MULT = 16
+
+
+class LengthGroupedStratifiedSampler(Sampler):
+    """
+    Index order for length-grouped, label-stratified batches
+
+    Each epoch, every label's examples are shuffled and interleaved in
+    proportion to the label's share of the data. That order is cut into
+    mega-batches (each a stratified slice), each mega-batch is sorted by
+    token length and cut into batches, and the batches are shuffled.
+    """
+
+    def __init__(self, lengths, labels, batch_size, mega_batch_mult=MEGA_BATCH_MULT, seed=42):
+        self.lengths = np.asarray(lengths)
+        self.labels = np.asarray(labels)
+        self.batch_size = batch_size
+        self.mega_batch_size = batch_size * mega_batch_mult
+        self.seed = seed
+        self.epoch = 0
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def stratified_order(self, rng):
+        keys = np.empty(len(self.labels))
+        for label in np.unique(self.labels):
+            members = np.flatnonzero(self.labels == label)
+            rng.shuffle(members)
+            # Spread each label evenly over [0, 1) with a little jitter
+            keys[members] = (np.arange(len(members)) + rng.random(len(members))) / len(members)
+        return np.argsort(keys, kind="stable")
+
+    def __iter__(self):
+        rng = np.random.default_rng(self.seed + self.epoch)
+        self.epoch += 1
+
+        order = self.stratified_order(rng)
+        batches = []
+        for start in range(0, len(order), self.mega_batch_size):
+            mega = order[start:start + self.mega_batch_size]
+            mega = mega[np.argsort(-self.lengths[mega], kind="stable")]
+            batches.extend(
+                mega[i:i + self.batch_size] for i in range(0, len(mega), self.batch_size)
+            )
+
+        for batch_index in rng.permutation(len(batches)):
+            yield from batches[batch_index].tolist()
+
+
+class LengthGroupedTrainer(Trainer):
+    """Trainer using LengthGroupedStratifiedSampler and logging padding waste"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._real_tokens = 0
+        self._padded_tokens = 0
+        self._samples = 0
+        self._window_start = time.perf_counter()
+
+    def _get_train_sampler(self, *args, **kwargs):
+        dataset = self.train_dataset
+        lengths = [len(ids) for ids in dataset["input_ids"]]
+        return LengthGroupedStratifiedSampler(
+            lengths,
+            dataset["labels"],
+            self.args.train_batch_size,
+            seed=self.args.seed
+        )
+
+    def training_step(self, model, inputs, *args, **kwargs):
+        mask = inputs.get("attention_mask")
+        if mask is not None:
+            self._real_tokens += int(mask.sum())
+            self._padded_tokens += mask.numel()
+            self._samples += mask.shape[0]
+        return super().training_step(model, inputs, *args, **kwargs)
+
+    def evaluate(self, *args, **kwargs):
+        # Keep evaluation time out of the training throughput window
+        start = time.perf_counter()
+        try:
+            return super().evaluate(*args, **kwargs)
+        finally:
+            self._window_start += time.perf_counter() - start
+
+    def log(self, logs, *args, **kwargs):
+        if "loss" in logs and self._samples:
+            elapsed = time.perf_counter() - self._window_start
+            logs["padding_waste"] = round(1.0 - self._real_tokens / self._padded_tokens, 4)
+            logs["samples_per_second"] = round(self._samples / elapsed, 2)
+            self._real_tokens = self._padded_tokens = self._samples = 0
+            self._window_start = time.perf_counter()
+        super().log(logs, *args, **kwargs)
@@ -0,0 +1,2 @@
+-- AlterTable
+ALTER TABLE "RetrainingJob" ADD COLUMN     "progress" JSONB;
@@ -8,6 +8,9 @@ import {
 
 const router = Router();
 
+// Largest page export-corrections returns
+const MAX_EXPORT_PAGE = 10000;
+
 /**
  * GET /api/retraining/stats
  * Get retraining statistics
@@ -106,7 +109,7 @@ router.get("/jobs/:id", async (req, res) => {
  */
 router.put("/jobs/:id", async (req, res) => {
   try {
-    const { status, trainSamples, valSamples, bestValAccuracy, errorMessage } = req.body;
+    const { status, trainSamples, valSamples, bestValAccuracy, errorMessage, progress } = req.body;
 
     if (!status || !['running', 'completed', 'failed'].includes(status)) {
       return res.status(400).json({ 
@@ -122,6 +125,7 @@ router.put("/jobs/:id", async (req, res) => {
         ...(valSamples && { valSamples }),
         ...(bestValAccuracy && { bestValAccuracy }),
         ...(errorMessage && { errorMessage }),
+        ...(progress && typeof progress === 'object' && { progress }),
         ...(status === 'completed' || status === 'failed' ? { completedAt: new Date() } : {})
       }
     });
@@ -140,9 +144,22 @@ router.put("/jobs/:id", async (req, res) => {
  * GET /api/retraining/export-corrections
  * Export ONLY expense corrections as CSV for Python script
  * Skips income transactions (amountPlus > 0) since they have no categories
+ *
+ * Optional cursor pagination: ?afterId=<transaction id>&limit=<rows>
+ * returns rows with a larger id, oldest first. X-Next-Cursor holds the
+ * last id of a full page (absent on the last page).
  */
 router.get("/export-corrections", async (req, res) => {
   try {
+    const afterId = req.query.afterId ? parseInt(req.query.afterId as string, 10) : undefined;
+    const limit = req.query.limit
+      ? Math.min(Math.max(parseInt(req.query.limit as string, 10), 1), MAX_EXPORT_PAGE)
+      : undefined;
+
+    if ((afterId !== undefined && isNaN(afterId)) || (limit !== undefined && isNaN(limit))) {
+      return res.status(400).json({ error: "afterId and limit must be integers" });
+    }
+
     // Get ONLY expense corrections (amountMinus > 0)
     // Income transactions have no categories/remarks, so skip them
     const corrections = await prisma.transactions.findMany({
@@ -150,26 +167,33 @@ router.get("/export-corrections", async (req, res) => {
         correctedLabel: { not: null },
         usedForTraining: false,
         amountMinus: { gt: 0 },        // Only expenses
-        remarks: { not: null }          // Must have remarks
+        remarks: { not: null },         // Must have remarks
+        ...(afterId !== undefined && { id: { gt: afterId } })
       },
       select: {
+        id: true,
         remarks: true,
         correctedLabel: true
-      }
+      },
+      orderBy: { id: "asc" },
+      ...(limit !== undefined && { take: limit })
     });
 
     // Build CSV
-    const csvRows = ['text,label'];
+    const csvRows = ['id,text,label'];
 
     corrections.forEach(item => {
       if (item.remarks && item.correctedLabel) {
         const text = item.remarks.replace(/"/g, '""');
-        csvRows.push(`"${text}","${item.correctedLabel}"`);
+        csvRows.push(`${item.id},"${text}","${item.correctedLabel}"`);
       }
     });
 
     const csv = csvRows.join('\n');
 
+    if (limit !== undefined && corrections.length === limit) {
+      res.setHeader('X-Next-Cursor', String(corrections[corrections.length - 1].id));
+    }
     res.setHeader('Content-Type', 'text/csv');
     res.setHeader('Content-Disposition', 'attachment; filename=corrections.csv');
     res.send(csv);
@@ -185,22 +209,31 @@ router.get("/export-corrections", async (req, res) => {
 /**
  * POST /api/retraining/mark-used
  * Mark all expense corrections as used (called by Python script after successful training)
+ * With a body of { ids: number[] } only those transactions are marked
  */
 router.post("/mark-used", async (req, res) => {
   try {
+    const ids = req.body?.ids;
+    if (ids !== undefined && (!Array.isArray(ids) || !ids.every(Number.isInteger))) {
+      return res.status(400).json({ error: "ids must be an array of integers" });
+    }
+
     // Mark only expense corrections as used
-    await prisma.transactions.updateMany({
+    const result = await prisma.transactions.updateMany({
       where: { 
         correctedLabel: { not: null },
         usedForTraining: false,
-        amountMinus: { gt: 0 }
+        amountMinus: { gt: 0 },
+        ...(ids !== undefined && { id: { in: ids } })
       },
       data: { usedForTraining: true }
     });
 
     res.json({ 
       success: true,
-      message: "All expense corrections marked as used"
+      message: ids !== undefined
+        ? `${result.count} expense corrections marked as used`
+        : "All expense corrections marked as used"
     });
   } catch (error) {
     console.error(error);
@@ -3,6 +3,10 @@ import { PrismaClient } from "@prisma/client";
 
 const prisma = new PrismaClient();
 const AI_API_URL = process.env.AI_API_URL || "http://localhost:8001";
+// Deadline sent with each prediction; the AI service drops requests it cannot
+// answer in time and replies 429/503 with Retry-After when overloaded
+const AI_REQUEST_TIMEOUT_MS = Number(process.env.AI_REQUEST_TIMEOUT_MS || 10000);
+const AI_MAX_RETRIES = 5;
 
 interface PredictionResponse {
   prediction: number;
@@ -106,12 +110,24 @@ export class AILabelingService {
    * Get prediction from AI API
    */
   private async getPrediction(text: string): Promise<PredictionResponse> {
-    try {
-      const response = await axios.post(`${AI_API_URL}/predict`, { text });
-      return response.data as PredictionResponse;
-    } catch (error) {
-      console.error('Error calling AI API:', error);
-      throw new Error('Failed to get prediction from AI service');
+    for (let attempt = 0; ; attempt++) {
+      try {
+        const response = await axios.post(`${AI_API_URL}/predict`, { text }, {
+          timeout: AI_REQUEST_TIMEOUT_MS,
+          headers: { 'X-Request-Timeout-Ms': String(AI_REQUEST_TIMEOUT_MS) }
+        });
+        return response.data as PredictionResponse;
+      } catch (error) {
+        const status = axios.isAxiosError(error) ? error.response?.status : undefined;
+        if ((status === 429 || status === 503) && attempt < AI_MAX_RETRIES) {
+          // Back off for as long as the overloaded service asks
+          const retryAfter = Number(axios.isAxiosError(error) && error.response?.headers['retry-after']) || 1;
+          await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+          continue;
+        }
+        console.error('Error calling AI API:', error);
+        throw new Error('Failed to get prediction from AI service');
+      }
     }
   }
 